@@ -101,7 +101,7 @@ def prompt_port(default: int) -> int:
         return value
 
 
-def command_start(args: argparse.Namespace) -> None:  # noqa: ARG001 - 接口需要参数
+def command_start(args: argparse.Namespace) -> None:
     ensure_directories()
     if not CONFIG_FILE.exists():
         print("未找到配置文件，请先运行 `python3 manage.py init`。")
@@ -113,7 +113,10 @@ def command_start(args: argparse.Namespace) -> None:  # noqa: ARG001 - 接口需
             return
         PID_FILE.unlink(missing_ok=True)
 
-    command = [sys.executable, "-m", "server.app"]
+    command = [sys.executable, "-m", "server.app", "--workers", str(args.workers)]
+    if args.workers == 1:
+        # 重载后由新进程更新 PID 文件
+        command += ["--pid-file", str(PID_FILE)]
     stdout = None
     try:
         stdout = open(LOG_FILE, "ab", buffering=0)
@@ -131,7 +134,10 @@ def command_start(args: argparse.Namespace) -> None:  # noqa: ARG001 - 接口需
         if stdout is not None and not stdout.closed:
             stdout.close()
     PID_FILE.write_text(str(process.pid))
-    print(f"服务已启动，PID {process.pid}。日志输出：{LOG_FILE}")
+    if args.workers > 1:
+        print(f"服务已启动（{args.workers} 个工作进程），主进程 PID {process.pid}。日志输出：{LOG_FILE}")
+    else:
+        print(f"服务已启动，PID {process.pid}。日志输出：{LOG_FILE}")
 
 
 def command_stop(args: argparse.Namespace) -> None:  # noqa: ARG001
@@ -158,6 +164,27 @@ def command_stop(args: argparse.Namespace) -> None:  # noqa: ARG001
     print("进程未在期望时间内退出，如有需要请手动检查。")
 
 
+def command_reload(args: argparse.Namespace) -> None:  # noqa: ARG001
+    if not PID_FILE.exists():
+        print("未发现运行中的服务。")
+        return
+    pid_text = PID_FILE.read_text().strip()
+    if not pid_text or not process_alive(int(pid_text)):
+        print("服务未运行。")
+        return
+    pid = int(pid_text)
+    print(f"正在重载进程 {pid} ...")
+    os.kill(pid, signal.SIGHUP)
+    # 单进程模式下新进程会接管监听端口并写入自己的 PID；多进程模式下主进程不变。
+    for _ in range(40):
+        time.sleep(0.25)
+        new_pid = PID_FILE.read_text().strip()
+        if new_pid and new_pid != pid_text:
+            print(f"服务已重载，新进程 PID {new_pid}。旧进程将在现有传输完成后退出。")
+            return
+    print("重载信号已发送（多进程模式下主进程 PID 不变），详情请查看日志。")
+
+
 def command_status(args: argparse.Namespace) -> None:  # noqa: ARG001
     if PID_FILE.exists():
         pid_text = PID_FILE.read_text().strip()
@@ -167,10 +194,10 @@ def command_status(args: argparse.Namespace) -> None:  # noqa: ARG001
     print("服务未运行。")
 
 
-def command_run(args: argparse.Namespace) -> None:  # noqa: ARG001
-    from server.app import run_server  # 延迟导入以执行实时配置校验
+def command_run(args: argparse.Namespace) -> None:
+    from server.app import main as server_main  # 延迟导入以执行实时配置校验
 
-    run_server()
+    server_main(["--workers", str(args.workers)])
 
 
 def command_uninstall(args: argparse.Namespace) -> None:  # noqa: ARG001
@@ -235,6 +262,16 @@ def process_alive(pid: int) -> bool:
     return True
 
 
+def positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError("必须是正整数") from exc
+    if number < 1:
+        raise argparse.ArgumentTypeError("必须是正整数")
+    return number
+
+
 def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Secure File Share 管理工具")
     sub = parser.add_subparsers(dest="command", required=True)
@@ -249,15 +286,20 @@ def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     init_cmd.set_defaults(func=command_init)
 
     start_cmd = sub.add_parser("start", help="后台启动服务")
+    start_cmd.add_argument("--workers", type=positive_int, default=1, help="共享端口的工作进程数（默认 1）")
     start_cmd.set_defaults(func=command_start)
 
     stop_cmd = sub.add_parser("stop", help="停止服务")
     stop_cmd.set_defaults(func=command_stop)
 
+    reload_cmd = sub.add_parser("reload", help="不中断连接地重载服务")
+    reload_cmd.set_defaults(func=command_reload)
+
     status_cmd = sub.add_parser("status", help="查看服务状态")
     status_cmd.set_defaults(func=command_status)
 
     run_cmd = sub.add_parser("run", help="以前台方式运行服务")
+    run_cmd.add_argument("--workers", type=positive_int, default=1, help="共享端口的工作进程数（默认 1）")
     run_cmd.set_defaults(func=command_run)
 
     uninstall_cmd = sub.add_parser("uninstall", help="卸载服务（删除配置和数据）")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Compare directory listing with os.listdir + stat against server.listing.
+
+Usage: python scripts/bench_listing.py [--entries N ...] [--path DIR ...] [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.listing import list_page  # noqa: E402
+
+PAGE_SIZE = 200
+
+
+def listdir_stat(target: str) -> int:
+    """The listing before scandir: sorted listdir, then stat and isdir per entry."""
+    entries = []
+    for name in sorted(os.listdir(target)):
+        if name.startswith("."):
+            continue
+        full_path = os.path.join(target, name)
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            continue
+        entries.append({
+            "name": name,
+            "path": full_path,
+            "is_dir": os.path.isdir(full_path),
+            "size": stat.st_size,
+            "modified": int(stat.st_mtime),
+        })
+    return len(entries)
+
+
+def scandir_listing(sort: str, limit: Optional[int] = None) -> Callable[[str], int]:
+    def run(target: str) -> int:
+        return sum(1 for _ in list_page(target, sort=sort, limit=limit).entries)
+
+    return run
+
+
+def best_of(repeat: int, listing: Callable[[str], int], target: str) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        listing(target)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def make_directory(root: str, entries: int) -> str:
+    target = os.path.join(root, str(entries))
+    os.makedirs(target)
+    for i in range(entries):
+        if i % 10 == 0:
+            os.mkdir(os.path.join(target, f"dir{i:07d}"))
+        else:
+            with open(os.path.join(target, f"file{i:07d}.txt"), "wb") as fh:
+                fh.write(b"x" * (i % 4096))
+    return target
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="*", default=[10_000, 100_000])
+    parser.add_argument("--path", nargs="*", default=[], help="existing directories to list as well")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    listings = (
+        ("listdir+stat+isdir", listdir_stat),
+        ("scandir, by name", scandir_listing("name")),
+        ("scandir, by size", scandir_listing("size")),
+        (f"scandir, first {PAGE_SIZE}", scandir_listing("name", PAGE_SIZE)),
+    )
+    scratch = tempfile.mkdtemp(prefix="bench-listing-")
+    try:
+        targets: List[str] = [make_directory(scratch, count) for count in args.entries] + args.path
+        print(f"{'entries':>10}  " + "  ".join(f"{label:>20}" for label, _ in listings))
+        for target in targets:
+            best_of(1, listdir_stat, target)  # warm the dentry and inode caches
+            row = [f"{best_of(args.repeat, listing, target):17.0f} ms" for _, listing in listings]
+            print(f"{len(os.listdir(target)):>10,}  " + "  ".join(row))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Compare the threaded and asyncio server engines.
+
+Both engines serve the handler of this checkout on an ephemeral port in this
+process, configured from config/config.json. Shares and other state go to a
+scratch directory, so data/ is left alone.
+
+Usage: python scripts/bench_server.py [--clients N] [--requests N] [--idle N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import app  # noqa: E402
+from server.app import FileShareRequestHandler, build_context  # noqa: E402
+from server.async_server import AsyncServer  # noqa: E402
+from server.workers import WorkerPoolHTTPServer  # noqa: E402
+
+ROUTE = "/login"
+PROBE_TIMEOUT_SECONDS = 5.0
+
+
+def start_threaded(workers: int, pending: int) -> Tuple[Tuple[str, int], Callable[[], None]]:
+    httpd = WorkerPoolHTTPServer(
+        ("127.0.0.1", 0), FileShareRequestHandler, workers=workers, max_pending=pending
+    )
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def stop() -> None:
+        httpd.shutdown()
+        httpd.server_close()
+
+    return httpd.server_address[:2], stop
+
+
+def start_asyncio(threads: int) -> Tuple[Tuple[str, int], Callable[[], None]]:
+    server = AsyncServer("127.0.0.1", 0, threads)
+    address = server._socket.getsockname()  # pylint: disable=protected-access
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # The daemon thread's loop goes away with the process.
+    return address, lambda: None
+
+
+def throughput(address: Tuple[str, int], clients: int, requests: int) -> Tuple[float, int]:
+    """Requests per second with ``clients`` keep-alive connections, and the failures."""
+    failures = [0]
+    lock = threading.Lock()
+
+    def client() -> None:
+        conn = http.client.HTTPConnection(*address, timeout=30)
+        for _ in range(requests):
+            try:
+                conn.request("GET", ROUTE)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(*address, timeout=30)
+                ok = False
+            if not ok:
+                with lock:
+                    failures[0] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * requests / (time.perf_counter() - start), failures[0]
+
+
+def probe_with_idle(address: Tuple[str, int], idle: int) -> str:
+    """Latency of one request while ``idle`` keep-alive connections sit open."""
+    sockets: List[socket.socket] = []
+    try:
+        for _ in range(idle):
+            sock = socket.create_connection(address, timeout=PROBE_TIMEOUT_SECONDS)
+            sock.sendall(f"GET {ROUTE} HTTP/1.1\r\nHost: bench\r\n\r\n".encode("ascii"))
+            sockets.append(sock)
+        for sock in sockets:
+            try:
+                sock.recv(65536)  # the response; the connection then idles
+            except OSError:
+                pass
+        conn = http.client.HTTPConnection(*address, timeout=PROBE_TIMEOUT_SECONDS)
+        start = time.perf_counter()
+        try:
+            conn.request("GET", ROUTE)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            return f"no answer within {PROBE_TIMEOUT_SECONDS:.0f} s"
+        finally:
+            conn.close()
+        return f"{response.status} in {(time.perf_counter() - start) * 1000:.1f} ms"
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--idle", type=int, default=200, help="idle keep-alive connections")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench-", dir=app.DATA_DIR)
+    app.DATA_DIR = scratch
+    app.DOWNLOADS_ROOT = os.path.join(scratch, "downloads")
+    context = build_context()
+    server_config = context.config.get_server()
+    FileShareRequestHandler.context = context
+    FileShareRequestHandler.keepalive_timeout = server_config.keepalive_timeout
+    FileShareRequestHandler.max_keepalive_requests = server_config.max_keepalive_requests
+    print(
+        f"cpus: {os.cpu_count()}, workers: {server_config.workers}, "
+        f"executor threads: {server_config.executor_threads}"
+    )
+    engines = (
+        ("threaded", lambda: start_threaded(server_config.workers, server_config.pending_connections)),
+        ("asyncio", lambda: start_asyncio(server_config.executor_threads)),
+    )
+    try:
+        for name, start in engines:
+            address, stop = start()
+            rate, failures = throughput(address, args.clients, args.requests)
+            probe = probe_with_idle(address, args.idle)
+            print(
+                f"{name:<9} {rate:8.0f} req/s ({args.clients} clients, {failures} failed); "
+                f"with {args.idle} idle connections: {probe}"
+            )
+            stop()
+    finally:
+        context.share_manager.close()
+        context.bookmark_manager.close()
+        context.usage_service.close()
+        context.search_index.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Compare build_zip with build_zip_parallel on a generated tree.
+
+Run this on the server before raising ``archive.workers`` above its default
+of 1, which builds archives serially.
+
+Usage: python scripts/bench_zip.py [--files N] [--size BYTES] [--workers N] [--path DIR]
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.archive import build_zip, build_zip_parallel  # noqa: E402
+from server.config import BASE_DIR  # noqa: E402
+
+WORDS = [f"word{i}" for i in range(4096)]
+
+
+def make_tree(root: str, files: int, size: int) -> None:
+    """Text files of about ``size`` bytes, 100 per directory; deflates to roughly a third."""
+    rng = random.Random(0)
+    for i in range(files):
+        directory = os.path.join(root, f"d{i // 100:04d}")
+        os.makedirs(directory, exist_ok=True)
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        with open(os.path.join(directory, f"f{i:06d}.txt"), "w", encoding="ascii") as fh:
+            fh.write(" ".join(words)[:size])
+
+
+def timed(label: str, build, archive_path: str) -> float:
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.2f} s  {os.path.getsize(archive_path) / 1e6:8.1f} MB")
+    os.unlink(archive_path)
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--path", help="existing tree to archive instead of a generated one")
+    args = parser.parse_args()
+
+    # Generated below data/, since validate_path_access rejects /tmp.
+    scratch = tempfile.mkdtemp(prefix="bench-", dir=os.path.join(BASE_DIR, "data"))
+    try:
+        source = args.path
+        if source is None:
+            source = os.path.join(scratch, "tree")
+            make_tree(source, args.files, args.size)
+        archive_path = os.path.join(scratch, "out.zip")
+        print(f"tree: {source}, cpus: {os.cpu_count()}, workers: {args.workers}")
+        serial = timed("build_zip", lambda: build_zip(source, archive_path), archive_path)
+        with ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            # Start the workers first, as a long-running server would have.
+            list(pool.map(abs, range(args.workers)))
+            parallel = timed(
+                f"build_zip_parallel x{args.workers}",
+                lambda: build_zip_parallel(source, archive_path, pool, args.workers),
+                archive_path,
+            )
+        print(f"speed-up: {serial / parallel:.2f}x")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
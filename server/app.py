@@ -1,25 +1,76 @@
 from __future__ import annotations
 
+import argparse
+import hashlib
 import json
 import mimetypes
 import os
+import secrets
+import select
 import shutil
+import signal
+import sys
+import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from http import HTTPStatus
 from http.cookies import CookieError, SimpleCookie
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from typing import Any, Dict, List, Optional
+from http.server import BaseHTTPRequestHandler
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
 from urllib.parse import parse_qs, unquote, urlparse
 
-from .bookmarks import BookmarkManager
+from .assets import Asset, AssetCache, accepts_gzip
+from .archive import ARCHIVE_FORMAT_ZIP, ArchiveBuildError, ArchivePreparing, stream_archive
+from .bookmarks import BookmarkManager, migrate_json_bookmarks
+from .compression import DEFAULT_COMPRESSION
 from .config import BASE_DIR, ConfigManager
+from .download_session import DownloadSessionManager
 from .downloader import DownloadError, download_from_url, fetch_metadata
+from .dirwatch import DirectoryWatcher
+from .listing import ListingCache, list_page
+from .search import SearchIndex
 from .security import verify_password
 from .session import SessionManager
-from .share import ShareManager
+from .storage import DEFAULT_FLUSH_INTERVAL_SECONDS
+from .stores import (
+    STORAGE_SCHEMA,
+    BookmarkStore,
+    JSONBookmarkStore,
+    JSONShareStore,
+    ShareStore,
+    SQLiteBookmarkStore,
+    SQLiteShareStore,
+)
+from .shared_state import (
+    SharedDownloadSessionManager,
+    SharedRateLimiter,
+    SharedSessionManager,
+    SharedStateDB,
+)
+from .share import ARCHIVE_MODE_CACHED, ShareManager, migrate_json_shares
 from .rate_limiter import RateLimiter
+from .reload import export_state, import_state, read_inherited_state, signal_ready, start_successor
+from .supervisor import Supervisor, watch_parent
+from .usage import UsageService
+from .transfer import (
+    RangeNotSatisfiable,
+    StreamWriter,
+    file_etag,
+    http_date,
+    if_none_match_matches,
+    if_range_matches,
+    multipart_layout,
+    parse_range_header,
+    send_file,
+)
+from .workers import (
+    BUSY_MESSAGE,
+    BUSY_RETRY_AFTER_SECONDS,
+    AdmissionControl,
+    WorkerPoolHTTPServer,
+    classify_route,
+)
 from .path_validator import (
     validate_path_access,
     validate_download_url,
@@ -34,6 +85,14 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 DOWNLOADS_ROOT = os.path.join(DATA_DIR, "downloads")
 MAX_DOWNLOAD_SIZE_BYTES = 2 * 1024 * 1024 * 1024  # 2 GiB
 MIN_FREE_SPACE_BUFFER_BYTES = 512 * 1024 * 1024  # 512 MiB
+ARCHIVE_RETRY_AFTER_SECONDS = 5
+# Unread request bodies up to this size are discarded to keep the connection
+# alive; larger ones close it instead.
+MAX_DRAIN_BYTES = 1024 * 1024  # 1 MiB
+# A persistent connection idle for this long gives up its worker thread when
+# other connections are queued; busy clients send their next request sooner.
+IDLE_YIELD_SECONDS = 1.0
+IDLE_POLL_SECONDS = 0.1
 
 
 @dataclass
@@ -45,18 +104,137 @@ class ServerContext:
     rate_limiter: RateLimiter
     session_timeout_minutes: int
     downloads_root: str
+    static_assets: AssetCache
+    template_assets: AssetCache
     enable_https: bool = False  # Set to True if behind HTTPS proxy
+    admission: AdmissionControl = field(default_factory=AdmissionControl)
+    download_sessions: Optional[DownloadSessionManager] = None
+    listing_cache: Optional[ListingCache] = None
+    usage_service: Optional[UsageService] = None
+    search_index: Optional[SearchIndex] = None
 
 
 class FileShareRequestHandler(BaseHTTPRequestHandler):
     server_version = "SecureFileShare/1.0"
+    protocol_version = "HTTP/1.1"
     context: ServerContext
+    # Socket timeout while a request is being read or its response written.
+    timeout = 60
+    # How long an idle persistent connection waits for its next request.
+    keepalive_timeout = 15
+    max_keepalive_requests = 100
+    # Set while the process drains before a reload: finish the request in
+    # progress, then close so the client reconnects to the new process.
+    draining = False
+    _requests_served = 0
+    _body: Optional[bytes] = None
+
+    def handle(self) -> None:
+        self.close_connection = True
+        self._requests_served = 0
+        while self._wait_for_request():
+            self.handle_one_request()
+            self._requests_served += 1
+            if self.close_connection or self.draining:
+                break
+
+    def _wait_for_request(self) -> bool:
+        """
+        Wait up to ``keepalive_timeout`` for the next request to start arriving.
+
+        The connection holds a worker thread meanwhile, so a persistent
+        connection idle for :data:`IDLE_YIELD_SECONDS` gives up as soon as
+        other connections are queued for one.
+        """
+        start = time.monotonic()
+        deadline = start + self.keepalive_timeout
+        connections_waiting = getattr(self.server, "connections_waiting", None)
+        try:
+            # A pipelined request may already be buffered.
+            self.connection.settimeout(0)
+            ready = bool(self.rfile.peek(1))
+            while not ready:
+                now = time.monotonic()
+                remaining = deadline - now
+                if remaining <= 0:
+                    break
+                if (
+                    self._requests_served
+                    and now - start >= IDLE_YIELD_SECONDS
+                    and connections_waiting is not None
+                    and connections_waiting()
+                ):
+                    break
+                if select.select([self.connection], [], [], min(remaining, IDLE_POLL_SECONDS))[0]:
+                    self.connection.settimeout(self.timeout)
+                    ready = bool(self.rfile.peek(1))
+                    break  # a request, or the client closed
+        except (TimeoutError, ConnectionError):
+            ready = False
+        self.connection.settimeout(self.timeout)
+        return ready
+
+    def end_headers(self) -> None:
+        if not self.close_connection and (
+            self.draining or self._requests_served + 1 >= self.max_keepalive_requests
+        ):
+            # Last request served on this connection: tell the client.
+            self.send_header("Connection", "close")
+        super().end_headers()
 
     def log_message(self, format: str, *args: Any) -> None:  # noqa: A003
         # Silence default stdout logging; production deployments should plug into logging.
         return
 
     def do_GET(self) -> None:  # noqa: N802
+        self._admit_request(self._handle_get)
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._admit_request(self._handle_post)
+
+    def do_DELETE(self) -> None:  # noqa: N802
+        self._admit_request(self._handle_delete)
+
+    def _admit_request(self, handler: Callable[[], None]) -> None:
+        """Run ``handler`` within its route's concurrency budget, or answer 503."""
+        self._body = None
+        try:
+            kind = classify_route(self.command, urlparse(self.path).path)
+            if not self.context.admission.try_acquire(kind):
+                self._send_json(
+                    HTTPStatus.SERVICE_UNAVAILABLE,
+                    {"error": BUSY_MESSAGE},
+                    headers={"Retry-After": str(BUSY_RETRY_AFTER_SECONDS)},
+                )
+                return
+            try:
+                handler()
+            finally:
+                self.context.admission.release(kind)
+        finally:
+            self._discard_request_body()
+
+    def _discard_request_body(self) -> None:
+        """Consume a body the handler did not read so the next request parses cleanly."""
+        if self.close_connection or self._body is not None:
+            return
+        if self.headers.get("Transfer-Encoding"):
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            self.close_connection = True
+            return
+        if length > MAX_DRAIN_BYTES:
+            self.close_connection = True
+        elif length > 0:
+            try:
+                self._read_body()
+            except OSError:
+                self.close_connection = True
+
+    def _handle_get(self) -> None:
         try:
             parsed = urlparse(self.path)
             route = parsed.path
@@ -85,16 +263,34 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
             if route == "/api/fs":
                 self._require_auth()
                 query = parse_qs(parsed.query)
-                target = query.get("path", ["/"])[0]
-                show_hidden = self._is_truthy(query.get("show_hidden", ["0"])[0])
-                listing = self._list_directory(target, show_hidden=show_hidden)
-                self._send_json(HTTPStatus.OK, listing)
+                listing, entries = self._list_directory(query)
+                if query.get("format", [""])[0] == "ndjson":
+                    self._send_ndjson(listing, entries)
+                else:
+                    self._send_listing({**listing, "entries": list(entries)})
+                return
+            if route == "/api/search":
+                self._require_auth()
+                self._send_json(HTTPStatus.OK, self._search(parse_qs(parsed.query)))
+                return
+            if route == "/api/fs/usage":
+                self._require_auth()
+                self._send_json(HTTPStatus.OK, self._directory_usage(parse_qs(parsed.query)))
                 return
             if route == "/api/shares":
                 self._require_auth()
                 shares = self.context.share_manager.list_shares()
                 self._send_json(HTTPStatus.OK, {"shares": shares})
                 return
+            if route.startswith("/api/shares/") and route.endswith("/status"):
+                self._require_auth()
+                token = route[len("/api/shares/"):-len("/status")]
+                if self.context.share_manager.get_share(token) is None:
+                    self._send_json(HTTPStatus.NOT_FOUND, {"error": "Share not found"})
+                    return
+                status = self.context.share_manager.get_archive_status(token)
+                self._send_json(HTTPStatus.OK, {"token": token, "archive_status": status})
+                return
             if route.startswith("/d/"):
                 token = route.split("/", 2)[2]
                 self._handle_download(token)
@@ -102,13 +298,19 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
             self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
         except AuthRequired:
             self._redirect("/login")
+        except ValueError as exc:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(exc)})
+        except FileNotFoundError as exc:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": str(exc)})
+        except NotADirectoryError as exc:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(exc)})
         except Exception as exc:  # pylint: disable=broad-except
             self._send_json(
                 HTTPStatus.INTERNAL_SERVER_ERROR,
                 {"error": "Internal server error"},
             )
 
-    def do_POST(self) -> None:  # noqa: N802
+    def _handle_post(self) -> None:
         try:
             parsed = urlparse(self.path)
             route = parsed.path
@@ -131,6 +333,7 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
                     self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Path is required"})
                     return
                 bookmark = self.context.bookmark_manager.add_bookmark(label, path)
+                self.context.search_index.request_refresh()
                 self._send_json(HTTPStatus.CREATED, bookmark.to_dict())
                 return
             if route == "/api/shares":
@@ -160,7 +363,7 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
                 {"error": "Internal server error"},
             )
 
-    def do_DELETE(self) -> None:  # noqa: N802
+    def _handle_delete(self) -> None:
         try:
             parsed = urlparse(self.path)
             route = parsed.path
@@ -168,6 +371,7 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
                 self._require_auth()
                 identifier = route.split("/", 3)[3]
                 self.context.bookmark_manager.delete_bookmark(identifier)
+                self.context.search_index.request_refresh()
                 self._send_json(HTTPStatus.NO_CONTENT, {})
                 return
             if route.startswith("/api/shares/"):
@@ -201,14 +405,11 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
             self._send_json(HTTPStatus.FORBIDDEN, {"error": "Forbidden"})
             return
 
-        if not os.path.isfile(file_path):
+        asset = self.context.static_assets.get(safe_path)
+        if asset is None:
             self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
             return
-        mime, _ = mimetypes.guess_type(file_path)
-        mime = mime or "application/octet-stream"
-        with open(file_path, "rb") as fh:
-            content = fh.read()
-        self._send_response(HTTPStatus.OK, mime, content, cache_control="public, max-age=3600")
+        self._send_asset(asset, cache_control="public, max-age=3600")
 
     def _handle_root(self) -> None:
         try:
@@ -225,17 +426,50 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
         self._serve_template("login.html")
 
     def _serve_template(self, filename: str) -> None:
-        file_path = os.path.join(TEMPLATE_DIR, filename)
-        if not os.path.isfile(file_path):
+        asset = self.context.template_assets.get(filename)
+        if asset is None:
             self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
             return
-        with open(file_path, "rb") as fh:
-            content = fh.read()
-        mime, _ = mimetypes.guess_type(file_path)
-        mime = mime or "text/html; charset=utf-8"
-        self._send_response(HTTPStatus.OK, mime, content)
+        # Templates are revalidated on every load so UI updates show up at once.
+        self._send_asset(asset, cache_control="no-cache")
 
-    def _list_directory(self, path: str, show_hidden: bool = False) -> Dict[str, Any]:
+    def _send_asset(self, asset: Asset, cache_control: str) -> None:
+        content, etag, gzipped = asset.variant(accepts_gzip(self.headers.get("Accept-Encoding")))
+        headers = {"ETag": etag}
+        if asset.gzip_content is not None:
+            headers["Vary"] = "Accept-Encoding"
+        if asset.matches(self.headers.get("If-None-Match")):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._apply_common_headers()
+            self.send_header("Cache-Control", cache_control)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+        self._send_response(HTTPStatus.OK, asset.mime, content, cache_control=cache_control, headers=headers)
+
+    def _list_directory(self, query: Dict[str, List[str]]) -> Tuple[Dict[str, Any], Iterator[Dict[str, Any]]]:
+        """
+        List the directory named by the ``/api/fs`` query string.
+
+        Supported parameters: ``path``, ``show_hidden``, ``sort`` (name, size
+        or modified), ``order`` (asc or desc), ``prefix``, ``limit`` and
+        ``cursor``; see :func:`list_page`.
+
+        Returns:
+            The response fields other than ``entries``, and the entries.
+        """
+        path = query.get("path", ["/"])[0]
+        show_hidden = self._is_truthy(query.get("show_hidden", ["0"])[0])
+        sort = query.get("sort", ["name"])[0]
+        descending = query.get("order", ["asc"])[0] == "desc"
+        limit_raw = query.get("limit", [""])[0]
+        try:
+            limit = int(limit_raw) if limit_raw else None
+        except ValueError as exc:
+            raise ValueError("limit must be an integer") from exc
         # Validate path access first
         try:
             target = validate_path_access(unquote(path), allow_custom=True)
@@ -246,60 +480,257 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
             raise FileNotFoundError("Path does not exist")
         if not os.path.isdir(target):
             raise NotADirectoryError("Requested path is not a directory")
-        entries: List[Dict[str, Any]] = []
         try:
-            for name in sorted(os.listdir(target)):
-                if not show_hidden and name.startswith("."):
-                    continue
-                full_path = os.path.join(target, name)
-                try:
-                    stat = os.stat(full_path)
-                except OSError:
-                    continue
-                entries.append({
-                    "name": name,
-                    "path": full_path,
-                    "is_dir": os.path.isdir(full_path),
-                    "size": stat.st_size,
-                    "modified": int(stat.st_mtime),
-                })
+            page = list_page(
+                target,
+                show_hidden=show_hidden,
+                sort=sort,
+                descending=descending,
+                prefix=query.get("prefix", [""])[0],
+                limit=limit,
+                cursor=query.get("cursor", [""])[0] or None,
+                cache=self.context.listing_cache,
+            )
         except PermissionError as exc:
             raise ValueError("Permission denied") from exc
         parent = os.path.abspath(os.path.join(target, os.pardir)) if target != os.path.abspath(os.sep) else None
-        return {
+        listing = {
             "path": target,
             "parent": parent,
-            "entries": entries,
             "show_hidden": show_hidden,
+            "sort": sort,
+            "order": "desc" if descending else "asc",
+            "total": page.total,
+            "next_cursor": page.next_cursor,
         }
+        return listing, page.entries
+
+    def _search(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        Search file names below the bookmarked directories.
+
+        Supported parameters: ``q`` (a substring, or a glob such as ``*.mp4``),
+        ``limit`` and ``show_hidden``; see :meth:`SearchIndex.search`.
+        """
+        text = query.get("q", [""])[0]
+        limit_raw = query.get("limit", [""])[0]
+        try:
+            limit = int(limit_raw) if limit_raw else None
+        except ValueError as exc:
+            raise ValueError("limit must be an integer") from exc
+        found = self.context.search_index.search(
+            text,
+            limit=limit,
+            show_hidden=self._is_truthy(query.get("show_hidden", ["0"])[0]),
+        )
+        return {
+            "query": text,
+            "results": found.results,
+            "truncated": found.truncated,
+            "indexing": found.indexing,
+        }
+
+    def _directory_usage(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        Recursive file count and size of the directory named by ``path``.
+
+        A large tree may not be walked within ``wait`` seconds; the totals so
+        far are returned with ``complete`` False and the client asks again to
+        follow the walk (see :meth:`UsageService.usage`).
+        """
+        try:
+            target = validate_path_access(unquote(query.get("path", ["/"])[0]), allow_custom=True)
+        except PathValidationError as exc:
+            raise ValueError(str(exc)) from exc
+        wait_raw = query.get("wait", [""])[0]
+        try:
+            wait = float(wait_raw) if wait_raw else None
+        except ValueError as exc:
+            raise ValueError("wait must be a number") from exc
+        if not os.path.exists(target):
+            raise FileNotFoundError("Path does not exist")
+        return self.context.usage_service.usage(target, wait=wait).to_dict()
+
+    def _send_listing(self, listing: Dict[str, Any]) -> None:
+        """Send a listing with an ETag; an unchanged one is answered with 304."""
+        content = json.dumps(listing).encode("utf-8")
+        etag = f'"{hashlib.sha256(content).hexdigest()[:20]}"'
+        if if_none_match_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._apply_common_headers()
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self._send_response(
+            HTTPStatus.OK, "application/json", content, cache_control="no-cache", headers={"ETag": etag}
+        )
+
+    def _send_ndjson(self, header: Dict[str, Any], rows: Iterator[Dict[str, Any]]) -> None:
+        """Stream ``header`` and then each of ``rows`` as one JSON line apiece."""
+        chunked = self.request_version == "HTTP/1.1"
+        self.send_response(HTTPStatus.OK)
+        self._apply_common_headers()
+        self.send_header("Content-Type", "application/x-ndjson")
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-store")
+        if not chunked:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        writer = StreamWriter(self.wfile, chunked=chunked)
+        try:
+            writer.write(json.dumps(header).encode("utf-8") + b"\n")
+            for row in rows:
+                writer.write(json.dumps(row).encode("utf-8") + b"\n")
+            writer.close()
+        except OSError:
+            self.close_connection = True
 
     def _handle_download(self, token: str) -> None:
         client_ip = self._get_client_ip()
-        result = self.context.share_manager.validate_and_register_download(token, client_ip)
+        try:
+            result = self.context.share_manager.validate_and_register_download(
+                token, client_ip, range_header=self.headers.get("Range")
+            )
+        except ArchivePreparing as exc:
+            self._send_json(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"error": "Archive is being prepared", "archive_status": exc.status.to_dict()},
+                headers={"Retry-After": str(ARCHIVE_RETRY_AFTER_SECONDS)},
+            )
+            return
+        except ArchiveBuildError:
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Archive could not be prepared"})
+            return
         if not result:
             self._send_json(HTTPStatus.NOT_FOUND, {"error": "Link is invalid or expired"})
             return
         file_path = result["path"]
+        if result.get("stream"):
+            self._send_stream_archive(
+                file_path,
+                result["filename"],
+                result["mime"],
+                result["archive_format"],
+                result["compression"],
+            )
+            return
         if not os.path.exists(file_path) or not os.path.isfile(file_path):
             self._send_json(HTTPStatus.GONE, {"error": "File no longer available"})
             return
         filename = result.get("filename") or os.path.basename(file_path)
         mime_hint = result.get("mime") or None
         mime = mime_hint or mimetypes.guess_type(file_path)[0] or "application/octet-stream"
-        file_size = os.path.getsize(file_path)
+        with open(file_path, "rb") as fh:
+            self._send_file(fh, mime, filename)
+
+    def _send_stream_archive(
+        self,
+        source_path: str,
+        filename: str,
+        mime: str,
+        archive_format: str,
+        compression: str,
+    ) -> None:
+        # Length is unknown up front: use chunked encoding for HTTP/1.1 clients
+        # and a close-delimited body otherwise.
+        chunked = self.request_version == "HTTP/1.1"
         self.send_response(HTTPStatus.OK)
         self._apply_common_headers()
         self.send_header("Content-Type", mime)
-        self.send_header("Content-Length", str(file_size))
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Accept-Ranges", "none")
         self.send_header("Content-Disposition", f"attachment; filename=\"{filename}\"")
         self.send_header("Cache-Control", "no-store")
+        if not chunked:
+            self.send_header("Connection", "close")
         self.end_headers()
-        with open(file_path, "rb") as fh:
-            while True:
-                chunk = fh.read(64 * 1024)
-                if not chunk:
-                    break
-                self.wfile.write(chunk)
+        writer = StreamWriter(self.wfile, chunked=chunked)
+        try:
+            stream_archive(source_path, writer, archive_format, compression)
+            writer.close()
+        except OSError:
+            # Client went away or the tree changed mid-stream; the missing
+            # terminating chunk tells the client the body is truncated.
+            self.close_connection = True
+
+    def _send_file(self, fh: BinaryIO, mime: str, filename: str) -> None:
+        stat = os.fstat(fh.fileno())
+        file_size = stat.st_size
+        etag = file_etag(stat)
+        last_modified = http_date(stat.st_mtime)
+        try:
+            ranges = parse_range_header(self.headers.get("Range"), file_size)
+        except RangeNotSatisfiable:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self._apply_common_headers()
+            self.send_header("Content-Range", f"bytes */{file_size}")
+            self.send_header("Content-Length", "0")
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            return
+        if ranges is not None and not if_range_matches(self.headers.get("If-Range"), etag, last_modified):
+            ranges = None
+
+        if ranges is None:
+            status = HTTPStatus.OK
+            content_type = mime
+            content_length = file_size
+        elif len(ranges) == 1:
+            status = HTTPStatus.PARTIAL_CONTENT
+            content_type = mime
+            start, end = ranges[0]
+            content_length = end - start + 1
+        else:
+            status = HTTPStatus.PARTIAL_CONTENT
+            boundary = secrets.token_hex(16)
+            content_type = f"multipart/byteranges; boundary={boundary}"
+            parts, trailer, content_length = multipart_layout(ranges, file_size, mime, boundary)
+
+        self.send_response(status)
+        self._apply_common_headers()
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(content_length))
+        if ranges is not None and len(ranges) == 1:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Content-Disposition", f"attachment; filename=\"{filename}\"")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+
+        if ranges is None:
+            sent = self._write_file_range(fh, 0, file_size)
+        elif len(ranges) == 1:
+            sent = self._write_file_range(fh, start, content_length)
+        else:
+            sent = 0
+            try:
+                for header, part_start, part_end in parts:
+                    self.wfile.write(header)
+                    sent += len(header)
+                    part_length = part_end - part_start + 1
+                    part_sent = self._write_file_range(fh, part_start, part_length)
+                    sent += part_sent
+                    if part_sent < part_length:
+                        break
+                    self.wfile.write(b"\r\n")
+                    sent += 2
+                else:
+                    self.wfile.write(trailer)
+                    sent += len(trailer)
+            except ConnectionError:
+                pass
+        if sent < content_length:
+            # Client disconnected or the file shrank mid-transfer.
+            self.close_connection = True
+
+    def _write_file_range(self, fh: BinaryIO, offset: int, count: int) -> int:
+        """Send ``count`` bytes of ``fh`` from ``offset``; returns bytes delivered."""
+        return send_file(self.connection, self.wfile, fh, offset, count)
 
     def _handle_login(self) -> None:
         client_ip = self._get_client_ip()
@@ -380,7 +811,18 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
             allowed_ips = [str(ip).strip() for ip in allowed_ips if str(ip).strip()]
         else:
             allowed_ips = []
-        record = self.context.share_manager.create_share(path, max_downloads, expire_at, allowed_ips)
+        archive_mode = str(payload.get("archive_mode") or ARCHIVE_MODE_CACHED).strip().lower()
+        compression = str(payload.get("compression") or DEFAULT_COMPRESSION)
+        archive_format = str(payload.get("archive_format") or ARCHIVE_FORMAT_ZIP).strip().lower()
+        record = self.context.share_manager.create_share(
+            path,
+            max_downloads,
+            expire_at,
+            allowed_ips,
+            archive_mode=archive_mode,
+            compression=compression,
+            archive_format=archive_format,
+        )
         return {
             "token": record.token,
             "share_url": f"/d/{record.token}",
@@ -388,6 +830,10 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
             "expire_at": int(record.expire_at) if record.expire_at else None,
             "allowed_ips": record.allowed_ips,
             "is_directory": record.is_directory,
+            "archive_mode": record.archive_mode,
+            "compression": record.compression,
+            "archive_format": record.archive_format,
+            "archive_status": self.context.share_manager.get_archive_status(record.token),
         }
 
 
@@ -477,11 +923,17 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
             return real_ip.strip()
         return self.client_address[0]
 
+    def _read_body(self) -> bytes:
+        """Read the request body once; later calls return the same bytes."""
+        if self._body is None:
+            length = int(self.headers.get("Content-Length", "0"))
+            self._body = self.rfile.read(length) if length > 0 else b""
+        return self._body
+
     def _read_json(self) -> Dict[str, Any]:
-        length = int(self.headers.get("Content-Length", "0"))
-        if length <= 0:
+        body = self._read_body()
+        if not body:
             return {}
-        body = self.rfile.read(length)
         try:
             return json.loads(body)
         except json.JSONDecodeError as exc:
@@ -493,9 +945,10 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
         payload: Dict[str, Any],
         *,
         cookies: Optional[List[str]] = None,
+        headers: Optional[Dict[str, str]] = None,
     ) -> None:
         content = json.dumps(payload).encode("utf-8")
-        self._send_response(status, "application/json", content, cookies=cookies)
+        self._send_response(status, "application/json", content, cookies=cookies, headers=headers)
 
     def _send_response(
         self,
@@ -504,17 +957,25 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
         content: bytes,
         cache_control: str = "no-store",
         cookies: Optional[List[str]] = None,
+        headers: Optional[Dict[str, str]] = None,
     ) -> None:
+        # 204 responses carry neither a body nor a Content-Length.
+        has_body = status != HTTPStatus.NO_CONTENT
         self.send_response(status)
         self._apply_common_headers()
-        self.send_header("Content-Type", content_type)
-        self.send_header("Content-Length", str(len(content)))
+        if has_body:
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
         self.send_header("Cache-Control", cache_control)
         if cookies:
             for value in cookies:
                 self.send_header("Set-Cookie", value)
+        if headers:
+            for name, value in headers.items():
+                self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(content)
+        if has_body:
+            self.wfile.write(content)
 
     def _apply_common_headers(self) -> None:
         self.send_header("Server", self.server_version)
@@ -552,6 +1013,7 @@ class FileShareRequestHandler(BaseHTTPRequestHandler):
         self.send_response(HTTPStatus.SEE_OTHER)
         self._apply_common_headers()
         self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
 
@@ -559,42 +1021,248 @@ class AuthRequired(Exception):
     pass
 
 
-def build_context() -> ServerContext:
+def build_context(process_count: int = 1, write_through: bool = False) -> ServerContext:
+    """
+    Create the managers shared by all request handlers of this process.
+
+    Args:
+        process_count: Number of worker processes serving the port. Above one,
+            sessions, login rate limits and download sessions live in
+            ``data/runtime.db`` so every worker sees the same state, the
+            archive process pool is split between the workers, and share and
+            bookmark changes are written to disk immediately.
+        write_through: Write share and bookmark changes immediately even in a
+            single process, e.g. while the process it replaced still drains.
+            Only matters for the ``json`` storage backend.
+    """
     config = ConfigManager()
     server_config = config.get_server()
-    share_manager = ShareManager(os.path.join(DATA_DIR, "shares.json"))
-    bookmark_manager = BookmarkManager(os.path.join(DATA_DIR, "bookmarks.json"))
+    archive_workers = config.get_archive().workers
+    # A single process owns the JSON files and may batch its writes.
+    flush_interval = 0.0 if process_count > 1 or write_through else DEFAULT_FLUSH_INTERVAL_SECONDS
+    if process_count > 1:
+        state_db = SharedStateDB(os.path.join(DATA_DIR, "runtime.db"))
+        session_manager = SharedSessionManager(state_db, max_sessions_per_user=3)
+        rate_limiter = SharedRateLimiter(state_db, max_attempts=5, window_seconds=300, lockout_seconds=300)
+        download_sessions = SharedDownloadSessionManager(state_db)
+        archive_workers = max(1, archive_workers // process_count)
+    else:
+        session_manager = SessionManager(max_sessions_per_user=3)
+        rate_limiter = RateLimiter(max_attempts=5, window_seconds=300, lockout_seconds=300)
+        download_sessions = DownloadSessionManager()
+    shares_path = os.path.join(DATA_DIR, "shares.json")
+    bookmarks_path = os.path.join(DATA_DIR, "bookmarks.json")
+    if config.get_storage().backend == "sqlite":
+        storage_db = SharedStateDB(os.path.join(DATA_DIR, "storage.db"), schema=STORAGE_SCHEMA)
+        share_store: ShareStore = SQLiteShareStore(storage_db)
+        bookmark_store: BookmarkStore = SQLiteBookmarkStore(storage_db)
+        migrate_json_shares(share_store, shares_path)
+        migrate_json_bookmarks(bookmark_store, bookmarks_path)
+    else:
+        share_store = JSONShareStore(shares_path)
+        bookmark_store = JSONBookmarkStore(bookmarks_path, flush_interval=flush_interval)
+    share_manager = ShareManager(
+        share_store,
+        os.path.join(DATA_DIR, "archives"),
+        archive_workers=archive_workers,
+        download_sessions=download_sessions,
+    )
+    bookmark_manager = BookmarkManager(bookmark_store)
     os.makedirs(DOWNLOADS_ROOT, exist_ok=True)
+    static_assets = AssetCache(STATIC_DIR)
+    static_assets.preload()
+    template_assets = AssetCache(TEMPLATE_DIR, default_mime="text/html; charset=utf-8")
+    template_assets.preload()
 
     # Check if HTTPS is enabled via environment variable
     enable_https = os.environ.get("ENABLE_HTTPS", "false").lower() in ["true", "1", "yes"]
 
     return ServerContext(
         config=config,
-        session_manager=SessionManager(max_sessions_per_user=3),
+        session_manager=session_manager,
         share_manager=share_manager,
         bookmark_manager=bookmark_manager,
-        rate_limiter=RateLimiter(max_attempts=5, window_seconds=300, lockout_seconds=300),
+        rate_limiter=rate_limiter,
         session_timeout_minutes=server_config.session_timeout_minutes,
         downloads_root=DOWNLOADS_ROOT,
+        static_assets=static_assets,
+        template_assets=template_assets,
         enable_https=enable_https,
+        admission=AdmissionControl(
+            heavy_requests=server_config.heavy_requests,
+            light_requests=server_config.light_requests,
+        ),
+        download_sessions=download_sessions,
+        listing_cache=ListingCache(watcher=DirectoryWatcher.create()),
+        usage_service=UsageService(),
+        search_index=SearchIndex(
+            os.path.join(DATA_DIR, "search_index.json.gz"),
+            roots=lambda: [bookmark["path"] for bookmark in bookmark_manager.list_bookmarks()],
+        ),
     )
 
 
-def run_server() -> None:
-    context = build_context()
+def run_server(
+    process_count: int = 1,
+    listen_fd: Optional[int] = None,
+    state_fd: Optional[int] = None,
+    ready_fd: Optional[int] = None,
+    pid_file: Optional[str] = None,
+) -> None:
+    """
+    Serve requests in this process until interrupted or reloaded.
+
+    On ``SIGHUP`` the process stops accepting and, when it serves the port
+    alone, hands the listening socket and its sessions to a new process (see
+    :mod:`server.reload`); pre-forked workers have already been replaced by
+    the supervisor. It then finishes the active connections and returns.
+
+    Args:
+        process_count: Number of worker processes sharing the port; above one
+            the listening socket is bound with ``SO_REUSEPORT``.
+        listen_fd: Inherited listening socket to serve instead of binding.
+        state_fd: Pipe carrying the runtime state of the previous process.
+        ready_fd: Pipe to report on once connections are being accepted.
+        pid_file: File to record this process's PID in once it is serving.
+    """
+    # Until the process we took over from has drained, both write the JSON files.
+    context = build_context(process_count, write_through=listen_fd is not None)
+    if state_fd is not None:
+        import_state(context, read_inherited_state(state_fd))
+    storages = (context.share_manager, context.bookmark_manager)
+
+    def set_flush_interval(seconds: float) -> None:
+        for storage in storages:
+            storage.set_flush_interval(seconds)
+
+    if listen_fd is not None and process_count == 1:
+        # Our parent is the previous server; batch writes again once it exits.
+        watch_parent(lambda: set_flush_interval(DEFAULT_FLUSH_INTERVAL_SECONDS))
+    # Exit through the ``finally`` blocks below so pending writes are flushed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     server_config = context.config.get_server()
+    reuse_port = process_count > 1
     FileShareRequestHandler.context = context
+    FileShareRequestHandler.timeout = server_config.request_timeout
+    FileShareRequestHandler.keepalive_timeout = server_config.keepalive_timeout
+    FileShareRequestHandler.max_keepalive_requests = server_config.max_keepalive_requests
+
+    def hand_over(fd: int) -> bool:
+        if process_count > 1:
+            return True
+        set_flush_interval(0)
+        successor = start_successor(
+            fd, export_state(context), ["--pid-file", pid_file] if pid_file else None
+        )
+        if successor is None:
+            set_flush_interval(DEFAULT_FLUSH_INTERVAL_SECONDS)
+            print("Reload failed: the new process did not start; still serving", flush=True)
+            return False
+        print(f"Handed over to process {successor.pid}; draining connections", flush=True)
+        return True
+
+    def announce_ready() -> None:
+        if pid_file:
+            with open(pid_file, "w", encoding="utf-8") as fh:
+                fh.write(str(os.getpid()))
+        if ready_fd is not None:
+            signal_ready(ready_fd)
+
+    if server_config.engine == "asyncio":
+        from .async_server import AsyncServer  # imports this module
+
+        server = AsyncServer(
+            server_config.host,
+            server_config.port,
+            server_config.executor_threads,
+            reuse_port=reuse_port,
+            listen_fd=listen_fd,
+        )
+        print(f"Serving on http://{server_config.host}:{server_config.port} (asyncio)", flush=True)
+        announce_ready()
+        try:
+            server.serve_forever(hand_over, server_config.drain_timeout)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            context.share_manager.close()
+            context.bookmark_manager.close()
+            context.usage_service.close()
+            context.search_index.close()
+        return
     address = (server_config.host, server_config.port)
-    httpd = ThreadingHTTPServer(address, FileShareRequestHandler)
-    print(f"Serving on http://{server_config.host}:{server_config.port}")
+    httpd = WorkerPoolHTTPServer(
+        address,
+        FileShareRequestHandler,
+        workers=server_config.workers,
+        max_pending=server_config.pending_connections,
+        reuse_port=reuse_port,
+        listen_fd=listen_fd,
+    )
+
+    def request_reload(signum: int, frame: Any) -> None:  # noqa: ARG001
+        # serve_forever() runs on this thread; shutdown() waits for it to return.
+        threading.Thread(target=httpd.shutdown, name="reload", daemon=True).start()
+
+    signal.signal(signal.SIGHUP, request_reload)
+    print(f"Serving on http://{server_config.host}:{server_config.port}", flush=True)
+    announce_ready()
     try:
-        httpd.serve_forever()
+        while True:
+            httpd.serve_forever()
+            if hand_over(httpd.fileno()):
+                break
+        FileShareRequestHandler.draining = True
+        if reuse_port:
+            # This worker has its own queue of accepted connections; serve
+            # them rather than resetting them on close.
+            httpd.accept_backlog()
+        httpd.socket.close()
+        if not httpd.wait_idle(server_config.drain_timeout):
+            print("Drain timeout reached; closing remaining connections", flush=True)
     except KeyboardInterrupt:
         pass
     finally:
         httpd.server_close()
+        context.share_manager.close()
+        context.bookmark_manager.close()
+        context.usage_service.close()
+        context.search_index.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Secure File Share server")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes sharing the port (default: 1)",
+    )
+    parser.add_argument("--pid-file", help="record the serving process's PID in this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    # Set when started by a reloading server or by the supervisor.
+    parser.add_argument("--listen-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--state-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ready-fd", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        # Started by the supervisor: exit along with it.
+        watch_parent()
+        run_server(process_count=args.workers, ready_fd=args.ready_fd)
+    elif args.workers > 1:
+        Supervisor(args.workers).run()
+    else:
+        run_server(
+            listen_fd=args.listen_fd,
+            state_fd=args.state_fd,
+            ready_fd=args.ready_fd,
+            pid_file=args.pid_file,
+        )
 
 
 if __name__ == "__main__":
-    run_server()
+    # Run the copy imported as ``server.app``: the asyncio engine subclasses
+    # the handler from there, and configuration is set on that class.
+    from server.app import main as server_main
+
+    server_main()
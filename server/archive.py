@@ -0,0 +1,808 @@
+"""Archive building and caching for directory shares."""
+
+from __future__ import annotations
+
+import fcntl
+import glob
+import gzip
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+import stat as stat_module
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import BinaryIO, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .compression import COMPRESSION_LEVELS, DEFAULT_COMPRESSION, choose_compression
+from .path_validator import PathValidationError, validate_path_access
+
+try:  # lzma is an optional part of the standard library build.
+    import lzma
+except ImportError:  # pragma: no cover - depends on the Python build
+    lzma = None  # type: ignore[assignment]
+
+STREAM_READ_SIZE = 1024 * 1024  # 1 MiB
+# Members larger than this are compressed into a spool file next to the
+# archive instead of being shipped back from the worker process in memory.
+SPOOL_THRESHOLD = 4 * 1024 * 1024  # 4 MiB
+# Trees smaller than this are cheaper to compress serially than to fan out.
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024  # 8 MiB
+# Archive builds run in the background on this many threads.
+BUILD_THREADS = 2
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+
+ARCHIVE_FORMAT_ZIP = "zip"
+ARCHIVE_FORMAT_TAR = "tar"
+ARCHIVE_FORMAT_TAR_GZ = "tar.gz"
+ARCHIVE_FORMAT_TAR_XZ = "tar.xz"
+
+ARCHIVE_MIME_TYPES = {
+    ARCHIVE_FORMAT_ZIP: "application/zip",
+    ARCHIVE_FORMAT_TAR: "application/x-tar",
+    ARCHIVE_FORMAT_TAR_GZ: "application/gzip",
+    ARCHIVE_FORMAT_TAR_XZ: "application/x-xz",
+}
+
+
+def archive_formats() -> Tuple[str, ...]:
+    """Archive formats this Python build can produce."""
+    formats = [ARCHIVE_FORMAT_ZIP, ARCHIVE_FORMAT_TAR, ARCHIVE_FORMAT_TAR_GZ]
+    if lzma is not None:
+        formats.append(ARCHIVE_FORMAT_TAR_XZ)
+    return tuple(formats)
+
+
+def archive_base_name(source_path: str) -> str:
+    base_name = os.path.basename(source_path.rstrip(os.sep)) or "root"
+    return re.sub(r"[^A-Za-z0-9._-]", "_", base_name)[:80] or "archive"
+
+
+@dataclass
+class TreeScan:
+    fingerprint: str
+    files: int
+    bytes: int
+
+
+def scan_tree(source_path: str) -> TreeScan:
+    """
+    Cheap fingerprint and size summary of a directory tree.
+
+    Hashes relative paths, sizes, mtimes and inodes of every entry without
+    reading file contents, so any change that would alter the archive alters
+    the fingerprint.
+
+    Raises:
+        FileNotFoundError: If ``source_path`` is not an existing directory
+    """
+    if not os.path.isdir(source_path):
+        raise FileNotFoundError("Directory to share is no longer available.")
+    digest = hashlib.sha256()
+    files = 0
+    total_bytes = 0
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(source_path, rel_dir)) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name)
+            try:
+                stat = entry.stat()
+                is_dir = entry.is_dir()
+            except OSError:
+                digest.update(f"?{rel_path}\0".encode("utf-8", "surrogateescape"))
+                continue
+            kind = "d" if is_dir else "f"
+            size = 0 if is_dir else stat.st_size
+            digest.update(
+                f"{kind}{rel_path}\0{size}\0{stat.st_mtime_ns}\0{stat.st_ino}\0".encode(
+                    "utf-8", "surrogateescape"
+                )
+            )
+            if is_dir:
+                if not entry.is_symlink() and _allowed_subdir(entry.path):
+                    stack.append(rel_path)
+            else:
+                files += 1
+                total_bytes += size
+    return TreeScan(fingerprint=digest.hexdigest()[:16], files=files, bytes=total_bytes)
+
+
+def iter_members(source_path: str) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Yield ``(arcname, file_path)`` for every archive member of ``source_path``.
+
+    Directory entries are yielded with a trailing slash and ``file_path`` None.
+    Symlinks to directories are not followed, and subdirectories rejected by
+    :func:`validate_path_access` are left out, as in listings and search.
+    """
+    safe_base = archive_base_name(source_path)
+    yield f"{safe_base}/", None
+    for root, dirs, files in os.walk(source_path):
+        dirs[:] = [name for name in dirs if _allowed_subdir(os.path.join(root, name))]
+        rel_root = os.path.relpath(root, start=source_path)
+        folder_arc = os.path.join(safe_base, rel_root) if rel_root != "." else safe_base
+        if not files and not dirs:
+            yield f"{folder_arc}/", None
+        for name in files:
+            file_path = os.path.join(root, name)
+            rel_path = os.path.relpath(file_path, start=source_path)
+            yield os.path.join(safe_base, rel_path), file_path
+
+
+def _allowed_subdir(path: str) -> bool:
+    try:
+        validate_path_access(path, allow_custom=True)
+    except PathValidationError:
+        return False
+    return True
+
+
+def build_zip(
+    source_path: str,
+    archive_path: str,
+    compression: str = DEFAULT_COMPRESSION,
+    progress: Optional[Callable[[int], None]] = None,
+) -> None:
+    """
+    Write ``source_path`` into a new zip at ``archive_path``.
+
+    ``progress`` is called with the size of every file once it is archived.
+    """
+    if not os.path.exists(source_path):
+        raise FileNotFoundError("Directory to share is no longer available.")
+    with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for arcname, file_path in iter_members(source_path):
+            if file_path is None:
+                zf.writestr(arcname, "")
+                continue
+            size = os.path.getsize(file_path)
+            method, level = choose_compression(file_path, size, compression)
+            zf.write(file_path, arcname=arcname, compress_type=method, compresslevel=level or None)
+            if progress is not None:
+                progress(size)
+
+
+def stream_zip(source_path: str, fileobj: BinaryIO, compression: str = DEFAULT_COMPRESSION) -> None:
+    """
+    Write a zip of ``source_path`` to the unseekable ``fileobj``.
+
+    Members are read and deflated incrementally. Every member carries a ZIP64
+    extra field and a trailing data descriptor, so nothing needs to be known
+    up front and memory use does not depend on the tree size.
+    """
+    if not os.path.isdir(source_path):
+        raise FileNotFoundError("Directory to share is no longer available.")
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for arcname, file_path in iter_members(source_path):
+            if file_path is None:
+                zf.writestr(arcname, "")
+                continue
+            try:
+                src = open(file_path, "rb")
+            except OSError:
+                # Vanished or unreadable since the walk; skip rather than abort mid-stream.
+                continue
+            with src:
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname=arcname)
+                zinfo.compress_type, level = choose_compression(file_path, zinfo.file_size, compression)
+                _set_compress_level(zinfo, level or None)
+                with zf.open(zinfo, "w", force_zip64=True) as dest:
+                    shutil.copyfileobj(src, dest, STREAM_READ_SIZE)
+
+
+def stream_tar(
+    source_path: str,
+    fileobj: BinaryIO,
+    archive_format: str = ARCHIVE_FORMAT_TAR,
+    compression: str = DEFAULT_COMPRESSION,
+) -> None:
+    """
+    Write a tar of ``source_path`` to the unseekable ``fileobj``.
+
+    Plain tar is written straight through. The gzip and xz variants wrap
+    ``fileobj`` in a streaming compressor whose level follows ``compression``.
+    Members are those of :func:`iter_members`, like in a zip, and files that
+    cannot be opened are skipped the same way.
+    """
+    if not os.path.isdir(source_path):
+        raise FileNotFoundError("Directory to share is no longer available.")
+    level = COMPRESSION_LEVELS.get(compression, COMPRESSION_LEVELS[DEFAULT_COMPRESSION])
+    if archive_format == ARCHIVE_FORMAT_TAR:
+        sink = None
+    elif archive_format == ARCHIVE_FORMAT_TAR_GZ:
+        sink = gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level, mtime=0)
+    elif archive_format == ARCHIVE_FORMAT_TAR_XZ and lzma is not None:
+        sink = lzma.LZMAFile(fileobj, mode="wb", preset=level)
+    else:
+        raise ValueError(f"Unsupported archive format: {archive_format}")
+    try:
+        with tarfile.open(fileobj=sink or fileobj, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            for arcname, file_path in iter_members(source_path):
+                if file_path is None:
+                    info = tarfile.TarInfo(arcname.rstrip("/"))
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o755
+                    info.mtime = int(time.time())
+                    tar.addfile(info)
+                    continue
+                try:
+                    src = open(file_path, "rb")
+                except OSError:
+                    # Vanished or unreadable since the walk; skip rather than abort mid-stream.
+                    continue
+                with src:
+                    tar.addfile(tar.gettarinfo(arcname=arcname, fileobj=src), src)
+    finally:
+        if sink is not None:
+            sink.close()
+
+
+def stream_archive(
+    source_path: str,
+    fileobj: BinaryIO,
+    archive_format: str = ARCHIVE_FORMAT_ZIP,
+    compression: str = DEFAULT_COMPRESSION,
+) -> None:
+    """Stream ``source_path`` to ``fileobj`` in ``archive_format``."""
+    if archive_format == ARCHIVE_FORMAT_ZIP:
+        stream_zip(source_path, fileobj, compression)
+    else:
+        stream_tar(source_path, fileobj, archive_format, compression)
+
+
+def _set_compress_level(zinfo: zipfile.ZipInfo, level: Optional[int]) -> None:
+    # ZipInfo only exposes a public compress_level attribute from Python 3.13.
+    if hasattr(zinfo, "compress_level"):
+        zinfo.compress_level = level
+    else:
+        zinfo._compresslevel = level  # pylint: disable=protected-access
+
+
+def build_zip_parallel(
+    source_path: str,
+    archive_path: str,
+    pool: ProcessPoolExecutor,
+    workers: int,
+    compression: str = DEFAULT_COMPRESSION,
+    progress: Optional[Callable[[int], None]] = None,
+) -> None:
+    """
+    Write ``source_path`` into a new zip at ``archive_path`` using ``pool``.
+
+    Members are deflated and CRC-checked in worker processes, then appended
+    in walk order by this process. At most ``workers * 4`` members are in
+    flight, which bounds both memory and spool-file usage.
+    """
+    if not os.path.isdir(source_path):
+        raise FileNotFoundError("Directory to share is no longer available.")
+    window = max(workers, 1) * 4
+    pending: Deque[Tuple[str, Optional[os.stat_result], Optional[str], Optional[Future]]] = deque()
+    spool_index = 0
+    with open(archive_path, "wb") as fh:
+        assembler = _ZipAssembler(fh)
+        try:
+            for arcname, file_path in iter_members(source_path):
+                if file_path is None:
+                    pending.append((arcname, None, None, None))
+                else:
+                    stat = os.stat(file_path)
+                    spool_path = None
+                    if stat.st_size > SPOOL_THRESHOLD:
+                        spool_path = f"{archive_path}.part{spool_index}"
+                        spool_index += 1
+                    future = pool.submit(_compress_member, file_path, spool_path, compression)
+                    pending.append((arcname, stat, spool_path, future))
+                while len(pending) > window or (pending and pending[0][3] is None):
+                    _append_pending(assembler, pending.popleft(), progress)
+            while pending:
+                _append_pending(assembler, pending.popleft(), progress)
+            assembler.close()
+        finally:
+            # Only non-empty after a failure: drain workers before deleting spools.
+            for _, _, spool_path, future in pending:
+                if future is not None and not future.cancel():
+                    try:
+                        future.result()
+                    except Exception:  # noqa: BLE001 - already failing
+                        pass
+                _remove_quietly(spool_path)
+
+
+def _append_pending(
+    assembler: "_ZipAssembler",
+    item: Tuple[str, Optional[os.stat_result], Optional[str], Optional[Future]],
+    progress: Optional[Callable[[int], None]] = None,
+) -> None:
+    arcname, stat, spool_path, future = item
+    if future is None:
+        assembler.add_directory(arcname)
+        return
+    try:
+        method, crc, file_size, compress_size, data = future.result()
+        if data is not None:
+            assembler.add_member(arcname, stat, crc, file_size, compress_size, [data], method)
+        else:
+            with open(spool_path, "rb") as spool:
+                chunks = iter(lambda: spool.read(STREAM_READ_SIZE), b"")
+                assembler.add_member(arcname, stat, crc, file_size, compress_size, chunks, method)
+    finally:
+        _remove_quietly(spool_path)
+    if progress is not None:
+        progress(file_size)
+
+
+def _compress_member(
+    file_path: str, spool_path: Optional[str], compression: str
+) -> Tuple[int, int, int, int, Optional[bytes]]:
+    """
+    Compress one member according to ``compression`` (runs in a worker process).
+
+    Returns:
+        ``(compress_type, crc32, file_size, compress_size, data)``; ``data`` is
+        None when the member was written to ``spool_path`` instead.
+    """
+    method, level = choose_compression(file_path, os.path.getsize(file_path), compression)
+    compressor = None
+    if method == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = 0
+    file_size = 0
+    compress_size = 0
+    buffer = bytearray()
+    out = open(spool_path, "wb") if spool_path else None
+    try:
+        with open(file_path, "rb") as src:
+            while True:
+                chunk = src.read(STREAM_READ_SIZE)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                file_size += len(chunk)
+                compressed = compressor.compress(chunk) if compressor else chunk
+                compress_size += len(compressed)
+                if out is not None:
+                    out.write(compressed)
+                else:
+                    buffer += compressed
+        compressed = compressor.flush() if compressor else b""
+        compress_size += len(compressed)
+        if out is not None:
+            out.write(compressed)
+            return method, crc, file_size, compress_size, None
+        buffer += compressed
+        return method, crc, file_size, compress_size, bytes(buffer)
+    finally:
+        if out is not None:
+            out.close()
+
+
+def _remove_quietly(path: Optional[str]) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class _ZipAssembler:
+    """Append pre-compressed members to a zip file and write its central directory."""
+
+    def __init__(self, fh: BinaryIO) -> None:
+        self._fh = fh
+        self._offset = 0
+        self._central: List[bytes] = []
+
+    def add_directory(self, arcname: str) -> None:
+        # Same attributes zipfile.writestr gives directory entries.
+        attr = ((stat_module.S_IFDIR | 0o775) << 16) | 0x10
+        self._add(arcname, time.time(), zipfile.ZIP_STORED, 0, 0, 0, [], attr)
+
+    def add_member(
+        self,
+        arcname: str,
+        stat: os.stat_result,
+        crc: int,
+        file_size: int,
+        compress_size: int,
+        chunks,
+        method: int = zipfile.ZIP_DEFLATED,
+    ) -> None:
+        attr = (stat.st_mode & 0xFFFF) << 16
+        self._add(arcname, stat.st_mtime, method, crc, file_size, compress_size, chunks, attr)
+
+    def _add(self, arcname, mtime, method, crc, file_size, compress_size, chunks, external_attr) -> None:
+        name = arcname.encode("utf-8")
+        flags = 0x800 if not arcname.isascii() else 0
+        dos_time, dos_date = _dos_datetime(mtime)
+        offset = self._offset
+        zip64 = file_size >= _ZIP64_LIMIT or compress_size >= _ZIP64_LIMIT
+        base_version = 20 if method == zipfile.ZIP_DEFLATED or arcname.endswith("/") else 10
+        version = 45 if zip64 else base_version
+
+        local_extra = struct.pack("<HHQQ", 1, 16, file_size, compress_size) if zip64 else b""
+        header = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034B50,
+            version,
+            flags,
+            method,
+            dos_time,
+            dos_date,
+            crc,
+            _ZIP64_LIMIT if zip64 else compress_size,
+            _ZIP64_LIMIT if zip64 else file_size,
+            len(name),
+            len(local_extra),
+        )
+        self._write(header + name + local_extra)
+        for chunk in chunks:
+            self._write(chunk)
+
+        central_fields = []
+        if file_size >= _ZIP64_LIMIT:
+            central_fields.append(file_size)
+        if compress_size >= _ZIP64_LIMIT:
+            central_fields.append(compress_size)
+        if offset >= _ZIP64_LIMIT:
+            central_fields.append(offset)
+        central_extra = b""
+        if central_fields:
+            central_extra = struct.pack(
+                f"<HH{len(central_fields)}Q", 1, 8 * len(central_fields), *central_fields
+            )
+            version = 45
+        self._central.append(
+            struct.pack(
+                "<IHHHHHHIIIHHHHHII",
+                0x02014B50,
+                (3 << 8) | version,
+                version,
+                flags,
+                method,
+                dos_time,
+                dos_date,
+                crc,
+                min(compress_size, _ZIP64_LIMIT),
+                min(file_size, _ZIP64_LIMIT),
+                len(name),
+                len(central_extra),
+                0,
+                0,
+                0,
+                external_attr,
+                min(offset, _ZIP64_LIMIT),
+            )
+            + name
+            + central_extra
+        )
+
+    def close(self) -> None:
+        cd_offset = self._offset
+        for entry in self._central:
+            self._write(entry)
+        cd_size = self._offset - cd_offset
+        count = len(self._central)
+        if count >= _ZIP64_COUNT_LIMIT or cd_offset >= _ZIP64_LIMIT or cd_size >= _ZIP64_LIMIT:
+            zip64_eocd_offset = self._offset
+            self._write(
+                struct.pack(
+                    "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset
+                )
+            )
+            self._write(struct.pack("<IIQI", 0x07064B50, 0, zip64_eocd_offset, 1))
+        self._write(
+            struct.pack(
+                "<IHHHHIIH",
+                0x06054B50,
+                0,
+                0,
+                min(count, _ZIP64_COUNT_LIMIT),
+                min(count, _ZIP64_COUNT_LIMIT),
+                min(cd_size, _ZIP64_LIMIT),
+                min(cd_offset, _ZIP64_LIMIT),
+                0,
+            )
+        )
+
+    def _write(self, data: bytes) -> None:
+        self._fh.write(data)
+        self._offset += len(data)
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    tm = time.localtime(timestamp)
+    if tm.tm_year < 1980:
+        return 0, (0 << 9) | (1 << 5) | 1
+    dos_time = (tm.tm_hour << 11) | (tm.tm_min << 5) | (tm.tm_sec // 2)
+    dos_date = ((tm.tm_year - 1980) << 9) | (tm.tm_mon << 5) | tm.tm_mday
+    return dos_time, dos_date
+
+
+class ArchivePreparing(Exception):
+    """Raised when a share's archive is still being built in the background."""
+
+    def __init__(self, status: "ArchiveStatus") -> None:
+        super().__init__("Archive is being prepared")
+        self.status = status
+
+
+class ArchiveBuildError(Exception):
+    """Raised when the archive for the current tree could not be built."""
+
+
+ARCHIVE_STATE_PREPARING = "preparing"
+ARCHIVE_STATE_READY = "ready"
+ARCHIVE_STATE_FAILED = "failed"
+
+
+@dataclass
+class ArchiveStatus:
+    state: str
+    files_done: int = 0
+    bytes_done: int = 0
+    files_total: int = 0
+    bytes_total: int = 0
+    archive_name: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def advance(self, size: int) -> None:
+        self.files_done += 1
+        self.bytes_done += size
+
+
+class ArchiveCache:
+    """
+    Content-fingerprinted zip cache stored under ``archive_dir``.
+
+    Archives are named after the share token and the tree fingerprint, so an
+    unchanged directory reuses its zip and a changed one is rebuilt once.
+    Builds run on a background queue; concurrent requests for the same
+    archive share a single build. With ``workers`` above one, large trees
+    are compressed on a process pool.
+    """
+
+    def __init__(self, archive_dir: str, workers: int = 1) -> None:
+        self._archive_dir = archive_dir
+        self._workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue = ThreadPoolExecutor(max_workers=BUILD_THREADS, thread_name_prefix="archive-build")
+        self._lock = threading.Lock()
+        self._builds: Dict[str, Future] = {}
+        # Tree scans in progress, by token; concurrent requests share one.
+        self._scans: Dict[str, Future] = {}
+        self._status: Dict[str, ArchiveStatus] = {}
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def close(self) -> None:
+        self._queue.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def prepare(
+        self, source_path: str, token: str, compression: str = DEFAULT_COMPRESSION
+    ) -> ArchiveStatus:
+        """
+        Make sure an up-to-date archive of ``source_path`` exists or is queued.
+
+        Never blocks on a build. The returned status is a snapshot, ``ready``
+        (with ``archive_name`` set) or ``preparing``.
+
+        Raises:
+            FileNotFoundError: If the directory no longer exists
+            ArchiveBuildError: If building this version of the tree failed
+        """
+        scan = self._scan(source_path, token)
+        archive_name = f"{archive_base_name(source_path)}-{token}-{scan.fingerprint}.zip"
+        with self._lock:
+            status = self._status.get(token)
+            if status is None or status.archive_name != archive_name:
+                status = ArchiveStatus(
+                    state=ARCHIVE_STATE_PREPARING,
+                    files_total=scan.files,
+                    bytes_total=scan.bytes,
+                    archive_name=archive_name,
+                )
+                self._status[token] = status
+            if status.state == ARCHIVE_STATE_FAILED:
+                raise ArchiveBuildError(status.error or "Archive build failed")
+            if os.path.exists(os.path.join(self._archive_dir, archive_name)):
+                if status.state != ARCHIVE_STATE_READY:
+                    status.state = ARCHIVE_STATE_READY
+                    status.files_done, status.bytes_done = status.files_total, status.bytes_total
+                return replace(status)
+            if archive_name not in self._builds:
+                self._builds[archive_name] = self._queue.submit(
+                    self._run_build, source_path, token, archive_name, compression, status, scan.bytes
+                )
+            return replace(status)
+
+    def schedule(
+        self, source_path: str, token: str, compression: str = DEFAULT_COMPRESSION
+    ) -> ArchiveStatus:
+        """Like :meth:`prepare`, but the tree scan also runs on the build queue."""
+        with self._lock:
+            status = replace(self._status.setdefault(token, ArchiveStatus(state=ARCHIVE_STATE_PREPARING)))
+        self._queue.submit(self._prepare_in_background, source_path, token, compression)
+        return status
+
+    def _prepare_in_background(self, source_path: str, token: str, compression: str) -> None:
+        try:
+            self.prepare(source_path, token, compression)
+        except (FileNotFoundError, ArchiveBuildError) as exc:
+            with self._lock:
+                status = self._status.get(token)
+                if status is not None:
+                    status.state = ARCHIVE_STATE_FAILED
+                    status.error = str(exc)
+
+    def get_archive(
+        self, source_path: str, token: str, compression: str = DEFAULT_COMPRESSION
+    ) -> str:
+        """
+        Return the name of an up-to-date archive, waiting for any build.
+
+        Raises:
+            FileNotFoundError: If the directory no longer exists
+            ArchiveBuildError: If the build failed
+        """
+        status = self.prepare(source_path, token, compression)
+        if status.state == ARCHIVE_STATE_READY:
+            return status.archive_name
+        with self._lock:
+            build = self._builds.get(status.archive_name)
+        if build is not None:
+            build.result()
+        return self.get_archive(source_path, token, compression)
+
+    def status(self, token: str) -> Optional[ArchiveStatus]:
+        """Snapshot of the last known build status for ``token`` (in-memory, never scans)."""
+        with self._lock:
+            status = self._status.get(token)
+            return replace(status) if status is not None else None
+
+    def discard(self, source_path: str, token: str, keep: Optional[str] = None) -> None:
+        """Forget ``token`` (unless ``keep`` is given) and delete its other archives."""
+        if keep is None:
+            with self._lock:
+                self._status.pop(token, None)
+            _remove_quietly(self._lock_path(source_path, token))
+        self._discard_files(source_path, token, keep)
+
+    def _scan(self, source_path: str, token: str) -> TreeScan:
+        """
+        ``scan_tree(source_path)``; a request arriving while the same share is
+        being scanned waits for that scan instead of walking the tree again.
+        """
+        with self._lock:
+            pending = self._scans.get(token)
+            leader = pending is None
+            if leader:
+                pending = self._scans[token] = Future()
+        if leader:
+            try:
+                pending.set_result(scan_tree(source_path))
+            except BaseException as exc:  # noqa: BLE001 - handed to every waiter
+                pending.set_exception(exc)
+            finally:
+                with self._lock:
+                    del self._scans[token]
+        return pending.result()
+
+    def _discard_files(self, source_path: str, token: str, keep: Optional[str]) -> None:
+        pattern = os.path.join(self._archive_dir, f"{archive_base_name(source_path)}-{token}-*.zip")
+        for path in glob.glob(pattern):
+            if os.path.basename(path) != keep:
+                _remove_quietly(path)
+
+    def _run_build(
+        self,
+        source_path: str,
+        token: str,
+        archive_name: str,
+        compression: str,
+        status: ArchiveStatus,
+        tree_bytes: int,
+    ) -> None:
+        # ``status`` is shared with request threads; every update takes the lock.
+        def advance(size: int) -> None:
+            with self._lock:
+                status.advance(size)
+
+        try:
+            self._build(source_path, token, archive_name, compression, advance, tree_bytes)
+        except FileNotFoundError as exc:
+            with self._lock:
+                status.state = ARCHIVE_STATE_FAILED
+                status.error = str(exc)
+            raise
+        except Exception as exc:
+            with self._lock:
+                status.state = ARCHIVE_STATE_FAILED
+                status.error = "Archive build failed"
+            raise ArchiveBuildError(str(exc)) from exc
+        else:
+            with self._lock:
+                status.state = ARCHIVE_STATE_READY
+                current = self._status.get(token) is status
+                deleted = token not in self._status
+            # Files are removed outside the lock; unlinking a large zip takes a while.
+            if current:
+                # Superseded versions of this share's archive are no longer needed.
+                self._discard_files(source_path, token, keep=archive_name)
+            else:
+                # Share deleted or tree changed while building.
+                _remove_quietly(os.path.join(self._archive_dir, archive_name))
+                if deleted:
+                    # discard() ran before this build reopened the lock file.
+                    _remove_quietly(self._lock_path(source_path, token))
+        finally:
+            with self._lock:
+                self._builds.pop(archive_name, None)
+
+    def _build(
+        self,
+        source_path: str,
+        token: str,
+        archive_name: str,
+        compression: str,
+        progress: Callable[[int], None],
+        tree_bytes: int,
+    ) -> None:
+        archive_path = os.path.join(self._archive_dir, archive_name)
+        if os.path.exists(archive_path):
+            return
+        # Other server processes may be asked for the same archive; the first
+        # one to take the share's lock builds it and the rest find it done.
+        # The lock file outlives the build (unlinking it while held would let
+        # a newcomer lock a fresh file and build alongside) and is removed
+        # with the share.
+        with open(self._lock_path(source_path, token), "a") as lock_fh:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            if os.path.exists(archive_path):
+                return
+            tmp_path = f"{archive_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                if self._workers > 1 and tree_bytes >= PARALLEL_MIN_BYTES:
+                    build_zip_parallel(
+                        source_path, tmp_path, self._get_pool(), self._workers, compression, progress
+                    )
+                else:
+                    build_zip(source_path, tmp_path, compression, progress)
+                os.replace(tmp_path, archive_path)
+            finally:
+                _remove_quietly(tmp_path)
+
+    def _lock_path(self, source_path: str, token: str) -> str:
+        return os.path.join(self._archive_dir, f"{archive_base_name(source_path)}-{token}.lock")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # "spawn" keeps worker start-up independent of the server's threads.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
@@ -0,0 +1,166 @@
+"""In-memory cache for the console's static files and HTML templates."""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .transfer import if_none_match_matches
+
+# How often a cached file is re-stat'ed to pick up edits on disk.
+REFRESH_INTERVAL_SECONDS = 2.0
+# Bodies smaller than this are not worth a gzip variant.
+GZIP_MIN_SIZE = 256
+GZIP_LEVEL = 9
+
+_COMPRESSIBLE_TYPES = frozenset({
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+    "text/javascript",
+})
+
+
+@dataclass
+class Asset:
+    content: bytes
+    etag: str
+    mime: str
+    gzip_content: Optional[bytes]
+    gzip_etag: Optional[str]
+    mtime_ns: int
+    size: int
+    checked_at: float
+
+    def variant(self, accept_gzip: bool) -> Tuple[bytes, str, bool]:
+        """Return ``(body, etag, gzipped)`` for the client's encoding preference."""
+        if accept_gzip and self.gzip_content is not None:
+            return self.gzip_content, self.gzip_etag, True
+        return self.content, self.etag, False
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Evaluate ``If-None-Match`` (weak comparison) against either variant."""
+        return if_none_match_matches(if_none_match, self.etag, self.gzip_etag)
+
+
+class AssetCache:
+    """
+    Serve files below ``root_dir`` from memory.
+
+    Every file is read once, hashed into a strong ETag and, for text types,
+    gzip-compressed ahead of time. Entries are re-stat'ed at most every
+    ``refresh_interval`` seconds and reloaded when their size or mtime change.
+    """
+
+    def __init__(
+        self,
+        root_dir: str,
+        default_mime: str = "application/octet-stream",
+        refresh_interval: float = REFRESH_INTERVAL_SECONDS,
+    ) -> None:
+        self._root_dir = os.path.abspath(root_dir)
+        self._default_mime = default_mime
+        self._refresh_interval = refresh_interval
+        self._assets: Dict[str, Asset] = {}
+        self._lock = threading.RLock()
+
+    def preload(self) -> None:
+        """Load every file below the root directory."""
+        for root, _, files in os.walk(self._root_dir):
+            for name in files:
+                rel_path = os.path.relpath(os.path.join(root, name), self._root_dir)
+                self.get(rel_path)
+
+    def get(self, rel_path: str) -> Optional[Asset]:
+        """
+        Return the cached asset for ``rel_path``, loading or refreshing it.
+
+        ``rel_path`` must already be normalized by the caller.
+
+        Returns:
+            The asset, or None if it is not a regular file below the root.
+        """
+        file_path = os.path.abspath(os.path.join(self._root_dir, rel_path))
+        if not file_path.startswith(self._root_dir + os.sep):
+            return None
+        now = time.monotonic()
+        with self._lock:
+            asset = self._assets.get(rel_path)
+            if asset is not None and now - asset.checked_at < self._refresh_interval:
+                return asset
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            stat = None
+        with self._lock:
+            if stat is None or not os.path.isfile(file_path):
+                self._assets.pop(rel_path, None)
+                return None
+            asset = self._assets.get(rel_path)
+            if asset is not None and asset.mtime_ns == stat.st_mtime_ns and asset.size == stat.st_size:
+                asset.checked_at = now
+                return asset
+            try:
+                asset = self._load(file_path, stat, now)
+            except OSError:
+                return None
+            self._assets[rel_path] = asset
+            return asset
+
+    def _load(self, file_path: str, stat: os.stat_result, now: float) -> Asset:
+        with open(file_path, "rb") as fh:
+            content = fh.read()
+        mime, _ = mimetypes.guess_type(file_path)
+        mime = mime or self._default_mime
+        digest = hashlib.sha256(content).hexdigest()[:20]
+        gzip_content = gzip_etag = None
+        if _is_compressible(mime) and len(content) >= GZIP_MIN_SIZE:
+            # mtime=0 keeps the variant byte-identical across restarts.
+            compressed = gzip.compress(content, GZIP_LEVEL, mtime=0)
+            if len(compressed) < len(content):
+                gzip_content = compressed
+                gzip_etag = f'"{digest}-gz"'
+        return Asset(
+            content=content,
+            etag=f'"{digest}"',
+            mime=mime,
+            gzip_content=gzip_content,
+            gzip_etag=gzip_etag,
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            checked_at=now,
+        )
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """True if an ``Accept-Encoding`` header allows gzip (``q`` above zero)."""
+    if not accept_encoding:
+        return False
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def _is_compressible(mime: str) -> bool:
+    base = mime.split(";", 1)[0].strip().lower()
+    return base.startswith("text/") or base in _COMPRESSIBLE_TYPES
@@ -0,0 +1,366 @@
+"""asyncio server engine.
+
+Connections are multiplexed on a single event loop instead of one OS thread
+each. Every parsed request is dispatched to ``FileShareRequestHandler`` on a
+bounded thread pool, so blocking work (password hashing, archive building,
+remote downloads, JSON storage) never runs on the loop. File bodies are not
+sent by the worker thread: the handler records them and the loop transmits
+them afterwards with non-blocking ``sendfile``, so a slow client pulling a
+large share holds a socket but no thread.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import BinaryIO, Callable, List, Optional, Set, Tuple, Union
+
+from .app import FileShareRequestHandler
+
+MAX_HEADER_BYTES = 64 * 1024  # 64 KiB
+MAX_BODY_BYTES = 16 * 1024 * 1024  # 16 MiB
+HEADER_TIMEOUT_SECONDS = 30
+BODY_TIMEOUT_SECONDS = 60
+# Buffered response bytes above this are pushed to the client before the
+# handler continues (streamed archives); smaller responses go out in one go.
+FLUSH_THRESHOLD = 256 * 1024  # 256 KiB
+DEFAULT_EXECUTOR_THREADS = 32
+DRAIN_POLL_SECONDS = 0.2
+
+
+@dataclass
+class _FileSegment:
+    fh: BinaryIO
+    offset: int
+    count: int
+
+
+class ResponseWriter:
+    """
+    ``wfile`` for requests served by the asyncio engine.
+
+    Collects response bytes and file ranges in order. The event loop sends
+    them with :meth:`send_pending` once the handler returns; handlers that
+    produce large bodies incrementally trigger a send whenever the buffer
+    passes ``FLUSH_THRESHOLD`` and wait for the client to keep up.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, writer: asyncio.StreamWriter) -> None:
+        self._loop = loop
+        self._writer = writer
+        self._segments: List[Union[bytes, _FileSegment]] = []
+        self._buffer = bytearray()
+        self.truncated = False
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        if len(self._buffer) >= FLUSH_THRESHOLD:
+            # Called from the handler thread: block it until the loop has
+            # handed the data to the socket (this is the backpressure).
+            asyncio.run_coroutine_threadsafe(self.send_pending(), self._loop).result()
+        return len(data)
+
+    def flush(self) -> None:
+        # BaseHTTPRequestHandler flushes after every request; sending is left
+        # to the event loop.
+        return
+
+    def add_file(self, fh: BinaryIO, offset: int, count: int) -> None:
+        """Queue ``count`` bytes of ``fh`` from ``offset``; ``fh`` is closed once sent."""
+        self._take_buffer()
+        self._segments.append(_FileSegment(fh, offset, count))
+
+    async def send_pending(self) -> None:
+        """Send everything queued so far. Must run on the event loop."""
+        self._take_buffer()
+        segments, self._segments = self._segments, []
+        try:
+            while segments:
+                segment = segments.pop(0)
+                if isinstance(segment, bytes):
+                    self._writer.write(segment)
+                    await self._writer.drain()
+                    continue
+                try:
+                    sent = await self._loop.sendfile(
+                        self._writer.transport, segment.fh, segment.offset, segment.count
+                    )
+                finally:
+                    segment.fh.close()
+                if sent < segment.count:
+                    # File shrank mid-transfer; the body is short of its Content-Length.
+                    self.truncated = True
+                    return
+        finally:
+            self.discard(segments)
+
+    def discard(self, segments: Optional[List[Union[bytes, _FileSegment]]] = None) -> None:
+        """Drop queued segments without sending them, closing any open files."""
+        if segments is None:
+            segments, self._segments = self._segments, []
+        for segment in segments:
+            if isinstance(segment, _FileSegment):
+                segment.fh.close()
+        segments.clear()
+
+    def _take_buffer(self) -> None:
+        if self._buffer:
+            self._segments.append(bytes(self._buffer))
+            self._buffer.clear()
+
+
+class AsyncRequestHandler(FileShareRequestHandler):
+    """
+    ``FileShareRequestHandler`` driven by the asyncio engine.
+
+    The raw request (head and body) is replayed from memory and the response
+    goes to a :class:`ResponseWriter` instead of a socket.
+    """
+
+    def __init__(  # pylint: disable=super-init-not-called
+        self,
+        raw_request: bytes,
+        client_address: Tuple[str, int],
+        wfile: ResponseWriter,
+        requests_served: int = 0,
+    ) -> None:
+        self.rfile = io.BytesIO(raw_request)
+        self.wfile = wfile
+        self.client_address = client_address
+        self.connection = None
+        self.request = None
+        self.server = None
+        self.close_connection = True
+        self._requests_served = requests_served
+
+    def handle_expect_100(self) -> bool:
+        # The engine answers ``Expect: 100-continue`` before reading the body.
+        return True
+
+    def _write_file_range(self, fh: BinaryIO, offset: int, count: int) -> int:
+        # The handler closes ``fh`` when it returns; the loop sends from a duplicate.
+        self.wfile.add_file(os.fdopen(os.dup(fh.fileno()), "rb"), offset, count)
+        return count
+
+
+class AsyncServer:
+    """
+    Serve ``FileShareRequestHandler`` routes from an asyncio event loop.
+
+    The listening socket is bound here, or inherited as ``listen_fd`` when
+    this process takes over from a reloading one.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        executor_threads: int = DEFAULT_EXECUTOR_THREADS,
+        reuse_port: bool = False,
+        listen_fd: Optional[int] = None,
+    ) -> None:
+        if listen_fd is not None:
+            self._socket = socket.socket(fileno=listen_fd)
+        else:
+            self._socket = socket.create_server((host, port), reuse_port=reuse_port)
+        self._reuse_port = reuse_port
+        self._connections = 0
+        self._backlog_tasks: Set["asyncio.Task[None]"] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, executor_threads), thread_name_prefix="request"
+        )
+
+    def fileno(self) -> int:
+        return self._socket.fileno()
+
+    def serve_forever(
+        self,
+        reload_handler: Optional[Callable[[int], bool]] = None,
+        drain_timeout: float = 0,
+    ) -> None:
+        """
+        Serve until interrupted, or until a reload has handed over.
+
+        Args:
+            reload_handler: Called on ``SIGHUP`` with a duplicate of the
+                listening socket once accepting has stopped. Returning True
+                means another process now serves the port: this one drains
+                its connections for up to ``drain_timeout`` seconds and
+                returns. Returning False resumes accepting.
+            drain_timeout: Seconds to wait for active connections after a
+                reload before dropping them.
+        """
+        try:
+            asyncio.run(self._serve(reload_handler, drain_timeout))
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._socket.close()
+
+    async def _serve(
+        self, reload_handler: Optional[Callable[[int], bool]], drain_timeout: float
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        server = await self._listen(self._socket)
+        if reload_handler is None:
+            await server.serve_forever()
+            return
+        reload_requested = asyncio.Event()
+        loop.add_signal_handler(signal.SIGHUP, reload_requested.set)
+        while True:
+            await reload_requested.wait()
+            reload_requested.clear()
+            # Closing the server closes its socket; the duplicate keeps the
+            # port listening so new connections queue in the backlog.
+            listen_fd = os.dup(self._socket.fileno())
+            server.close()
+            if await loop.run_in_executor(None, reload_handler, listen_fd):
+                break
+            self._socket = socket.socket(fileno=listen_fd)
+            server = await self._listen(self._socket)
+        loop.remove_signal_handler(signal.SIGHUP)
+        FileShareRequestHandler.draining = True
+        if self._reuse_port:
+            # This process has its own queue of accepted connections; serve
+            # them rather than resetting them on close.
+            await self._accept_backlog(listen_fd)
+        os.close(listen_fd)
+        deadline = time.monotonic() + drain_timeout
+        while self._connections and time.monotonic() < deadline:
+            await asyncio.sleep(DRAIN_POLL_SECONDS)
+
+    async def _listen(self, sock: socket.socket) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle_connection, sock=sock, limit=MAX_HEADER_BYTES)
+
+    async def _accept_backlog(self, listen_fd: int) -> None:
+        listener = socket.socket(fileno=os.dup(listen_fd))
+        listener.setblocking(False)
+        with listener:
+            while True:
+                try:
+                    conn, _ = listener.accept()
+                except OSError:  # BlockingIOError once the backlog is empty
+                    return
+                reader, writer = await asyncio.open_connection(sock=conn, limit=MAX_HEADER_BYTES)
+                task = asyncio.create_task(self._handle_connection(reader, writer))
+                self._backlog_tasks.add(task)
+                task.add_done_callback(self._backlog_tasks.discard)
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info("peername") or ("", 0)
+        client_address = (peer[0], peer[1])
+        requests_served = 0
+        self._connections += 1
+        try:
+            while requests_served < FileShareRequestHandler.max_keepalive_requests:
+                # The first request gets the full header timeout; a persistent
+                # connection only waits ``keepalive_timeout`` for the next one.
+                timeout = (
+                    HEADER_TIMEOUT_SECONDS
+                    if requests_served == 0
+                    else FileShareRequestHandler.keepalive_timeout
+                )
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._send_error(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+                    return
+                if _header_value(head, b"transfer-encoding"):
+                    # Bodies are framed by Content-Length only; reading past a
+                    # chunked body would take its bytes for the next request.
+                    await self._send_error(writer, HTTPStatus.LENGTH_REQUIRED)
+                    return
+                length = _content_length(head)
+                if length is None:
+                    await self._send_error(writer, HTTPStatus.BAD_REQUEST)
+                    return
+                if length > MAX_BODY_BYTES:
+                    await self._send_error(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+                    return
+                body = b""
+                if length:
+                    if _header_value(head, b"expect").lower() == b"100-continue":
+                        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                    try:
+                        body = await asyncio.wait_for(reader.readexactly(length), BODY_TIMEOUT_SECONDS)
+                    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                        return
+
+                response = ResponseWriter(loop, writer)
+                try:
+                    handler = await loop.run_in_executor(
+                        self._executor,
+                        self._dispatch,
+                        head + body,
+                        client_address,
+                        response,
+                        requests_served,
+                    )
+                    await response.send_pending()
+                except ConnectionError:
+                    response.discard()
+                    return
+                requests_served += 1
+                if handler.close_connection or response.truncated or handler.draining:
+                    return
+        finally:
+            self._connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    @staticmethod
+    def _dispatch(
+        raw_request: bytes,
+        client_address: Tuple[str, int],
+        response: ResponseWriter,
+        requests_served: int,
+    ) -> AsyncRequestHandler:
+        handler = AsyncRequestHandler(raw_request, client_address, response, requests_served)
+        handler.handle_one_request()
+        return handler
+
+    @staticmethod
+    async def _send_error(writer: asyncio.StreamWriter, status: HTTPStatus) -> None:
+        writer.write(
+            f"HTTP/1.0 {status.value} {status.phrase}\r\n"
+            "Content-Length: 0\r\nConnection: close\r\n\r\n".encode("latin-1")
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def _content_length(head: bytes) -> Optional[int]:
+    """``Content-Length`` of a raw request head (0 if absent, None if invalid)."""
+    value = _header_value(head, b"content-length")
+    if not value:
+        return 0
+    try:
+        length = int(value)
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+def _header_value(head: bytes, name: bytes) -> bytes:
+    """Value of the first ``name`` header (lower-case) in a raw request head."""
+    for line in head.split(b"\r\n")[1:]:
+        key, _, value = line.partition(b":")
+        if key.strip().lower() == name:
+            return value.strip()
+    return b""
@@ -1,10 +1,10 @@
+import json
 import os
-import threading
 from dataclasses import dataclass, asdict
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from .security import generate_random_string
-from .storage import JSONStorage
+from .stores import BookmarkStore, SQLiteBookmarkStore
 from .path_validator import validate_path_access, PathValidationError
 
 
@@ -19,13 +19,18 @@ class Bookmark:
 
 
 class BookmarkManager:
-    def __init__(self, storage_path: str):
-        self._storage = JSONStorage(storage_path, [])
-        self._lock = threading.RLock()
+    def __init__(self, store: BookmarkStore):
+        self._store = store
+
+    def close(self) -> None:
+        self._store.close()
+
+    def set_flush_interval(self, seconds: float) -> None:
+        """See :meth:`JSONStorage.set_flush_interval`."""
+        self._store.set_flush_interval(seconds)
 
     def list_bookmarks(self) -> List[Dict]:
-        with self._lock:
-            return list(self._storage.read())
+        return self._store.list()
 
     def add_bookmark(self, label: str, path: str) -> Bookmark:
         # Validate path security
@@ -37,23 +42,35 @@ class BookmarkManager:
         if not os.path.isdir(abs_path):
             raise NotADirectoryError("Bookmark path must be an existing directory.")
 
-        with self._lock:
-            bookmarks = self._storage.read()
-            identifier = self._generate_identifier(bookmarks)
-            bookmark = Bookmark(identifier=identifier, label=label.strip() or abs_path, path=abs_path)
-            bookmarks.append(bookmark.to_dict())
-            self._storage.write(bookmarks)
-            return bookmark
+        while True:
+            bookmark = Bookmark(
+                identifier=generate_random_string(6),
+                label=label.strip() or abs_path,
+                path=abs_path,
+            )
+            # An identifier collision is retried with a fresh identifier.
+            if self._store.insert(bookmark.to_dict()):
+                return bookmark
 
     def delete_bookmark(self, identifier: str) -> None:
-        with self._lock:
-            bookmarks = self._storage.read()
-            filtered = [b for b in bookmarks if b.get("identifier") != identifier]
-            self._storage.write(filtered)
+        self._store.delete(identifier)
 
-    def _generate_identifier(self, existing: List[Dict]) -> str:
-        existing_ids = {b["identifier"] for b in existing}
-        while True:
-            candidate = generate_random_string(6)
-            if candidate not in existing_ids:
-                return candidate
+
+def migrate_json_bookmarks(store: SQLiteBookmarkStore, json_path: str) -> Optional[int]:
+    """
+    Import ``bookmarks.json`` into ``store`` once; the file is then renamed to ``*.migrated``.
+
+    Returns:
+        Number of bookmarks imported, or None if the import had already happened.
+    """
+
+    def load() -> List[Dict]:
+        if not os.path.exists(json_path):
+            return []
+        with open(json_path, "r", encoding="utf-8") as fh:
+            return [Bookmark(b["identifier"], b["label"], b["path"]).to_dict() for b in json.load(fh)]
+
+    imported = store.migrate(os.path.basename(json_path), load)
+    if imported is not None and os.path.exists(json_path):
+        os.replace(json_path, f"{json_path}.migrated")
+    return imported
@@ -0,0 +1,77 @@
+"""Per-member compression policy for directory share archives."""
+
+from __future__ import annotations
+
+import os
+import zipfile
+import zlib
+from typing import Tuple
+
+# Named levels accepted by POST /api/shares; "none" stores every member.
+COMPRESSION_LEVELS = {
+    "none": 0,
+    "fast": 1,
+    "balanced": 6,
+    "max": 9,
+}
+DEFAULT_COMPRESSION = "balanced"
+
+# Formats that are already compressed; deflating them again only burns CPU.
+STORED_EXTENSIONS = frozenset({
+    ".7z", ".aac", ".apk", ".avi", ".br", ".bz2", ".cab", ".deb", ".docx",
+    ".epub", ".flac", ".flv", ".gif", ".gz", ".heic", ".jar", ".jpeg", ".jpg",
+    ".lz", ".lz4", ".lzma", ".m4a", ".m4v", ".mkv", ".mov", ".mp3", ".mp4",
+    ".odp", ".ods", ".odt", ".ogg", ".opus", ".png", ".pptx", ".rar", ".rpm",
+    ".tgz", ".txz", ".webm", ".webp", ".whl", ".woff", ".woff2", ".xlsx",
+    ".xz", ".zip", ".zst",
+})
+
+SAMPLE_SIZE = 64 * 1024  # 64 KiB
+# Files smaller than this are deflated without sampling.
+SAMPLE_MIN_SIZE = 4 * 1024  # 4 KiB
+# Store the member if a fast deflate of the sample saves less than 5%.
+SAMPLE_MAX_RATIO = 0.95
+
+
+def normalize_compression(value: str) -> str:
+    """
+    Validate a compression level name.
+
+    Raises:
+        ValueError: If ``value`` is not a known level
+    """
+    name = (value or DEFAULT_COMPRESSION).strip().lower()
+    if name not in COMPRESSION_LEVELS:
+        choices = ", ".join(COMPRESSION_LEVELS)
+        raise ValueError(f"Unsupported compression level: {value}. Choose one of: {choices}")
+    return name
+
+
+def choose_compression(file_path: str, size: int, compression: str) -> Tuple[int, int]:
+    """
+    Decide how to store one archive member.
+
+    Returns:
+        ``(compress_type, level)`` where ``compress_type`` is
+        ``zipfile.ZIP_STORED`` or ``zipfile.ZIP_DEFLATED``.
+    """
+    level = COMPRESSION_LEVELS.get(compression, COMPRESSION_LEVELS[DEFAULT_COMPRESSION])
+    if level == 0:
+        return zipfile.ZIP_STORED, 0
+    if os.path.splitext(file_path)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, 0
+    if size >= SAMPLE_MIN_SIZE and not _sample_is_compressible(file_path):
+        return zipfile.ZIP_STORED, 0
+    return zipfile.ZIP_DEFLATED, level
+
+
+def _sample_is_compressible(file_path: str) -> bool:
+    try:
+        with open(file_path, "rb") as fh:
+            sample = fh.read(SAMPLE_SIZE)
+    except OSError:
+        # Let the archive builder surface the error when it reads the file.
+        return True
+    if not sample:
+        return True
+    return len(zlib.compress(sample, 1)) < len(sample) * SAMPLE_MAX_RATIO
@@ -3,6 +3,9 @@ import os
 from dataclasses import dataclass
 from typing import Any, Dict
 
+SERVER_ENGINES = ("threaded", "asyncio")
+STORAGE_BACKENDS = ("json", "sqlite")
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CONFIG_PATH = os.path.join(BASE_DIR, "config", "config.json")
 
@@ -20,6 +23,26 @@ class ServerConfig:
     host: str
     port: int
     session_timeout_minutes: int
+    engine: str = "threaded"
+    executor_threads: int = 32
+    workers: int = 64
+    pending_connections: int = 256
+    heavy_requests: int = 16
+    light_requests: int = 48
+    request_timeout: int = 60
+    keepalive_timeout: int = 15
+    max_keepalive_requests: int = 100
+    drain_timeout: int = 3600
+
+
+@dataclass
+class ArchiveConfig:
+    workers: int
+
+
+@dataclass
+class StorageConfig:
+    backend: str = "json"
 
 
 class ConfigManager:
@@ -47,12 +70,38 @@ class ConfigManager:
     def get_server(self) -> ServerConfig:
         server = self._data["server"]
         security = self._data.get("security", {})
+        engine = server.get("engine", "threaded")
+        if engine not in SERVER_ENGINES:
+            raise ValueError(f"Unsupported server engine: {engine}. Choose one of: {', '.join(SERVER_ENGINES)}")
         return ServerConfig(
             host=server.get("host", "127.0.0.1"),
             port=int(server.get("port", 23000)),
             session_timeout_minutes=int(security.get("session_timeout_minutes", 60)),
+            engine=engine,
+            executor_threads=max(1, int(server.get("executor_threads", 32))),
+            workers=max(1, int(server.get("workers", 64))),
+            pending_connections=max(1, int(server.get("pending_connections", 256))),
+            heavy_requests=max(1, int(server.get("heavy_requests", 16))),
+            light_requests=max(1, int(server.get("light_requests", 48))),
+            request_timeout=max(1, int(server.get("request_timeout", 60))),
+            keepalive_timeout=max(1, int(server.get("keepalive_timeout", 15))),
+            max_keepalive_requests=max(1, int(server.get("max_keepalive_requests", 100))),
+            drain_timeout=max(0, int(server.get("drain_timeout", 3600))),
         )
 
+    def get_archive(self) -> ArchiveConfig:
+        archive = self._data.get("archive", {})
+        # Parallel zip builds stay opt-in until scripts/bench_zip.py shows a
+        # gain on the host; with one worker archives are built serially.
+        return ArchiveConfig(workers=max(1, int(archive.get("workers", 1))))
+
+    def get_storage(self) -> StorageConfig:
+        storage = self._data.get("storage", {})
+        backend = storage.get("backend", "json")
+        if backend not in STORAGE_BACKENDS:
+            raise ValueError(f"Unsupported storage backend: {backend}. Choose one of: {', '.join(STORAGE_BACKENDS)}")
+        return StorageConfig(backend=backend)
+
     @staticmethod
     def save(path: str, data: Dict[str, Any]) -> None:
         os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -0,0 +1,132 @@
+"""Directory change notifications through Linux inotify (via ctypes)."""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import itertools
+import os
+import struct
+import sys
+import threading
+from typing import Dict, Optional
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+
+# Anything that can change a listing: entries appearing, disappearing or
+# being renamed, and the size or times of an entry changing.
+LISTING_EVENTS = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+
+class DirectoryWatcher:
+    """
+    Count changes to watched directories.
+
+    ``generation(path)`` returns a number that changes whenever anything in
+    ``path`` changes, or None while ``path`` is not watched (never added,
+    deleted, or the kernel dropped events). Numbers are never reused, not
+    even when a path is watched again. A single thread reads the inotify
+    descriptor.
+    """
+
+    def __init__(self, libc: ctypes.CDLL, fd: int) -> None:
+        self._libc = libc
+        self._fd = fd
+        self._lock = threading.Lock()
+        self._paths: Dict[int, str] = {}
+        self._watches: Dict[str, int] = {}
+        self._generations: Dict[str, int] = {}
+        self._counter = itertools.count(1)
+        threading.Thread(target=self._read_events, name="dir-watch", daemon=True).start()
+
+    @classmethod
+    def create(cls) -> Optional["DirectoryWatcher"]:
+        """A watcher, or None where inotify is not available."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def watch(self, path: str) -> bool:
+        """Start watching ``path``; False if the kernel refused (e.g. out of watches)."""
+        with self._lock:
+            if path in self._watches:
+                return True
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), LISTING_EVENTS | IN_ONLYDIR)
+            if wd < 0:
+                return False
+            self._paths[wd] = path
+            self._watches[path] = wd
+            self._generations[path] = next(self._counter)
+            return True
+
+    def unwatch(self, path: str) -> None:
+        with self._lock:
+            wd = self._watches.pop(path, None)
+            if wd is None:
+                return
+            self._paths.pop(wd, None)
+            self._generations.pop(path, None)
+        self._libc.inotify_rm_watch(self._fd, wd)
+
+    def generation(self, path: str) -> Optional[int]:
+        with self._lock:
+            return self._generations.get(path) if path in self._watches else None
+
+    def _read_events(self) -> None:
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except OSError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                return
+            offset = 0
+            moved = []
+            with self._lock:
+                while offset < len(data):
+                    wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size + name_len
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were lost: nothing watched can be trusted.
+                        self._paths.clear()
+                        self._watches.clear()
+                        self._generations.clear()
+                        continue
+                    path = self._paths.get(wd)
+                    if path is None:
+                        continue
+                    self._generations[path] = next(self._counter)
+                    if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                        del self._paths[wd]
+                        self._watches.pop(path, None)
+                        self._generations.pop(path, None)
+                        if mask & IN_MOVE_SELF:
+                            moved.append(wd)  # the kernel keeps watching it elsewhere
+            for wd in moved:
+                self._libc.inotify_rm_watch(self._fd, wd)
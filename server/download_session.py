@@ -0,0 +1,113 @@
+"""Short-lived download sessions for share links.
+
+A download session remembers that a client has already been admitted for a
+share, so follow-up range requests (resumes, parallel segments opened by
+download accelerators) are served without registering another download.
+Sessions last a fixed time from the admitted download; using one does not
+extend it.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_TTL_SECONDS = 10 * 60
+DEFAULT_STRIPES = 16
+
+
+@dataclass
+class DownloadSession:
+    download: Dict
+    share_expire_at: Optional[float]
+    expires_at: float
+
+
+@dataclass
+class _Stripe:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    sessions: Dict[Tuple[str, str], DownloadSession] = field(default_factory=dict)
+
+
+class DownloadSessionManager:
+    """
+    Sessions are striped by share token: each stripe has its own lock and
+    dict, so downloads of different shares rarely wait for each other and an
+    expiry sweep only walks one stripe.
+    """
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, stripes: int = DEFAULT_STRIPES) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._stripes = [_Stripe() for _ in range(max(1, stripes))]
+
+    def open_session(
+        self,
+        token: str,
+        client_ip: str,
+        download: Dict,
+        share_expire_at: Optional[float] = None,
+    ) -> None:
+        now = time.time()
+        stripe = self._stripe(token)
+        with stripe.lock:
+            self._cleanup_expired_sessions(stripe, now)
+            stripe.sessions[(token, client_ip)] = DownloadSession(
+                download=dict(download),
+                share_expire_at=share_expire_at,
+                expires_at=now + self._ttl_seconds,
+            )
+
+    def get_session(self, token: str, client_ip: str) -> Optional[Dict]:
+        """Return the admitted download for (token, client) while its session lasts."""
+        now = time.time()
+        stripe = self._stripe(token)
+        with stripe.lock:
+            session = stripe.sessions.get((token, client_ip))
+            if not session:
+                return None
+            share_expired = session.share_expire_at and session.share_expire_at <= now
+            if session.expires_at <= now or share_expired:
+                del stripe.sessions[(token, client_ip)]
+                return None
+            return dict(session.download)
+
+    def invalidate_token(self, token: str) -> None:
+        stripe = self._stripe(token)
+        with stripe.lock:
+            for key in [key for key in stripe.sessions if key[0] == token]:
+                del stripe.sessions[key]
+
+    def export_state(self) -> List[Dict[str, Any]]:
+        """Live sessions, for handing over to a reloaded server process."""
+        now = time.time()
+        state = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                self._cleanup_expired_sessions(stripe, now)
+                state.extend(
+                    {"token": token, "client_ip": client_ip, **asdict(session)}
+                    for (token, client_ip), session in stripe.sessions.items()
+                )
+        return state
+
+    def import_state(self, state: List[Dict[str, Any]]) -> None:
+        for entry in state:
+            stripe = self._stripe(entry["token"])
+            with stripe.lock:
+                stripe.sessions[(entry["token"], entry["client_ip"])] = DownloadSession(
+                    download=entry["download"],
+                    share_expire_at=entry["share_expire_at"],
+                    expires_at=entry["expires_at"],
+                )
+
+    def _stripe(self, token: str) -> _Stripe:
+        return self._stripes[hash(token) % len(self._stripes)]
+
+    @staticmethod
+    def _cleanup_expired_sessions(stripe: _Stripe, now: float) -> None:
+        """Remove the stripe's expired sessions. Must be called with its lock held."""
+        expired = [key for key, session in stripe.sessions.items() if session.expires_at <= now]
+        for key in expired:
+            del stripe.sessions[key]
@@ -0,0 +1,60 @@
+"""Deadline scheduler used to expire shares on time."""
+
+from __future__ import annotations
+
+import heapq
+import sys
+import threading
+import time
+from typing import Callable, List, Tuple
+
+# Longest single sleep. Far-off deadlines (years ahead) would otherwise
+# exceed threading.TIMEOUT_MAX and make Condition.wait() raise.
+MAX_SLEEP_SECONDS = 24 * 3600.0
+
+
+class ExpiryScheduler:
+    """
+    Call ``on_expire(key)`` once ``key``'s deadline has passed.
+
+    Deadlines sit in a min-heap, so scheduling and firing cost O(log n), and
+    a single thread sleeps until the earliest one. Entries are never removed
+    early: ``on_expire`` must tolerate keys that are already gone.
+    """
+
+    def __init__(self, on_expire: Callable[[str], None], name: str = "expiry") -> None:
+        self._on_expire = on_expire
+        self._heap: List[Tuple[float, str]] = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, key: str, deadline: float) -> None:
+        with self._condition:
+            heapq.heappush(self._heap, (deadline, key))
+            if self._heap[0] == (deadline, key):
+                # New earliest deadline: wake the thread to shorten its sleep.
+                self._condition.notify()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed:
+                    delay = self._heap[0][0] - time.time() if self._heap else None
+                    if delay is not None and delay <= 0:
+                        break
+                    self._condition.wait(MAX_SLEEP_SECONDS if delay is None else min(delay, MAX_SLEEP_SECONDS))
+                if self._closed:
+                    return
+                _, key = heapq.heappop(self._heap)
+            try:
+                self._on_expire(key)
+            except Exception as exc:  # noqa: BLE001 - keep the scheduler alive
+                print(f"Expiring {key} failed: {exc}", file=sys.stderr, flush=True)
@@ -0,0 +1,269 @@
+"""Directory listings for the file browser."""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import bisect
+import json
+import os
+import stat as stat_module
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .dirwatch import DirectoryWatcher
+
+SORT_KEYS = ("name", "size", "modified")
+MAX_PAGE_SIZE = 10000
+DEFAULT_CACHE_DIRECTORIES = 128
+# Upper bound on cached rows over all directories. A million rows take
+# about 100 MB sorted by name (bare names) and 250 MB sorted by size or time.
+DEFAULT_CACHE_ROWS = 2_000_000
+# Without inotify a listing is only cached once its directory has been
+# unchanged this long: an update within the filesystem's timestamp
+# granularity after the scan would otherwise go unnoticed.
+MTIME_SETTLE_SECONDS = 2.0
+
+
+@dataclass
+class ListingPage:
+    """
+    One page of a directory listing.
+
+    ``entries`` is produced lazily; for a name-sorted page the entries are
+    only stat'ed while it is iterated. ``total`` counts every entry matching
+    the filters, on all pages. ``next_cursor`` is None on the last page.
+    """
+
+    entries: Iterator[Dict[str, Any]]
+    total: int
+    next_cursor: Optional[str]
+
+
+def list_page(
+    target: str,
+    show_hidden: bool = False,
+    sort: str = "name",
+    descending: bool = False,
+    prefix: str = "",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    cache: Optional["ListingCache"] = None,
+) -> ListingPage:
+    """
+    List the directory ``target``, optionally one page at a time.
+
+    The directory is read with ``os.scandir`` into rows sorted by the sort
+    key, or taken from ``cache``. Sorting by name needs no ``stat`` until
+    the page is emitted, so a page of a huge directory costs one ``stat``
+    per returned entry; sorting by size or modification time costs one
+    per entry. A page is then found by bisecting the sorted rows.
+
+    Args:
+        target: Directory to list.
+        show_hidden: Include entries whose name starts with a dot.
+        sort: One of :data:`SORT_KEYS`; ties are broken by name.
+        descending: Reverse the sort order.
+        prefix: Only include names starting with this (case-insensitive).
+        limit: Page size; None lists everything.
+        cursor: ``next_cursor`` of the previous page. Pages are keyed on the
+            last entry returned, so entries added or removed meanwhile do not
+            shift later pages.
+        cache: Scanned directories to reuse.
+
+    Raises:
+        ValueError: If ``sort``, ``limit`` or ``cursor`` is invalid
+        PermissionError: If the directory cannot be read
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unsupported sort key: {sort}. Choose one of: {', '.join(SORT_KEYS)}")
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    after = _decode_cursor(cursor, sort, descending) if cursor else None
+
+    rows = cache.rows(target, show_hidden, sort) if cache else _scan(target, show_hidden, sort)
+    key: Callable[[Any], Any] = _name_key if sort == "name" else _stat_key
+    if prefix:
+        folded_prefix = prefix.casefold()
+        rows = [row for row in rows if _row_name(row).casefold().startswith(folded_prefix)]
+    total = len(rows)
+
+    if descending:
+        end = total if after is None else bisect.bisect_left(rows, after, key=key)
+        start = 0 if limit is None else max(0, end - limit)
+        page = rows[start:end][::-1]
+        more = start > 0
+    else:
+        start = 0 if after is None else bisect.bisect_right(rows, after, key=key)
+        end = total if limit is None else start + limit
+        page = rows[start:end]
+        more = end < total
+    next_cursor = _encode_cursor(key(page[-1]), sort, descending) if more and page else None
+    return ListingPage(entries=_emit(target, page), total=total, next_cursor=next_cursor)
+
+
+@dataclass
+class _CachedRows:
+    rows: List[Any]
+    mtime_ns: int
+    generation: Optional[int]
+
+
+class ListingCache:
+    """
+    Bounded LRU of scanned directories, keyed by (path, show_hidden, sort).
+
+    With a :class:`DirectoryWatcher` (inotify) an entry stays valid until
+    the kernel reports a change in its directory, so a hit costs no system
+    call. Without one, only name-sorted rows are kept (entries are stat'ed
+    when emitted anyway) and revalidated against the directory's mtime,
+    which changes whenever an entry is added, removed or renamed.
+    """
+
+    def __init__(
+        self,
+        max_directories: int = DEFAULT_CACHE_DIRECTORIES,
+        max_rows: int = DEFAULT_CACHE_ROWS,
+        watcher: Optional[DirectoryWatcher] = None,
+    ) -> None:
+        self._max_directories = max_directories
+        self._max_rows = max_rows
+        self._watcher = watcher
+        self._entries: "OrderedDict[Tuple[str, bool, str], _CachedRows]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def rows(self, target: str, show_hidden: bool, sort: str) -> List[Any]:
+        """Rows of ``target`` as :func:`list_page` scans them; treat as read-only."""
+        key = (target, show_hidden, sort)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+        if cached is not None and self._is_fresh(target, cached):
+            return cached.rows
+
+        generation = None
+        if self._watcher is not None and self._watcher.watch(target):
+            # Taken before scanning: a change during the scan invalidates the result.
+            generation = self._watcher.generation(target)
+        if generation is None:
+            if sort != "name":
+                # File sizes and times can change without touching the directory.
+                return _scan(target, show_hidden, sort)
+            mtime_ns = os.stat(target).st_mtime_ns
+            rows = _scan(target, show_hidden, sort)
+            if time.time() - mtime_ns / 1e9 < MTIME_SETTLE_SECONDS:
+                return rows
+        else:
+            mtime_ns = 0
+            rows = _scan(target, show_hidden, sort)
+        self._store(key, _CachedRows(rows=rows, mtime_ns=mtime_ns, generation=generation))
+        return rows
+
+    def _is_fresh(self, target: str, cached: _CachedRows) -> bool:
+        if cached.generation is not None:
+            return self._watcher.generation(target) == cached.generation
+        try:
+            return os.stat(target).st_mtime_ns == cached.mtime_ns
+        except OSError:
+            return False
+
+    def _store(self, key: Tuple[str, bool, str], cached: _CachedRows) -> None:
+        if len(cached.rows) > self._max_rows:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._rows -= len(previous.rows)
+            self._entries[key] = cached
+            self._rows += len(cached.rows)
+            evicted = []
+            while len(self._entries) > self._max_directories or self._rows > self._max_rows:
+                old_key, old = self._entries.popitem(last=False)
+                self._rows -= len(old.rows)
+                evicted.append(old_key[0])
+            unwatch = {path for path in evicted if not any(k[0] == path for k in self._entries)}
+        if self._watcher is not None:
+            for path in unwatch:
+                self._watcher.unwatch(path)
+
+
+def _scan(target: str, show_hidden: bool, sort: str) -> List[Any]:
+    """
+    Read ``target`` into rows sorted by ``sort``.
+
+    Name-sorted rows are bare names; the others carry what is emitted,
+    (value, name, is_dir, size, modified), rather than whole stat results.
+    """
+    rows: List[Any] = []
+    with os.scandir(target) as it:
+        for entry in it:
+            name = entry.name
+            if not show_hidden and name.startswith("."):
+                continue
+            if sort == "name":
+                rows.append(name)
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            modified = int(st.st_mtime)
+            value = st.st_size if sort == "size" else modified
+            rows.append((value, name, stat_module.S_ISDIR(st.st_mode), st.st_size, modified))
+    rows.sort(key=_name_key if sort == "name" else _stat_key)
+    return rows
+
+
+def _emit(target: str, rows: List[Any]) -> Iterator[Dict[str, Any]]:
+    for row in rows:
+        if isinstance(row, str):
+            path = os.path.join(target, row)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # dangling symlink or removed meanwhile
+            name, is_dir, size, modified = row, stat_module.S_ISDIR(st.st_mode), st.st_size, int(st.st_mtime)
+        else:
+            _, name, is_dir, size, modified = row
+            path = os.path.join(target, name)
+        yield {"name": name, "path": path, "is_dir": is_dir, "size": size, "modified": modified}
+
+
+def _name_key(row: str) -> Any:
+    return row
+
+
+def _row_name(row: Any) -> str:
+    return row if isinstance(row, str) else row[1]
+
+
+def _stat_key(row: tuple) -> Any:
+    return row[0], row[1]
+
+
+def _encode_cursor(key: Any, sort: str, descending: bool) -> str:
+    values = [key] if isinstance(key, str) else list(key)
+    raw = json.dumps([sort, descending, *values], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str, sort: str, descending: bool) -> Any:
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, binascii.Error) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(decoded, list) or decoded[:2] != [sort, descending]:
+        raise ValueError("Cursor does not belong to this sort order")
+    values = decoded[2:]
+    if sort == "name":
+        if len(values) != 1 or not isinstance(values[0], str):
+            raise ValueError("Invalid cursor")
+        return values[0]
+    if len(values) != 2 or not isinstance(values[0], int) or not isinstance(values[1], str):
+        raise ValueError("Invalid cursor")
+    return values[0], values[1]
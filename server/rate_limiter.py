@@ -4,8 +4,8 @@ from __future__ import annotations
 
 import threading
 import time
-from dataclasses import dataclass
-from typing import Dict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict
 
 
 @dataclass
@@ -142,3 +142,14 @@ class RateLimiter:
                 return 0
 
             return int(attempt.locked_until - now)
+
+    def export_state(self) -> Dict[str, Any]:
+        """Tracked attempts, for handing over to a reloaded server process."""
+        with self._lock:
+            self._cleanup_old_entries(time.time())
+            return {identifier: asdict(attempt) for identifier, attempt in self._attempts.items()}
+
+    def import_state(self, state: Dict[str, Any]) -> None:
+        with self._lock:
+            for identifier, attempt in state.items():
+                self._attempts[identifier] = LoginAttempt(**attempt)
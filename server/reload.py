@@ -0,0 +1,147 @@
+"""Zero-downtime reload: hand the listening socket over to a fresh process.
+
+On ``SIGHUP`` the running server stops accepting, starts
+``python -m server.app`` with the listening socket, its in-memory runtime
+state (sessions, login attempts, download sessions) and a readiness pipe as
+inherited file descriptors, and waits for the new process to report that it
+is serving. Connections arriving meanwhile wait in the socket's backlog, so
+none is refused. The old process then finishes its active transfers and
+exits; if the new one fails to start, the old one resumes accepting.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .config import BASE_DIR
+
+READY_TIMEOUT_SECONDS = 30
+READY_MESSAGE = b"ready"
+
+
+def export_state(context: Any) -> Dict[str, Any]:
+    """
+    In-memory runtime state of ``context`` worth keeping across a reload.
+
+    Only a single-process server holds this in memory; pre-forked workers
+    already share it through ``data/runtime.db``.
+    """
+    return {
+        "sessions": context.session_manager.export_state(),
+        "login_attempts": context.rate_limiter.export_state(),
+        "download_sessions": context.download_sessions.export_state(),
+    }
+
+
+def import_state(context: Any, state: Dict[str, Any]) -> None:
+    """Load state produced by :func:`export_state` in the previous process."""
+    context.session_manager.import_state(state.get("sessions", {}))
+    context.rate_limiter.import_state(state.get("login_attempts", {}))
+    context.download_sessions.import_state(state.get("download_sessions", []))
+
+
+def read_inherited_state(fd: int) -> Dict[str, Any]:
+    """Read the state the previous process wrote to the inherited pipe ``fd``."""
+    with os.fdopen(fd, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def signal_ready(fd: int) -> None:
+    """Tell the process that started us that we are accepting connections."""
+    try:
+        os.write(fd, READY_MESSAGE)
+    finally:
+        os.close(fd)
+
+
+def start_successor(
+    listen_fd: int,
+    state: Dict[str, Any],
+    extra_args: Optional[List[str]] = None,
+    timeout: float = READY_TIMEOUT_SECONDS,
+) -> Optional[subprocess.Popen]:
+    """
+    Start a new server process on the listening socket ``listen_fd``.
+
+    Args:
+        listen_fd: Listening socket the new process serves from.
+        state: Runtime state handed to the new process.
+        extra_args: Further ``server.app`` arguments.
+        timeout: Seconds to wait for the new process to report ready.
+
+    Returns:
+        The new process once it is accepting connections, or None if it
+        failed to start in time (it is killed in that case).
+    """
+    state_read, state_write = os.pipe()
+    ready_read, ready_write = os.pipe()
+    command = [
+        sys.executable,
+        "-m",
+        "server.app",
+        *(extra_args or []),
+        "--listen-fd",
+        str(listen_fd),
+        "--state-fd",
+        str(state_read),
+        "--ready-fd",
+        str(ready_write),
+    ]
+    try:
+        process = subprocess.Popen(  # noqa: S603 - own module
+            command,
+            cwd=str(BASE_DIR),
+            pass_fds=(listen_fd, state_read, ready_write),
+        )
+    except OSError:
+        os.close(state_write)
+        os.close(ready_read)
+        raise
+    finally:
+        # The child holds its own copies of these ends.
+        os.close(state_read)
+        os.close(ready_write)
+
+    def write_state() -> None:
+        try:
+            with os.fdopen(state_write, "w", encoding="utf-8") as fh:
+                json.dump(state, fh)
+        except BrokenPipeError:
+            pass
+
+    # The state can exceed the pipe buffer; never block this thread on it.
+    threading.Thread(target=write_state, name="reload-state", daemon=True).start()
+    try:
+        if wait_ready(ready_read, timeout):
+            return process
+    finally:
+        os.close(ready_read)
+    process.kill()
+    process.wait()
+    return None
+
+
+def wait_ready(fd: int, timeout: float) -> bool:
+    """Wait up to ``timeout`` seconds for a :func:`signal_ready` on the pipe ``fd``."""
+    deadline = time.monotonic() + timeout
+    received = b""
+    while len(received) < len(READY_MESSAGE):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        readable, _, _ = select.select([fd], [], [], remaining)
+        if not readable:
+            return False
+        chunk = os.read(fd, len(READY_MESSAGE))
+        if not chunk:
+            # The new process exited before it became ready.
+            return False
+        received += chunk
+    return received == READY_MESSAGE
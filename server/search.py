@@ -0,0 +1,359 @@
+"""Filename search over the bookmarked directories."""
+
+from __future__ import annotations
+
+import bisect
+import fnmatch
+import gzip
+import json
+import os
+import re
+import stat as stat_module
+import sys
+import threading
+import time
+from array import array
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Pattern, Tuple
+
+from .path_validator import PathValidationError, validate_path_access
+
+INDEX_VERSION = 1
+REFRESH_INTERVAL_SECONDS = 60.0
+# Directories modified more recently than this are read again on the next
+# refresh: a change within the timestamp granularity would go unnoticed.
+MTIME_SETTLE_SECONDS = 2.0
+DEFAULT_RESULTS = 100
+MAX_RESULTS = 1000
+GLOB_CHARS = "*?["
+# Bracket expressions as fnmatch reads them, e.g. [abc], [!abc], []abc].
+_GLOB_TOKENS = re.compile(r"\[!?\]?[^\]]*\]|[*?]")
+
+
+@dataclass
+class _Directory:
+    # -1 if the directory was still changing when read.
+    mtime_ns: int
+    # Sorted entry names, each followed by "\n"; directories end in "/".
+    names: str
+    # Subdirectories to descend into (not symlinks, not blocked).
+    subdirs: List[str]
+
+
+@dataclass
+class _Snapshot:
+    """
+    Every indexed name, casefolded, in one string searched with ``str.find``.
+
+    Segment ``i`` of ``folded`` holds the names in ``paths[i]``, starting at
+    ``starts[i]`` (the array ends with the string length). ``names[i]`` is
+    the same segment as spelled on disk, shared with the index's directory
+    record rather than copied.
+    """
+
+    folded: str = "\n"
+    paths: List[str] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    starts: array = field(default_factory=lambda: array("q", [1]))
+    hidden: bytearray = field(default_factory=bytearray)
+
+
+@dataclass
+class SearchResults:
+    results: List[Dict]
+    # More entries match than were returned.
+    truncated: bool
+    # The index has not been checked against the disk since startup.
+    indexing: bool
+
+
+class SearchIndex:
+    """
+    Index of the names below a set of root directories.
+
+    A background thread walks the roots every ``refresh_interval`` seconds
+    (or when :meth:`request_refresh` is called). Only directories whose
+    mtime changed are read again; creating, deleting or renaming an entry
+    changes its directory's mtime. After a refresh that changed anything,
+    the index is saved to ``index_path``, so a restart serves searches from
+    the saved index at once while the first refresh checks it.
+
+    Searching scans the concatenated names with ``str.find``, which runs at
+    memory speed in C; a glob is first narrowed down to names containing
+    its longest literal part.
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        roots: Callable[[], List[str]],
+        refresh_interval: float = REFRESH_INTERVAL_SECONDS,
+    ) -> None:
+        self._index_path = index_path
+        self._roots = roots
+        self._refresh_interval = refresh_interval
+        self._directories: Dict[str, _Directory] = {}
+        self._snapshot = _Snapshot()
+        self._checked = False
+        self._closed = False
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name="search-index", daemon=True).start()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+
+    def request_refresh(self) -> None:
+        """Walk the roots soon, e.g. after a bookmark was added."""
+        self._wake.set()
+
+    def search(self, query: str, limit: Optional[int] = None, show_hidden: bool = False) -> SearchResults:
+        """
+        Entries whose name contains ``query``, or matches it as a glob.
+
+        Matching ignores case. A query containing ``*``, ``?`` or ``[`` is a
+        glob matched against the whole name (``*.mp4``); any other query
+        matches anywhere in the name. Paths rejected by
+        :func:`validate_path_access` are never returned. Results have the
+        fields of a directory listing entry.
+
+        Args:
+            query: Substring or glob.
+            limit: Number of results, at most :data:`MAX_RESULTS`; None
+                returns :data:`DEFAULT_RESULTS`.
+            show_hidden: Include names starting with a dot, and entries of
+                such directories.
+
+        Raises:
+            ValueError: If ``query`` or ``limit`` is invalid
+        """
+        if not query or "/" in query or "\n" in query:
+            raise ValueError("Search query must be a non-empty file name or pattern")
+        if limit is None:
+            limit = DEFAULT_RESULTS
+        if not 1 <= limit <= MAX_RESULTS:
+            raise ValueError(f"limit must be between 1 and {MAX_RESULTS}")
+        folded_query = query.casefold()
+        pattern: Optional[Pattern[str]] = None
+        needle = folded_query
+        if any(char in query for char in GLOB_CHARS):
+            pattern = re.compile(fnmatch.translate(folded_query))
+            needle = max(_GLOB_TOKENS.split(folded_query), key=len)
+
+        snapshot = self._snapshot
+        results: List[Dict] = []
+        split_segments: Dict[int, List[str]] = {}
+        for start, end in _matching_lines(snapshot.folded, needle):
+            is_dir = snapshot.folded[end - 1] == "/"
+            if pattern is not None and not pattern.match(snapshot.folded[start:end - 1 if is_dir else end]):
+                continue
+            segment = bisect.bisect_right(snapshot.starts, start) - 1
+            name = _original_name(snapshot, segment, start, end, split_segments)
+            if is_dir:
+                name = name[:-1]
+            if not show_hidden and (snapshot.hidden[segment] or name.startswith(".")):
+                continue
+            path = os.path.join(snapshot.paths[segment], name)
+            try:
+                validate_path_access(path, allow_custom=True)
+                st = os.stat(path)
+            except (PathValidationError, OSError):
+                continue  # blocked, or removed since the last refresh
+            if len(results) == limit:
+                return SearchResults(results=results, truncated=True, indexing=not self._checked)
+            results.append({
+                "name": name,
+                "path": path,
+                "is_dir": stat_module.S_ISDIR(st.st_mode),
+                "size": st.st_size,
+                "modified": int(st.st_mtime),
+            })
+        return SearchResults(results=results, truncated=False, indexing=not self._checked)
+
+    def _run(self) -> None:
+        self._load()
+        while not self._closed:
+            try:
+                self._refresh()
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"Search index refresh failed: {exc}", file=sys.stderr, flush=True)
+            self._checked = True
+            self._wake.wait(self._refresh_interval)
+            self._wake.clear()
+
+    def _current_roots(self) -> List[str]:
+        roots = []
+        for root in self._roots():
+            try:
+                roots.append(validate_path_access(root, allow_custom=True))
+            except PathValidationError:
+                continue
+        return sorted(set(roots))
+
+    def _walk(
+        self, lookup: Callable[[str], Optional[_Directory]]
+    ) -> Tuple[Dict[str, _Directory], List[Tuple[str, bool]]]:
+        """
+        Visit the directories below the roots, depth first.
+
+        Returns:
+            The directories ``lookup`` returned, and their paths in visiting
+            order with whether each is hidden (below a dot directory).
+        """
+        directories: Dict[str, _Directory] = {}
+        order: List[Tuple[str, bool]] = []
+        for root in self._current_roots():
+            stack = [(root, False)]
+            while stack:
+                path, hidden = stack.pop()
+                if path in directories:
+                    continue  # also below another root
+                directory = lookup(path)
+                if directory is None:
+                    continue
+                directories[path] = directory
+                order.append((path, hidden))
+                stack.extend(
+                    (os.path.join(path, name), hidden or name.startswith("."))
+                    for name in reversed(directory.subdirs)
+                )
+        return directories, order
+
+    def _refresh(self) -> None:
+        """Walk the roots, reading only directories whose mtime changed."""
+        previous = self._directories
+        reread = False
+
+        def lookup(path: str) -> Optional[_Directory]:
+            nonlocal reread
+            cached = previous.get(path)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+                if cached is None or cached.mtime_ns != mtime_ns:
+                    cached = _read_directory(path, mtime_ns)
+                    reread = True
+            except OSError:
+                return None
+            return cached
+
+        directories, order = self._walk(lookup)
+        if not reread and directories.keys() == previous.keys():
+            return
+        self._directories = directories
+        self._snapshot = _build_snapshot(directories, order)
+        self._save()
+
+    def _load(self) -> None:
+        """Serve the saved index until the first refresh has checked it."""
+        try:
+            with gzip.open(self._index_path, "rt", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError, EOFError):
+            return
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return
+        saved = {
+            path: _Directory(mtime_ns=mtime_ns, names=names, subdirs=subdirs)
+            for path, mtime_ns, names, subdirs in data.get("directories", [])
+        }
+        directories, order = self._walk(saved.get)
+        self._snapshot = _build_snapshot(directories, order)
+        # Everything saved, so that the first refresh also rewrites the file
+        # if directories of former roots are left out now.
+        self._directories = saved
+
+    def _save(self) -> None:
+        data = {
+            "version": INDEX_VERSION,
+            "directories": [
+                [path, directory.mtime_ns, directory.names, directory.subdirs]
+                for path, directory in self._directories.items()
+            ],
+        }
+        tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+        try:
+            payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            with open(tmp_path, "wb") as fh:
+                fh.write(gzip.compress(payload, compresslevel=1))
+            os.replace(tmp_path, self._index_path)
+        except OSError as exc:
+            print(f"Could not save search index: {exc}", file=sys.stderr, flush=True)
+
+
+def _read_directory(path: str, mtime_ns: int) -> _Directory:
+    names: List[str] = []
+    subdirs: List[str] = []
+    with os.scandir(path) as it:
+        for entry in it:
+            name = entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                names.append(name)
+                continue
+            names.append(name + "/")
+            try:
+                if entry.is_symlink():
+                    continue
+                validate_path_access(entry.path, allow_custom=True)
+            except (OSError, PathValidationError):
+                continue
+            subdirs.append(name)
+    names.sort()
+    subdirs.sort()
+    if time.time() - mtime_ns / 1e9 < MTIME_SETTLE_SECONDS:
+        mtime_ns = -1
+    return _Directory(mtime_ns=mtime_ns, names="".join(name + "\n" for name in names), subdirs=subdirs)
+
+
+def _build_snapshot(directories: Dict[str, _Directory], order: List[Tuple[str, bool]]) -> _Snapshot:
+    snapshot = _Snapshot()
+    folded_parts = ["\n"]
+    offset = 1
+    snapshot.starts = array("q")
+    for path, hidden in order:
+        names = directories[path].names
+        folded = names.casefold()
+        snapshot.paths.append(path)
+        snapshot.names.append(names)
+        snapshot.hidden.append(hidden)
+        snapshot.starts.append(offset)
+        folded_parts.append(folded)
+        offset += len(folded)
+    snapshot.starts.append(offset)
+    snapshot.folded = "".join(folded_parts)
+    return snapshot
+
+
+def _matching_lines(text: str, needle: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) of each "\\n"-terminated line of ``text`` containing ``needle``."""
+    position = text.find(needle, 1)
+    while 0 <= position < len(text):
+        start = text.rfind("\n", 0, position) + 1
+        end = text.find("\n", position)
+        if end > start:
+            yield start, end
+        position = text.find(needle, end + 1)
+
+
+def _original_name(
+    snapshot: _Snapshot, segment: int, start: int, end: int, split_segments: Dict[int, List[str]]
+) -> str:
+    """
+    The name at ``folded[start:end]`` as it is spelled on disk.
+
+    ``split_segments`` memoizes the names of segments whose offsets do not
+    line up, for the duration of one search.
+    """
+    segment_start = snapshot.starts[segment]
+    names = snapshot.names[segment]
+    if snapshot.starts[segment + 1] - segment_start == len(names):
+        # Casefolding only ever lengthens text, so no name in this
+        # directory changed length and the offsets line up.
+        return names[start - segment_start:end - segment_start]
+    split = split_segments.get(segment)
+    if split is None:
+        split = split_segments[segment] = names.split("\n")
+    return split[snapshot.folded.count("\n", segment_start, start)]
@@ -1,8 +1,8 @@
 import secrets
 import threading
 import time
-from dataclasses import dataclass
-from typing import Dict, Optional
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
 
 
 @dataclass
@@ -62,3 +62,15 @@ class SessionManager:
             return
         with self._lock:
             self._sessions.pop(token, None)
+
+    def export_state(self) -> Dict[str, Any]:
+        """Live sessions, for handing over to a reloaded server process."""
+        with self._lock:
+            self._cleanup_expired_sessions()
+            return {token: asdict(session) for token, session in self._sessions.items()}
+
+    def import_state(self, state: Dict[str, Any]) -> None:
+        with self._lock:
+            for token, session in state.items():
+                self._sessions[token] = Session(**session)
+            self._cleanup_expired_sessions()
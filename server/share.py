@@ -1,16 +1,36 @@
+import math
 import os
-import re
 import secrets
-import threading
 import time
-import zipfile
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields as dataclass_fields
 from typing import Dict, List, Optional
 
+from .archive import (
+    ARCHIVE_FORMAT_ZIP,
+    ARCHIVE_MIME_TYPES,
+    ARCHIVE_STATE_READY,
+    ArchiveCache,
+    ArchivePreparing,
+    archive_base_name,
+    archive_formats,
+)
+from .compression import DEFAULT_COMPRESSION, normalize_compression
+from .download_session import DownloadSessionManager
+from .expiry import ExpiryScheduler
 from .security import generate_random_string
-from .storage import JSONStorage
+from .storage import JournaledJSONStorage
+from .stores import ShareStore, SQLiteShareStore
+from .transfer import continues_download
 from .path_validator import validate_share_path, PathValidationError
 
+# Directory shares are either zipped once into data/archives ("cached") or
+# archived on the fly while being sent ("stream"). Tar formats always stream.
+ARCHIVE_MODE_CACHED = "cached"
+ARCHIVE_MODE_STREAM = "stream"
+ARCHIVE_MODES = (ARCHIVE_MODE_CACHED, ARCHIVE_MODE_STREAM)
+# Shares cannot be set to expire further ahead than this.
+MAX_SHARE_LIFETIME_SECONDS = 10 * 365 * 24 * 3600
+
 
 @dataclass
 class ShareRecord:
@@ -23,54 +43,68 @@ class ShareRecord:
     download_count: int
     expire_at: Optional[float]
     allowed_ips: List[str]
+    archive_mode: str = ARCHIVE_MODE_CACHED
+    compression: str = DEFAULT_COMPRESSION
+    archive_format: str = ARCHIVE_FORMAT_ZIP
 
     def to_dict(self) -> Dict:
         return asdict(self)
 
 
 class ShareManager:
-    def __init__(self, storage_path: str):
-        self._storage = JSONStorage(storage_path, {})
-        self._lock = threading.RLock()
-        self._data_dir = os.path.dirname(storage_path)
-        self._archive_dir = os.path.join(self._data_dir, "archives")
+    def __init__(
+        self,
+        store: ShareStore,
+        archive_dir: str,
+        archive_workers: int = 1,
+        download_sessions: Optional[DownloadSessionManager] = None,
+    ):
+        # Every store operation is atomic, also across worker processes.
+        self._store = store
+        self._archive_dir = archive_dir
+        self._download_sessions = download_sessions or DownloadSessionManager()
+        self._archives = ArchiveCache(self._archive_dir, workers=archive_workers)
         os.makedirs(self._archive_dir, exist_ok=True)
+        # Shares are removed when they expire, not when someone next looks.
+        self._expiry = ExpiryScheduler(self._expire, name="share-expiry")
+        for record in self._store.pop_expired(time.time()):
+            self._release(record)
+        for token, expire_at in self._store.deadlines():
+            self._expiry.schedule(token, expire_at)
 
-    def _load(self) -> Dict[str, Dict]:
-        return self._storage.read()
+    def close(self) -> None:
+        self._expiry.close()
+        self._store.close()
+        self._archives.close()
 
-    def _save(self, data: Dict[str, Dict]) -> None:
-        self._storage.write(data)
+    def set_flush_interval(self, seconds: float) -> None:
+        """See :meth:`JSONStorage.set_flush_interval`."""
+        self._store.set_flush_interval(seconds)
 
     def list_shares(self) -> List[Dict]:
-        with self._lock:
-            now = time.time()
-            data = self._load()
-            active: List[Dict] = []
-            changed = False
-            for token, entry in list(data.items()):
-                expire_at = entry.get("expire_at")
-                if expire_at and expire_at < now:
-                    archive_name = entry.get("archive_name")
-                    if archive_name:
-                        self._remove_archive(archive_name)
-                    del data[token]
-                    changed = True
-                    continue
-                sanitized = {
+        now = time.time()
+        active: List[Dict] = []
+        for entry in self._store.list():
+            if _expired(entry, now):
+                continue  # the scheduler is about to remove it
+            token = entry["token"]
+            active.append(
+                {
                     "token": token,
                     "path": entry.get("path"),
                     "is_directory": entry.get("is_directory", False),
                     "download_count": entry.get("download_count", 0),
                     "max_downloads": entry.get("max_downloads"),
-                    "expire_at": expire_at,
+                    "expire_at": entry.get("expire_at"),
                     "allowed_ips": entry.get("allowed_ips", []),
                     "created_at": entry.get("created_at"),
+                    "archive_mode": entry.get("archive_mode", ARCHIVE_MODE_CACHED),
+                    "compression": entry.get("compression", DEFAULT_COMPRESSION),
+                    "archive_format": entry.get("archive_format", ARCHIVE_FORMAT_ZIP),
+                    "archive_status": self.get_archive_status(token),
                 }
-                active.append(sanitized)
-            if changed:
-                self._save(data)
-            return active
+            )
+        return active
 
     def create_share(
         self,
@@ -78,7 +112,24 @@ class ShareManager:
         max_downloads: Optional[int],
         expire_at: Optional[float],
         allowed_ips: Optional[List[str]] = None,
+        archive_mode: str = ARCHIVE_MODE_CACHED,
+        compression: str = DEFAULT_COMPRESSION,
+        archive_format: str = ARCHIVE_FORMAT_ZIP,
     ) -> ShareRecord:
+        if archive_mode not in ARCHIVE_MODES:
+            raise ValueError(f"Unsupported archive mode: {archive_mode}")
+        if archive_format not in archive_formats():
+            choices = ", ".join(archive_formats())
+            raise ValueError(f"Unsupported archive format: {archive_format}. Choose one of: {choices}")
+        if archive_format != ARCHIVE_FORMAT_ZIP:
+            # Tar has no central directory to seek back to; it is always streamed.
+            archive_mode = ARCHIVE_MODE_STREAM
+        compression = normalize_compression(compression)
+        if expire_at is not None and not (
+            math.isfinite(expire_at) and expire_at <= time.time() + MAX_SHARE_LIFETIME_SECONDS
+        ):
+            raise ValueError("Expiry time must be within 10 years from now")
+
         # Validate path security before checking existence
         try:
             abs_path = validate_share_path(path)
@@ -92,128 +143,172 @@ class ShareManager:
         if not (is_directory or os.path.isfile(abs_path)):
             raise FileNotFoundError("Only files or directories can be shared.")
 
-        with self._lock:
-            data = self._load()
-            token = self._generate_unique_token(data)
-            archive_name = None
-            if is_directory:
-                archive_name = self._build_archive(abs_path, token)
+        while True:
             record = ShareRecord(
-                token=token,
+                token=generate_random_string(secrets_length()),
                 path=abs_path,
                 is_directory=is_directory,
-                archive_name=archive_name,
+                archive_name=None,
                 created_at=time.time(),
                 max_downloads=max_downloads if max_downloads else None,
                 download_count=0,
                 expire_at=expire_at,
                 allowed_ips=[ip.strip() for ip in (allowed_ips or []) if ip.strip()],
+                archive_mode=archive_mode,
+                compression=compression,
+                archive_format=archive_format,
             )
-            data[token] = record.to_dict()
-            self._save(data)
-            return record
+            # A token collision is retried with a fresh token.
+            if self._store.insert(record.to_dict()):
+                break
+        if expire_at:
+            self._expiry.schedule(record.token, expire_at)
+        if is_directory and archive_mode == ARCHIVE_MODE_CACHED:
+            # Queue the archive build; the share is usable once it is ready.
+            self._archives.schedule(abs_path, record.token, compression)
+        return record
 
-    def _generate_unique_token(self, existing: Optional[Dict[str, Dict]] = None) -> str:
-        existing = existing or self._load()
-        while True:
-            token = generate_random_string(secrets_length())
-            if token not in existing:
-                return token
+    def get_archive_status(self, token: str) -> Optional[Dict]:
+        """Progress of the background archive build for ``token``, if any is known."""
+        status = self._archives.status(token)
+        return status.to_dict() if status else None
 
     def get_share(self, token: str) -> Optional[Dict]:
-        with self._lock:
-            return self._load().get(token)
+        return self._store.get(token)
 
     def delete_share(self, token: str) -> None:
-        with self._lock:
-            data = self._load()
-            record = data.pop(token, None)
-            if record:
-                archive_name = record.get("archive_name")
-                if archive_name:
-                    self._remove_archive(archive_name)
-                self._save(data)
-
-    def validate_and_register_download(self, token: str, client_ip: str) -> Optional[Dict[str, str]]:
-        with self._lock:
-            data = self._load()
-            record = data.get(token)
-            if not record:
-                return None
-            now = time.time()
-            expire_at = record.get("expire_at")
-            if expire_at and expire_at < now:
-                archive_name = record.get("archive_name")
-                if archive_name:
-                    self._remove_archive(archive_name)
-                data.pop(token, None)
-                self._save(data)
-                return None
-            allowed_ips = record.get("allowed_ips") or []
-            if allowed_ips and client_ip not in allowed_ips:
+        record = self._store.delete(token)
+        if record is not None:
+            self._release(record)
+        else:
+            self._download_sessions.invalidate_token(token)
+
+    def validate_and_register_download(
+        self, token: str, client_ip: str, range_header: Optional[str] = None
+    ) -> Optional[Dict[str, str]]:
+        """
+        Admit a download of ``token`` for ``client_ip``.
+
+        When ``range_header`` continues a download (every range starts past
+        the first byte) and the client holds a live download session for this
+        share, the session is reused and no further download is registered.
+        A session lasts a fixed time, and the sessions of a share are dropped
+        once its last allowed download is registered; that one is not
+        resumable.
+
+        Streamed directory shares are returned with ``stream`` set and ``path``
+        pointing at the source directory; the caller generates the archive.
+
+        Raises:
+            ArchivePreparing: If the share's zip is still being built
+            ArchiveBuildError: If the share's zip could not be built
+        """
+        if range_header:
+            download = self._download_sessions.get_session(token, client_ip)
+            if download is not None:
+                try:
+                    size = os.path.getsize(download["path"])
+                except OSError:
+                    size = None
+                if size is not None and continues_download(range_header, size):
+                    return download
+
+        record = self._admit(token, client_ip)
+        if record is None:
+            return None
+        source_path = record["path"]
+        is_directory = record.get("is_directory", False)
+        stream = is_directory and record.get("archive_mode") == ARCHIVE_MODE_STREAM
+        compression = record.get("compression", DEFAULT_COMPRESSION)
+        archive_format = record.get("archive_format", ARCHIVE_FORMAT_ZIP)
+
+        archive_name = None
+        if stream:
+            if not os.path.isdir(source_path):
+                self.delete_share(token)
                 return None
-            max_downloads = record.get("max_downloads")
-            current = record.get("download_count", 0)
-            if max_downloads is not None and current >= max_downloads:
-                archive_name = record.get("archive_name")
-                if archive_name:
-                    self._remove_archive(archive_name)
-                data.pop(token, None)
-                self._save(data)
+        elif is_directory:
+            # Fingerprinting happens outside any lock and builds run on the
+            # background queue, so request threads never compress.
+            try:
+                status = self._archives.prepare(source_path, token, compression)
+            except FileNotFoundError:
+                self.delete_share(token)
                 return None
+            if status.state != ARCHIVE_STATE_READY:
+                raise ArchivePreparing(status)
+            archive_name = status.archive_name
 
-            is_directory = record.get("is_directory", False)
-            if is_directory:
-                try:
-                    archive_name = self._build_archive(record["path"], record["token"])
-                except FileNotFoundError:
-                    archive_name = record.get("archive_name")
-                    if archive_name:
-                        self._remove_archive(archive_name)
-                    data.pop(token, None)
-                    self._save(data)
-                    return None
-                record["archive_name"] = archive_name
-                download_path = os.path.join(self._archive_dir, archive_name)
-                filename = archive_name
-                mime = "application/zip"
-            else:
-                download_path = record["path"]
-                filename = os.path.basename(download_path)
-                mime = None
-
-            record["download_count"] = current + 1
-            data[token] = record
-            self._save(data)
-
-            return {
-                "path": download_path,
-                "filename": filename,
-                "mime": mime,
-                "is_directory": is_directory,
-            }
-
-    def _build_archive(self, source_path: str, token: str) -> str:
-        if not os.path.exists(source_path):
-            raise FileNotFoundError('Directory to share is no longer available.')
-        base_name = os.path.basename(source_path.rstrip(os.sep)) or "root"
-        safe_base = re.sub(r"[^A-Za-z0-9._-]", "_", base_name)[:80] or "archive"
-        archive_name = f"{safe_base}-{token}.zip"
-        archive_path = os.path.join(self._archive_dir, archive_name)
+        changes = {"archive_name": archive_name} if archive_name else {}
+        # Counted atomically: the share may have been deleted or exhausted meanwhile.
+        previous = self._store.register_download(token, time.time(), changes)
+        if previous is None:
+            self._admit(token, client_ip)  # drops the share if it is now used up
+            return None
+        if stream:
+            download_path = source_path
+            filename = f"{archive_base_name(source_path)}.{archive_format}"
+            mime = ARCHIVE_MIME_TYPES[archive_format]
+        elif is_directory:
+            if previous.get("archive_name") and previous["archive_name"] != archive_name:
+                self._remove_archive(previous["archive_name"])
+            download_path = os.path.join(self._archive_dir, archive_name)
+            filename = archive_name
+            mime = "application/zip"
+        else:
+            download_path = source_path
+            filename = os.path.basename(download_path)
+            mime = None
+
+        download = {
+            "path": download_path,
+            "filename": filename,
+            "mime": mime,
+            "is_directory": is_directory,
+            "stream": stream,
+            "compression": compression,
+            "archive_format": archive_format,
+        }
+        max_downloads = previous.get("max_downloads")
+        if max_downloads is not None and previous.get("download_count", 0) + 1 >= max_downloads:
+            # Used up: no download of this share may be resumed any more.
+            self._download_sessions.invalidate_token(token)
+        elif not stream:
+            # Streamed archives cannot be resumed, so there is nothing to admit later.
+            self._download_sessions.open_session(token, client_ip, download, record.get("expire_at"))
+        return download
+
+    def _admit(self, token: str, client_ip: str) -> Optional[Dict]:
+        """
+        Return the record for ``token`` if ``client_ip`` may download it.
 
-        with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
-            zf.writestr(f"{safe_base}/", "")
-            for root, dirs, files in os.walk(source_path):
-                rel_root = os.path.relpath(root, start=source_path)
-                folder_arc = os.path.join(safe_base, rel_root) if rel_root != "." else safe_base
-                if not files and not dirs:
-                    zf.writestr(f"{folder_arc}/", "")
-                for name in files:
-                    file_path = os.path.join(root, name)
-                    rel_path = os.path.relpath(file_path, start=source_path)
-                    arcname = os.path.join(safe_base, rel_path)
-                    zf.write(file_path, arcname=arcname)
-        return archive_name
+        Exhausted shares are removed; expired ones are left to the scheduler.
+        """
+        record = self._store.get(token)
+        if not record or _expired(record, time.time()):
+            return None
+        allowed_ips = record.get("allowed_ips") or []
+        if allowed_ips and client_ip not in allowed_ips:
+            return None
+        max_downloads = record.get("max_downloads")
+        if max_downloads is not None and record.get("download_count", 0) >= max_downloads:
+            self.delete_share(token)
+            return None
+        return record
+
+    def _expire(self, token: str) -> None:
+        """Scheduler callback: remove ``token`` if it is (still) expired."""
+        record = self._store.get(token)
+        if record and _expired(record, time.time()):
+            self.delete_share(token)
+
+    def _release(self, record: Dict) -> None:
+        """Clean up after a removed share: sessions and archive."""
+        self._download_sessions.invalidate_token(record["token"])
+        if record.get("archive_name"):
+            self._remove_archive(record["archive_name"])
+        if record.get("is_directory"):
+            self._archives.discard(record["path"], record["token"])
 
     def _remove_archive(self, archive_name: str) -> None:
         archive_path = os.path.join(self._archive_dir, archive_name)
@@ -223,5 +318,45 @@ class ShareManager:
             pass
 
 
+def _expired(record: Dict, now: float) -> bool:
+    expire_at = record.get("expire_at")
+    return bool(expire_at) and expire_at <= now
+
+
+def migrate_json_shares(store: SQLiteShareStore, json_path: str) -> Optional[int]:
+    """
+    Import ``shares.json`` into ``store`` once; the file is then renamed to ``*.migrated``.
+
+    Changes still in ``shares.json.journal`` (the journaled JSON backend) are
+    replayed first, and the journal is renamed as well.
+
+    Returns:
+        Number of shares imported, or None if the import had already happened.
+    """
+
+    journal_path = f"{json_path}.journal"
+
+    def load() -> List[Dict]:
+        if not (os.path.exists(json_path) or os.path.exists(journal_path)):
+            return []
+        storage = JournaledJSONStorage(json_path)
+        data = dict(storage.read())
+        storage.close()
+        known = {field.name for field in dataclass_fields(ShareRecord)}
+        records = []
+        for token, entry in data.items():
+            # Older records lack newer fields; ShareRecord fills in the defaults.
+            values = {key: value for key, value in entry.items() if key in known}
+            records.append(ShareRecord(**{**values, "token": token}).to_dict())
+        return records
+
+    imported = store.migrate(os.path.basename(json_path), load)
+    if imported is not None:
+        for path in (json_path, journal_path):
+            if os.path.exists(path):
+                os.replace(path, f"{path}.migrated")
+    return imported
+
+
 def secrets_length() -> int:
     return 8 + secrets.randbelow(3)
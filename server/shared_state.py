@@ -0,0 +1,231 @@
+"""SQLite-backed runtime state shared by pre-forked worker processes.
+
+Each class mirrors the interface of its in-memory counterpart
+(``SessionManager``, ``RateLimiter``, ``DownloadSessionManager``) so the
+request handler does not care which one it is given.
+"""
+
+from __future__ import annotations
+
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from .download_session import DEFAULT_TTL_SECONDS
+from .session import Session
+
+BUSY_TIMEOUT_SECONDS = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username);
+CREATE TABLE IF NOT EXISTS login_attempts (
+    identifier TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    first_attempt REAL NOT NULL,
+    locked_until REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS download_sessions (
+    token TEXT NOT NULL,
+    client_ip TEXT NOT NULL,
+    download TEXT NOT NULL,
+    share_expire_at REAL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (token, client_ip)
+);
+"""
+
+
+class SharedStateDB:
+    """One SQLite database (WAL mode) with a connection per thread."""
+
+    def __init__(self, path: str, schema: str = _SCHEMA) -> None:
+        self._path = path
+        self._local = threading.local()
+        self._connect().executescript(schema)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the block in a write transaction (``BEGIN IMMEDIATE``)."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        return self._connect().execute(sql, params).fetchall()
+
+
+class SharedSessionManager:
+    def __init__(self, db: SharedStateDB, max_sessions_per_user: int = 3) -> None:
+        self._db = db
+        self._max_sessions_per_user = max_sessions_per_user
+
+    def create_session(self, username: str, ttl_minutes: int) -> str:
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            rows = conn.execute(
+                "SELECT token FROM sessions WHERE username = ? ORDER BY expires_at",
+                (username,),
+            ).fetchall()
+            # Drop the oldest sessions beyond the per-user limit.
+            excess = len(rows) - self._max_sessions_per_user + 1
+            for (old_token,) in rows[:max(0, excess)]:
+                conn.execute("DELETE FROM sessions WHERE token = ?", (old_token,))
+            conn.execute(
+                "INSERT INTO sessions (token, username, expires_at) VALUES (?, ?, ?)",
+                (token, username, now + ttl_minutes * 60),
+            )
+        return token
+
+    def get_session(self, token: Optional[str]) -> Optional[Session]:
+        if not token:
+            return None
+        rows = self._db.query("SELECT username, expires_at FROM sessions WHERE token = ?", (token,))
+        if not rows:
+            return None
+        username, expires_at = rows[0]
+        if expires_at < time.time():
+            self.invalidate(token)
+            return None
+        return Session(username=username, expires_at=expires_at)
+
+    def invalidate(self, token: Optional[str]) -> None:
+        if not token:
+            return
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+
+class SharedRateLimiter:
+    def __init__(
+        self,
+        db: SharedStateDB,
+        max_attempts: int = 5,
+        window_seconds: int = 300,
+        lockout_seconds: int = 300,
+    ) -> None:
+        self._db = db
+        self._max_attempts = max_attempts
+        self._window_seconds = window_seconds
+        self._lockout_seconds = lockout_seconds
+
+    def is_allowed(self, identifier: str) -> bool:
+        now = time.time()
+        with self._db.transaction() as conn:
+            conn.execute(
+                "DELETE FROM login_attempts WHERE locked_until < ? AND first_attempt < ?",
+                (now, now - self._window_seconds),
+            )
+            row = conn.execute(
+                "SELECT count, first_attempt, locked_until FROM login_attempts WHERE identifier = ?",
+                (identifier,),
+            ).fetchone()
+            if row is None:
+                return True
+            count, first_attempt, locked_until = row
+            if locked_until > now:
+                return False
+            if now - first_attempt > self._window_seconds:
+                conn.execute("DELETE FROM login_attempts WHERE identifier = ?", (identifier,))
+                return True
+            return count < self._max_attempts
+
+    def record_failed_attempt(self, identifier: str) -> None:
+        now = time.time()
+        with self._db.transaction() as conn:
+            row = conn.execute(
+                "SELECT count, first_attempt FROM login_attempts WHERE identifier = ?",
+                (identifier,),
+            ).fetchone()
+            if row is None or now - row[1] > self._window_seconds:
+                count, first_attempt = 1, now
+            else:
+                count, first_attempt = row[0] + 1, row[1]
+            locked_until = now + self._lockout_seconds if count >= self._max_attempts else 0.0
+            conn.execute(
+                "INSERT OR REPLACE INTO login_attempts (identifier, count, first_attempt, locked_until) "
+                "VALUES (?, ?, ?, ?)",
+                (identifier, count, first_attempt, locked_until),
+            )
+
+    def record_successful_attempt(self, identifier: str) -> None:
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM login_attempts WHERE identifier = ?", (identifier,))
+
+    def get_remaining_lockout(self, identifier: str) -> int:
+        rows = self._db.query(
+            "SELECT locked_until FROM login_attempts WHERE identifier = ?", (identifier,)
+        )
+        if not rows:
+            return 0
+        return max(0, int(rows[0][0] - time.time()))
+
+
+class SharedDownloadSessionManager:
+    def __init__(self, db: SharedStateDB, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> None:
+        self._db = db
+        self._ttl_seconds = ttl_seconds
+
+    def open_session(
+        self,
+        token: str,
+        client_ip: str,
+        download: Dict,
+        share_expire_at: Optional[float] = None,
+    ) -> None:
+        now = time.time()
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM download_sessions WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO download_sessions "
+                "(token, client_ip, download, share_expire_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (token, client_ip, json.dumps(download), share_expire_at, now + self._ttl_seconds),
+            )
+
+    def get_session(self, token: str, client_ip: str) -> Optional[Dict]:
+        """Return the admitted download for (token, client) while its session lasts."""
+        now = time.time()
+        with self._db.transaction() as conn:
+            row = conn.execute(
+                "SELECT download, share_expire_at, expires_at FROM download_sessions "
+                "WHERE token = ? AND client_ip = ?",
+                (token, client_ip),
+            ).fetchone()
+            if row is None:
+                return None
+            download, share_expire_at, expires_at = row
+            if expires_at <= now or (share_expire_at and share_expire_at <= now):
+                conn.execute(
+                    "DELETE FROM download_sessions WHERE token = ? AND client_ip = ?",
+                    (token, client_ip),
+                )
+                return None
+        return json.loads(download)
+
+    def invalidate_token(self, token: str) -> None:
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM download_sessions WHERE token = ?", (token,))
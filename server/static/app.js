@@ -1,5 +1,8 @@
 (function () {
   const LANG_STORAGE_KEY = 'sfs_lang';
+  const SHARE_POLL_INTERVAL_MS = 2000;
+  // Huge directories are fetched a page at a time.
+  const LISTING_PAGE_SIZE = 500;
   const TRANSLATIONS = {
     zh: {
       documentTitle: 'Secure File Share 控制台',
@@ -26,6 +29,8 @@
       generateShare: '生成分享链接',
       selectedNone: '未选择文件',
       selectedFolderSuffix: '（文件夹，将自动打包为 ZIP）',
+      selectedFolderUsage: '共 {files} 个文件，{size}',
+      selectedFolderCounting: '正在统计：已找到 {files} 个文件，{size}…',
       sessionUserLabel: '管理员：{username}',
       sessionExpiryLabel: '会话到期：{time}',
       sessionExpiringSoon: '即将过期',
@@ -57,10 +62,19 @@
       shareFileButton: '分享文件',
       shareActionsPlaceholder: '—',
       shareCreateSuccessFile: '分享创建成功：{link}',
-      shareCreateSuccessDir: '文件夹已打包为 ZIP，分享链接：{link}',
+      shareCreateSuccessDir: '文件夹正在后台打包，分享链接：{link}',
+      shareMetaArchivePreparing: '打包中：{done}/{total} 个文件',
+      shareMetaArchiveReady: '压缩包已就绪',
+      shareMetaArchiveFailed: '打包失败',
       shareCreateFail: '创建分享失败。',
       shareNeedsSelection: '请选择需要分享的文件或文件夹。',
       pathAccessDenied: '无法访问该路径。',
+      loadMoreEntries: '加载更多（已显示 {shown} / {total}）',
+      searchPlaceholder: '搜索文件名（支持 * 和 ?）',
+      searchSummary: '“{query}”：找到 {count} 项',
+      searchSummaryTruncated: '“{query}”：仅显示前 {count} 项',
+      searchIndexing: '索引仍在建立，结果可能不完整。',
+      searchFailed: '搜索失败。',
       bookmarkAddFail: '添加书签失败。',
       requestFailed: '请求失败',
       langToggleOtherLabel: 'English',
@@ -108,6 +122,8 @@
       generateShare: 'Generate Share',
       selectedNone: 'No selection',
       selectedFolderSuffix: ' (folder – delivered as ZIP)',
+      selectedFolderUsage: ' – {files} files, {size}',
+      selectedFolderCounting: ' – counting: {files} files, {size} so far…',
       sessionUserLabel: 'Admin: {username}',
       sessionExpiryLabel: 'Session expires in: {time}',
       sessionExpiringSoon: 'expiring soon',
@@ -139,10 +155,19 @@
       shareFileButton: 'Share file',
       shareActionsPlaceholder: '—',
       shareCreateSuccessFile: 'Share created: {link}',
-      shareCreateSuccessDir: 'Folder compressed to ZIP. Share link: {link}',
+      shareCreateSuccessDir: 'Folder is being packed in the background. Share link: {link}',
+      shareMetaArchivePreparing: 'Packing: {done}/{total} files',
+      shareMetaArchiveReady: 'Archive ready',
+      shareMetaArchiveFailed: 'Packing failed',
       shareCreateFail: 'Failed to create share.',
       shareNeedsSelection: 'Select a file or folder to share.',
       pathAccessDenied: 'Unable to access this path.',
+      loadMoreEntries: 'Load more ({shown} of {total} shown)',
+      searchPlaceholder: 'Search file names (* and ? allowed)',
+      searchSummary: '{count} matches for "{query}"',
+      searchSummaryTruncated: 'First {count} matches for "{query}"',
+      searchIndexing: 'The index is still being built; results may be incomplete.',
+      searchFailed: 'Search failed.',
       bookmarkAddFail: 'Failed to add bookmark.',
       requestFailed: 'Request failed',
       langToggleOtherLabel: '中文',
@@ -173,12 +198,17 @@
     selectedFile: null,
     selectedIsDir: false,
     selectedRow: null,
+    selectedUsage: null,
     shares: [],
     bookmarks: [],
     showHidden: false,
+    sortKey: 'name',
+    sortOrder: 'asc',
     session: null,
     currentListing: null,
+    loadingMore: false,
     downloadsRoot: '',
+    sharePollTimer: null,
   };
 
   const els = {
@@ -195,6 +225,7 @@
     langToggle: document.getElementById('lang-toggle'),
     fileBrowserTitle: document.getElementById('file-browser-title'),
     goPath: document.getElementById('go-path'),
+    searchInput: document.getElementById('search-input'),
     pathInput: document.getElementById('path-input'),
     toggleHidden: document.getElementById('toggle-hidden'),
     toggleHiddenLabel: document.querySelector('#toggle-hidden-label span'),
@@ -317,6 +348,19 @@
         }
       });
     }
+    if (els.searchInput) {
+      els.searchInput.addEventListener('keydown', (event) => {
+        if (event.key === 'Enter') {
+          event.preventDefault();
+          const query = (els.searchInput.value || '').trim();
+          if (query) {
+            runSearch(query);
+          } else {
+            changeDirectory(state.currentPath);
+          }
+        }
+      });
+    }
     if (els.shareForm) {
       els.shareForm.addEventListener('submit', handleShareSubmit);
     }
@@ -335,9 +379,25 @@
     if (els.downloadForm) {
       els.downloadForm.addEventListener('submit', handleDownloadSubmit);
     }
+    [[els.thName, 'name'], [els.thSize, 'size'], [els.thModified, 'modified']].forEach(([th, key]) => {
+      if (th) {
+        th.dataset.sort = key;
+        th.addEventListener('click', () => setSort(key));
+      }
+    });
     document.addEventListener('keydown', handleGlobalKeyDown);
   }
 
+  function setSort(key) {
+    if (state.sortKey === key) {
+      state.sortOrder = state.sortOrder === 'asc' ? 'desc' : 'asc';
+    } else {
+      state.sortKey = key;
+      state.sortOrder = 'asc';
+    }
+    void changeDirectory(state.currentPath);
+  }
+
   function setLanguage(lang) {
     if (!TRANSLATIONS[lang]) {
       lang = 'en';
@@ -514,6 +574,7 @@
     setText(els.fileBrowserTitle, t('fileBrowserTitle'));
     setText(els.goPath, t('jump'));
     setText(els.toggleHiddenLabel, t('toggleHidden'));
+    setAttr(els.searchInput, 'placeholder', t('searchPlaceholder'));
     setText(els.sharePanelTitle, t('sharePanelTitle'));
     setText(els.maxDownloadsLabelText, t('maxDownloadsLabel'));
     setText(els.expiresHoursLabelText, t('expiresHoursLabel'));
@@ -638,11 +699,36 @@
       const data = await apiGet('/api/shares');
       state.shares = data.shares || [];
       renderShares();
+      scheduleSharePoll();
     } catch (err) {
       console.error(err);
     }
   }
 
+  function scheduleSharePoll() {
+    // Refresh the list while any folder archive is still being built.
+    const preparing = state.shares.some((share) => share.archive_status && share.archive_status.state === 'preparing');
+    if (preparing && !state.sharePollTimer) {
+      state.sharePollTimer = window.setTimeout(() => {
+        state.sharePollTimer = null;
+        loadShares();
+      }, SHARE_POLL_INTERVAL_MS);
+    }
+  }
+
+  function archiveStatusText(status) {
+    if (!status) {
+      return null;
+    }
+    if (status.state === 'preparing') {
+      return t('shareMetaArchivePreparing', { done: status.files_done, total: status.files_total });
+    }
+    if (status.state === 'failed') {
+      return t('shareMetaArchiveFailed');
+    }
+    return t('shareMetaArchiveReady');
+  }
+
   function renderShares() {
     if (!els.shareList) {
       return;
@@ -674,6 +760,10 @@
         ipValue,
         typeValue,
       ];
+      const archiveValue = archiveStatusText(share.archive_status);
+      if (archiveValue) {
+        metaParts.push(archiveValue);
+      }
       meta.textContent = metaParts.join(' | ');
 
       const actions = document.createElement('div');
@@ -726,10 +816,23 @@
     }
   }
 
+  function listingUrl(path, cursor) {
+    const params = new URLSearchParams({
+      path,
+      show_hidden: state.showHidden ? '1' : '0',
+      sort: state.sortKey,
+      order: state.sortOrder,
+      limit: String(LISTING_PAGE_SIZE),
+    });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    return `/api/fs?${params.toString()}`;
+  }
+
   async function changeDirectory(path) {
     try {
-      const url = `/api/fs?path=${encodeURIComponent(path)}&show_hidden=${state.showHidden ? '1' : '0'}`;
-      const data = await apiGet(url);
+      const data = await apiGet(listingUrl(path));
       if (typeof data.show_hidden !== 'undefined') {
         state.showHidden = Boolean(data.show_hidden);
         if (els.toggleHidden) {
@@ -773,6 +876,8 @@
       const row = createRow(entry.name, entry.path, entry.is_dir, entry.size, entry.modified);
       els.fsBody.appendChild(row);
     });
+    appendLoadMoreRow(data);
+    updateSortIndicators();
 
     if (preserveSelection && previousSelection) {
       const candidate = Array.from(els.fsBody.querySelectorAll('tr')).find((tr) => tr.dataset.path === previousSelection);
@@ -792,6 +897,109 @@
     updateDownloadTargetField();
   }
 
+  function appendLoadMoreRow(data) {
+    if (!data.next_cursor) {
+      return;
+    }
+    const tr = document.createElement('tr');
+    tr.className = 'fs-load-more';
+    const td = document.createElement('td');
+    td.colSpan = 4;
+    const button = document.createElement('button');
+    button.type = 'button';
+    button.className = 'ghost';
+    button.textContent = t('loadMoreEntries', {
+      shown: (data.entries || []).length,
+      total: data.total,
+    });
+    button.addEventListener('click', () => loadMoreEntries(tr));
+    td.appendChild(button);
+    tr.appendChild(td);
+    els.fsBody.appendChild(tr);
+  }
+
+  async function loadMoreEntries(loadMoreRow) {
+    const listing = state.currentListing;
+    if (!listing || !listing.next_cursor || state.loadingMore) {
+      return;
+    }
+    state.loadingMore = true;
+    try {
+      const data = await apiGet(listingUrl(listing.path, listing.next_cursor));
+      if (state.currentListing !== listing) {
+        return; // navigated elsewhere meanwhile
+      }
+      loadMoreRow.remove();
+      (data.entries || []).forEach((entry) => {
+        listing.entries.push(entry);
+        els.fsBody.appendChild(createRow(entry.name, entry.path, entry.is_dir, entry.size, entry.modified));
+      });
+      listing.next_cursor = data.next_cursor;
+      listing.total = data.total;
+      appendLoadMoreRow(listing);
+    } catch (err) {
+      flashShareFeedback(t('pathAccessDenied'));
+      console.error(err);
+    } finally {
+      state.loadingMore = false;
+    }
+  }
+
+  async function runSearch(query) {
+    const params = new URLSearchParams({ q: query });
+    if (state.showHidden) {
+      params.set('show_hidden', '1');
+    }
+    try {
+      renderSearchResults(await apiGet(`/api/search?${params.toString()}`));
+    } catch (err) {
+      flashShareFeedback(t('searchFailed'));
+      console.error(err);
+    }
+  }
+
+  function renderSearchResults(data) {
+    if (!els.fsBody) {
+      return;
+    }
+    // Results replace the listing until a directory is opened again.
+    state.currentListing = null;
+    state.selectedFile = null;
+    state.selectedIsDir = false;
+    state.selectedRow = null;
+    els.fsBody.innerHTML = '';
+
+    const results = data.results || [];
+    const summary = document.createElement('tr');
+    summary.className = 'fs-search-summary';
+    const td = document.createElement('td');
+    td.colSpan = 4;
+    const vars = { query: data.query, count: results.length };
+    td.textContent = t(data.truncated ? 'searchSummaryTruncated' : 'searchSummary', vars);
+    if (data.indexing) {
+      td.textContent += ` ${t('searchIndexing')}`;
+    }
+    summary.appendChild(td);
+    els.fsBody.appendChild(summary);
+
+    results.forEach((entry) => {
+      els.fsBody.appendChild(createRow(entry.path, entry.path, entry.is_dir, entry.size, entry.modified));
+    });
+    updateSelectedFile();
+  }
+
+  function updateSortIndicators() {
+    [els.thName, els.thSize, els.thModified].forEach((th) => {
+      if (!th) {
+        return;
+      }
+      th.classList.remove('sorted-asc', 'sorted-desc');
+      if (th.dataset.sort === state.sortKey) {
+        th.classList.add(state.sortOrder === 'desc' ? 'sorted-desc' : 'sorted-asc');
+      }
+    });
+  }
+
   function createRow(name, fullPath, isDir, size, modified) {
     const tr = document.createElement('tr');
     tr.dataset.path = fullPath;
@@ -859,7 +1067,32 @@
     state.selectedRow = row;
     state.selectedFile = path;
     state.selectedIsDir = Boolean(isDir);
+    state.selectedUsage = null;
     updateSelectedFile();
+    if (state.selectedIsDir) {
+      loadSelectedUsage(path);
+    }
+  }
+
+  async function loadSelectedUsage(path) {
+    // The server answers within a few seconds with the totals so far; ask
+    // again until the walk is complete or another entry is selected.
+    while (state.selectedFile === path) {
+      let usage;
+      try {
+        usage = await apiGet(`/api/fs/usage?path=${encodeURIComponent(path)}`);
+      } catch (err) {
+        return;
+      }
+      if (state.selectedFile !== path) {
+        return;
+      }
+      state.selectedUsage = usage;
+      updateSelectedFile();
+      if (usage.complete) {
+        return;
+      }
+    }
   }
 
   function updateSelectedFile() {
@@ -868,7 +1101,14 @@
     }
     if (state.selectedFile) {
       const suffix = state.selectedIsDir ? t('selectedFolderSuffix') : '';
-      els.selectedFile.textContent = `${state.selectedFile}${suffix}`;
+      const usage = state.selectedUsage;
+      const usageText = usage
+        ? t(usage.complete ? 'selectedFolderUsage' : 'selectedFolderCounting', {
+          files: usage.files.toLocaleString(),
+          size: formatBytes(usage.bytes),
+        })
+        : '';
+      els.selectedFile.textContent = `${state.selectedFile}${suffix}${usageText}`;
       if (els.shareSubmit) {
         els.shareSubmit.disabled = false;
       }
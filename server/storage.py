@@ -1,36 +1,274 @@
+import fcntl
 import json
 import os
 import threading
-from typing import Any
+from typing import Any, Dict, Optional
+
+# How long a change may sit in memory before it is written out.
+DEFAULT_FLUSH_INTERVAL_SECONDS = 1.0
+# A journal is folded into its snapshot once it is larger than the snapshot
+# (so rewrites cost O(1) per change amortized), but not before this size.
+DEFAULT_MIN_COMPACT_BYTES = 256 * 1024  # 256 KiB
+
+
+class InterProcessLock:
+    """
+    Re-entrant lock shared by threads of this process and by other processes.
+
+    Threads are serialized by an RLock; processes by ``flock`` on ``path``,
+    which is taken when the outermost holder enters and dropped when it exits.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "InterProcessLock":
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
 
 
 class JSONStorage:
-    def __init__(self, path: str, default: Any):
+    """
+    JSON document held in memory and persisted to ``path``.
+
+    ``read()`` returns the in-memory copy itself: callers mutate it only while
+    holding ``lock`` and then pass it to ``write()``. The file is parsed again
+    only after another process has replaced it, which is detected through a
+    change counter kept in the lock file.
+
+    With a positive ``flush_interval``, ``write()`` just marks the copy dirty
+    and a background thread saves it at most that often, so a burst of
+    updates costs a single (compact) serialization; ``flush()`` and
+    ``close()`` save straight away. With ``0`` every write goes to disk
+    immediately, which is required while other processes update the file.
+    """
+
+    def __init__(self, path: str, default: Any, flush_interval: float = 0.0):
+        self.path = path
         self._path = path
         self._default = default
-        self._lock = threading.RLock()
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        if not os.path.exists(path):
-            self._write(default)
-
-    def _write(self, data: Any) -> None:
-        tmp_path = f"{self._path}.tmp"
-        with open(tmp_path, "w", encoding="utf-8") as fh:
-            json.dump(data, fh, ensure_ascii=False, indent=2, sort_keys=True)
-        os.replace(tmp_path, self._path)
+        # Also guards read-modify-write sequences of the managers using this file.
+        self.lock = InterProcessLock(f"{path}.lock")
+        self._counter_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        self._data: Any = None
+        self._version = -1
+        self._dirty = False
+        self._flush_interval = 0.0
+        self._flusher: Optional[threading.Thread] = None
+        self._interval_changed = threading.Event()
+        with self.lock:
+            if not os.path.exists(path):
+                self._data = default
+                self._save()
+        self.set_flush_interval(flush_interval)
 
     def read(self) -> Any:
-        with self._lock:
-            with open(self._path, "r", encoding="utf-8") as fh:
-                return json.load(fh)
+        with self.lock:
+            if self._dirty:
+                return self._data
+            version = self._disk_version()
+            if self._data is None or version != self._version:
+                with open(self._path, "r", encoding="utf-8") as fh:
+                    self._data = json.load(fh)
+                self._version = version
+            return self._data
 
     def atomic_update(self, update_fn) -> Any:
-        with self._lock:
-            data = self.read()
-            new_data = update_fn(data)
-            self._write(new_data)
+        with self.lock:
+            new_data = update_fn(self.read())
+            self.write(new_data)
             return new_data
 
     def write(self, data: Any) -> None:
-        with self._lock:
-            self._write(data)
+        with self.lock:
+            self._data = data
+            if self._flush_interval > 0:
+                self._dirty = True
+            else:
+                self._save()
+
+    def flush(self) -> None:
+        """Write pending changes to disk now."""
+        with self.lock:
+            if self._dirty:
+                self._save()
+
+    def set_flush_interval(self, seconds: float) -> None:
+        """
+        Change how long writes may be held in memory.
+
+        Args:
+            seconds: Maximum delay before a change reaches the file; ``0``
+                flushes pending changes and writes through from now on.
+        """
+        with self.lock:
+            self._flush_interval = max(0.0, seconds)
+            if self._flush_interval == 0:
+                self.flush()
+            elif self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_periodically, name="storage-flush", daemon=True
+                )
+                self._flusher.start()
+            # Wake the flusher, which waits out the interval it last saw, so
+            # that it picks up the new one or exits.
+            self._interval_changed.set()
+
+    def close(self) -> None:
+        """Flush pending changes; later writes go straight to disk."""
+        self.set_flush_interval(0)
+
+    def _flush_periodically(self) -> None:
+        while True:
+            if self._interval_changed.wait(self._flush_interval or None):
+                self._interval_changed.clear()
+                with self.lock:
+                    # Decided under the lock: set_flush_interval() either sees
+                    # this thread gone and starts another, or its new
+                    # interval is seen here.
+                    if self._flush_interval <= 0:
+                        self._flusher = None
+                        return
+            if self._dirty:
+                self.flush()
+
+    def _save(self) -> None:
+        """Atomically replace the file with the in-memory copy. Lock must be held."""
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        # dumps() encodes in one C call; dump() streams through the slower
+        # pure-Python encoder.
+        payload = json.dumps(self._data, ensure_ascii=False, separators=(",", ":"))
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.write(payload)
+        os.replace(tmp_path, self._path)
+        self._version = self._disk_version() + 1
+        os.pwrite(self._counter_fd, self._version.to_bytes(8, "little"), 0)
+        self._dirty = False
+
+    def _disk_version(self) -> int:
+        """Number of times any process has saved the file. Lock must be held."""
+        raw = os.pread(self._counter_fd, 8, 0)
+        return int.from_bytes(raw, "little") if len(raw) == 8 else 0
+
+
+class JournaledJSONStorage:
+    """
+    JSON object of records (``key -> dict``) kept as a snapshot plus a journal.
+
+    Every change is appended to ``<path>.journal`` as one JSON line, so an
+    update costs a small append instead of rewriting the whole snapshot. The
+    journal is replayed on load (and whenever another process has appended
+    to it) and folded into the snapshot once it outgrows it, and on
+    ``close()``. Entries carry absolute values, so replaying entries that
+    are already part of the snapshot (after a crash between rewriting the
+    snapshot and truncating the journal) changes nothing.
+
+    ``read()`` returns the live in-memory copy: treat it as read-only and
+    change records through ``put``/``update``/``delete`` under ``lock``.
+    """
+
+    def __init__(self, path: str, min_compact_bytes: int = DEFAULT_MIN_COMPACT_BYTES):
+        self._snapshot = JSONStorage(path, {})
+        self.lock = self._snapshot.lock
+        self._min_compact_bytes = min_compact_bytes
+        self._journal_fd = os.open(f"{path}.journal", os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self._data: Optional[Dict[str, Dict]] = None
+        self._offset = 0
+        self._snapshot_size = 0
+
+    def read(self) -> Dict[str, Dict]:
+        with self.lock:
+            data = self._snapshot.read()
+            if data is not self._data:
+                # First load, or another process rewrote the snapshot.
+                self._data = data
+                self._offset = 0
+                self._snapshot_size = os.path.getsize(self._snapshot.path)
+            self._replay()
+            return self._data
+
+    def put(self, key: str, record: Dict) -> None:
+        self._append({"op": "put", "key": key, "record": record})
+
+    def update(self, key: str, changes: Dict[str, Any]) -> None:
+        self._append({"op": "update", "key": key, "changes": changes})
+
+    def delete(self, key: str) -> None:
+        self._append({"op": "delete", "key": key})
+
+    def compact(self) -> None:
+        """Fold the journal into the snapshot and empty it."""
+        with self.lock:
+            data = self.read()
+            self._snapshot.write(data)
+            os.ftruncate(self._journal_fd, 0)
+            self._offset = 0
+            self._snapshot_size = os.path.getsize(self._snapshot.path)
+
+    def close(self) -> None:
+        with self.lock:
+            self.read()
+            if self._offset:
+                self.compact()
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        with self.lock:
+            data = self.read()
+            line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            os.write(self._journal_fd, line)
+            _apply_entry(data, entry)
+            self._offset += len(line)
+            if self._offset >= max(self._min_compact_bytes, self._snapshot_size):
+                self.compact()
+
+    def _replay(self) -> None:
+        """Apply journal entries appended since the last look. Lock must be held."""
+        size = os.fstat(self._journal_fd).st_size
+        if size <= self._offset:
+            return
+        chunk = os.pread(self._journal_fd, size - self._offset, self._offset)
+        # An entry is complete once its newline is there.
+        complete = chunk[: chunk.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn write from a crashed process
+            _apply_entry(self._data, entry)
+        self._offset += len(complete)
+        if len(complete) < len(chunk):
+            # Appends happen under the lock, so a partial last line comes from
+            # a writer that crashed mid-write. Cut it off: the journal is
+            # opened with O_APPEND and the next entry would otherwise be glued
+            # to it and be lost on the next replay.
+            os.ftruncate(self._journal_fd, self._offset)
+
+
+def _apply_entry(data: Dict[str, Dict], entry: Dict[str, Any]) -> None:
+    key = entry["key"]
+    if entry["op"] == "put":
+        data[key] = entry["record"]
+    elif entry["op"] == "update":
+        if key in data:
+            data[key].update(entry["changes"])
+    elif entry["op"] == "delete":
+        data.pop(key, None)
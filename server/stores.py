@@ -0,0 +1,399 @@
+"""Persistence backends for shares and bookmarks.
+
+``ShareManager`` and ``BookmarkManager`` only talk to a store; every store
+method is atomic on its own, also across processes. Two backends exist,
+selected by ``storage.backend`` in the configuration:
+
+* ``json`` keeps each collection in one document (``JSONStorage``);
+  share changes are appended to a journal next to ``shares.json``.
+* ``sqlite`` keeps both in ``data/storage.db`` (WAL mode) with a row per
+  record, so lookups, download counting and expiry sweeps touch only the
+  rows concerned.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .shared_state import SharedStateDB
+from .storage import JournaledJSONStorage, JSONStorage
+
+SHARE_COLUMNS = (
+    "token",
+    "path",
+    "is_directory",
+    "archive_name",
+    "created_at",
+    "max_downloads",
+    "download_count",
+    "expire_at",
+    "allowed_ips",
+    "archive_mode",
+    "compression",
+    "archive_format",
+)
+_SHARE_SELECT = ", ".join(SHARE_COLUMNS)
+# Columns a download may update along with its count.
+_SHARE_UPDATABLE = frozenset(SHARE_COLUMNS) - {"token", "download_count"}
+
+STORAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shares (
+    token TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    is_directory INTEGER NOT NULL,
+    archive_name TEXT,
+    created_at REAL NOT NULL,
+    max_downloads INTEGER,
+    download_count INTEGER NOT NULL DEFAULT 0,
+    expire_at REAL,
+    allowed_ips TEXT NOT NULL,
+    archive_mode TEXT NOT NULL,
+    compression TEXT NOT NULL,
+    archive_format TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shares_expire_at ON shares (expire_at) WHERE expire_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS bookmarks (
+    identifier TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    migrated_at REAL NOT NULL
+);
+"""
+
+
+class ShareStore(ABC):
+    """Share records keyed by token. Records are plain dicts of ``SHARE_COLUMNS``."""
+
+    @abstractmethod
+    def get(self, token: str) -> Optional[Dict]:
+        """The record for ``token``, or None."""
+
+    @abstractmethod
+    def list(self) -> List[Dict]:
+        """All records, oldest first."""
+
+    @abstractmethod
+    def insert(self, record: Dict) -> bool:
+        """Add ``record``; False if its token is already taken."""
+
+    @abstractmethod
+    def delete(self, token: str) -> Optional[Dict]:
+        """Remove and return the record for ``token``, if any."""
+
+    @abstractmethod
+    def register_download(self, token: str, now: float, changes: Dict[str, Any]) -> Optional[Dict]:
+        """
+        Count one download of ``token`` and apply ``changes`` to its record.
+
+        Nothing is changed when the share is missing, expired at ``now`` or
+        out of downloads.
+
+        Returns:
+            The record as it was before the update, or None if refused.
+        """
+
+    @abstractmethod
+    def pop_expired(self, now: float) -> List[Dict]:
+        """Remove and return the records that have expired by ``now``."""
+
+    @abstractmethod
+    def deadlines(self) -> List[Tuple[str, float]]:
+        """``(token, expire_at)`` of every share that expires."""
+
+    def set_flush_interval(self, seconds: float) -> None:
+        """See :meth:`JSONStorage.set_flush_interval`; a no-op for other stores."""
+
+    def close(self) -> None:
+        """Persist pending changes."""
+
+
+class BookmarkStore(ABC):
+    """Bookmarks in creation order, as dicts with identifier, label and path."""
+
+    @abstractmethod
+    def list(self) -> List[Dict]:
+        """All bookmarks, oldest first."""
+
+    @abstractmethod
+    def insert(self, bookmark: Dict) -> bool:
+        """Add ``bookmark``; False if its identifier is already taken."""
+
+    @abstractmethod
+    def delete(self, identifier: str) -> None:
+        """Remove the bookmark ``identifier``, if any."""
+
+    def set_flush_interval(self, seconds: float) -> None:
+        """See :meth:`JSONStorage.set_flush_interval`; a no-op for other stores."""
+
+    def close(self) -> None:
+        """Persist pending changes."""
+
+
+class JSONShareStore(ShareStore):
+    """
+    Shares in ``shares.json`` plus its append-only journal.
+
+    Downloads and deletions are single journal appends; the snapshot is only
+    rewritten when the journal is compacted (see ``JournaledJSONStorage``).
+    """
+
+    def __init__(self, path: str) -> None:
+        self._storage = JournaledJSONStorage(path)
+
+    def get(self, token: str) -> Optional[Dict]:
+        with self._storage.lock:
+            record = self._storage.read().get(token)
+            return dict(record, token=token) if record else None
+
+    def list(self) -> List[Dict]:
+        with self._storage.lock:
+            return [dict(record, token=token) for token, record in self._storage.read().items()]
+
+    def insert(self, record: Dict) -> bool:
+        with self._storage.lock:
+            if record["token"] in self._storage.read():
+                return False
+            self._storage.put(record["token"], dict(record))
+            return True
+
+    def delete(self, token: str) -> Optional[Dict]:
+        with self._storage.lock:
+            record = self._storage.read().get(token)
+            if record is None:
+                return None
+            self._storage.delete(token)
+            return dict(record, token=token)
+
+    def register_download(self, token: str, now: float, changes: Dict[str, Any]) -> Optional[Dict]:
+        with self._storage.lock:
+            record = self._storage.read().get(token)
+            if not record or not _downloadable(record, now):
+                return None
+            previous = dict(record, token=token)
+            # The new count is journaled as a value, not an increment, so
+            # replaying it twice is harmless.
+            self._storage.update(
+                token, dict(changes, download_count=previous.get("download_count", 0) + 1)
+            )
+            return previous
+
+    def pop_expired(self, now: float) -> List[Dict]:
+        with self._storage.lock:
+            removed = [
+                dict(record, token=token)
+                for token, record in self._storage.read().items()
+                if record.get("expire_at") and record["expire_at"] <= now
+            ]
+            for record in removed:
+                self._storage.delete(record["token"])
+            return removed
+
+    def deadlines(self) -> List[Tuple[str, float]]:
+        with self._storage.lock:
+            return [
+                (token, record["expire_at"])
+                for token, record in self._storage.read().items()
+                if record.get("expire_at")
+            ]
+
+    def close(self) -> None:
+        self._storage.close()
+
+
+class JSONBookmarkStore(BookmarkStore):
+    def __init__(self, path: str, flush_interval: float = 0.0) -> None:
+        self._storage = JSONStorage(path, [], flush_interval=flush_interval)
+
+    def list(self) -> List[Dict]:
+        with self._storage.lock:
+            return [dict(bookmark) for bookmark in self._storage.read()]
+
+    def insert(self, bookmark: Dict) -> bool:
+        with self._storage.lock:
+            bookmarks = self._storage.read()
+            if any(b.get("identifier") == bookmark["identifier"] for b in bookmarks):
+                return False
+            bookmarks.append(dict(bookmark))
+            self._storage.write(bookmarks)
+            return True
+
+    def delete(self, identifier: str) -> None:
+        with self._storage.lock:
+            bookmarks = self._storage.read()
+            self._storage.write([b for b in bookmarks if b.get("identifier") != identifier])
+
+    def set_flush_interval(self, seconds: float) -> None:
+        self._storage.set_flush_interval(seconds)
+
+    def close(self) -> None:
+        self._storage.close()
+
+
+class SQLiteShareStore(ShareStore):
+    def __init__(self, db: SharedStateDB) -> None:
+        self._db = db
+
+    def get(self, token: str) -> Optional[Dict]:
+        rows = self._db.query(f"SELECT {_SHARE_SELECT} FROM shares WHERE token = ?", (token,))
+        return _share_from_row(rows[0]) if rows else None
+
+    def list(self) -> List[Dict]:
+        rows = self._db.query(f"SELECT {_SHARE_SELECT} FROM shares ORDER BY rowid")
+        return [_share_from_row(row) for row in rows]
+
+    def insert(self, record: Dict) -> bool:
+        try:
+            with self._db.transaction() as conn:
+                _insert_share(conn, record)
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def delete(self, token: str) -> Optional[Dict]:
+        with self._db.transaction() as conn:
+            row = conn.execute(f"SELECT {_SHARE_SELECT} FROM shares WHERE token = ?", (token,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM shares WHERE token = ?", (token,))
+        return _share_from_row(row)
+
+    def register_download(self, token: str, now: float, changes: Dict[str, Any]) -> Optional[Dict]:
+        unknown = set(changes) - _SHARE_UPDATABLE
+        if unknown:
+            raise ValueError(f"Cannot update share fields: {', '.join(sorted(unknown))}")
+        assignments = "".join(f", {column} = ?" for column in changes)
+        values = [_share_value(column, value) for column, value in changes.items()]
+        with self._db.transaction() as conn:
+            row = conn.execute(f"SELECT {_SHARE_SELECT} FROM shares WHERE token = ?", (token,)).fetchone()
+            if row is None:
+                return None
+            cursor = conn.execute(
+                f"UPDATE shares SET download_count = download_count + 1{assignments} "
+                "WHERE token = ? AND (expire_at IS NULL OR expire_at > ?) "
+                "AND (max_downloads IS NULL OR download_count < max_downloads)",
+                (*values, token, now),
+            )
+            if cursor.rowcount != 1:
+                return None
+        return _share_from_row(row)
+
+    def pop_expired(self, now: float) -> List[Dict]:
+        with self._db.transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {_SHARE_SELECT} FROM shares WHERE expire_at <= ?", (now,)
+            ).fetchall()
+            if rows:
+                conn.execute("DELETE FROM shares WHERE expire_at <= ?", (now,))
+        return [_share_from_row(row) for row in rows]
+
+    def deadlines(self) -> List[Tuple[str, float]]:
+        rows = self._db.query("SELECT token, expire_at FROM shares WHERE expire_at IS NOT NULL")
+        return [(token, expire_at) for token, expire_at in rows]
+
+    def migrate(self, name: str, load: Callable[[], List[Dict]]) -> Optional[int]:
+        """
+        Import the records returned by ``load`` unless ``name`` was imported before.
+
+        Returns:
+            Number of records imported, or None if ``name`` was already done.
+        """
+
+        def insert_all(conn: sqlite3.Connection) -> int:
+            records = load()
+            for record in records:
+                _insert_share(conn, record, replace=True)
+            return len(records)
+
+        return _migrate_once(self._db, name, insert_all)
+
+
+class SQLiteBookmarkStore(BookmarkStore):
+    def __init__(self, db: SharedStateDB) -> None:
+        self._db = db
+
+    def list(self) -> List[Dict]:
+        rows = self._db.query("SELECT identifier, label, path FROM bookmarks ORDER BY rowid")
+        return [{"identifier": identifier, "label": label, "path": path} for identifier, label, path in rows]
+
+    def insert(self, bookmark: Dict) -> bool:
+        try:
+            with self._db.transaction() as conn:
+                _insert_bookmark(conn, bookmark)
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def delete(self, identifier: str) -> None:
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM bookmarks WHERE identifier = ?", (identifier,))
+
+    def migrate(self, name: str, load: Callable[[], List[Dict]]) -> Optional[int]:
+        """See :meth:`SQLiteShareStore.migrate`."""
+
+        def insert_all(conn: sqlite3.Connection) -> int:
+            bookmarks = load()
+            for bookmark in bookmarks:
+                _insert_bookmark(conn, bookmark, replace=True)
+            return len(bookmarks)
+
+        return _migrate_once(self._db, name, insert_all)
+
+
+def _downloadable(record: Dict, now: float) -> bool:
+    expire_at = record.get("expire_at")
+    if expire_at and expire_at <= now:
+        return False
+    max_downloads = record.get("max_downloads")
+    return max_downloads is None or record.get("download_count", 0) < max_downloads
+
+
+def _share_value(column: str, value: Any) -> Any:
+    if column == "allowed_ips":
+        return json.dumps(value or [])
+    if column == "is_directory":
+        return int(bool(value))
+    return value
+
+
+def _share_from_row(row: tuple) -> Dict:
+    record = dict(zip(SHARE_COLUMNS, row))
+    record["is_directory"] = bool(record["is_directory"])
+    record["allowed_ips"] = json.loads(record["allowed_ips"])
+    return record
+
+
+def _insert_share(conn: sqlite3.Connection, record: Dict, replace: bool = False) -> None:
+    verb = "INSERT OR REPLACE" if replace else "INSERT"
+    conn.execute(
+        f"{verb} INTO shares ({_SHARE_SELECT}) VALUES ({', '.join('?' for _ in SHARE_COLUMNS)})",
+        tuple(_share_value(column, record[column]) for column in SHARE_COLUMNS),
+    )
+
+
+def _insert_bookmark(conn: sqlite3.Connection, bookmark: Dict, replace: bool = False) -> None:
+    verb = "INSERT OR REPLACE" if replace else "INSERT"
+    conn.execute(
+        f"{verb} INTO bookmarks (identifier, label, path) VALUES (?, ?, ?)",
+        (bookmark["identifier"], bookmark["label"], bookmark["path"]),
+    )
+
+
+def _migrate_once(
+    db: SharedStateDB, name: str, apply: Callable[[sqlite3.Connection], int]
+) -> Optional[int]:
+    # One transaction: concurrently starting workers import exactly once.
+    with db.transaction() as conn:
+        if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+            return None
+        count = apply(conn)
+        conn.execute(
+            "INSERT INTO migrations (name, migrated_at) VALUES (?, ?)", (name, time.time())
+        )
+    return count
@@ -0,0 +1,187 @@
+"""Pre-fork supervisor: runs N server processes that share one port."""
+
+from __future__ import annotations
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+from .config import BASE_DIR
+from .reload import READY_TIMEOUT_SECONDS, wait_ready
+
+POLL_INTERVAL_SECONDS = 0.5
+# A worker that dies sooner than this after starting counts as a crash loop.
+MIN_UPTIME_SECONDS = 10
+MAX_RESTART_DELAY_SECONDS = 30
+STOP_TIMEOUT_SECONDS = 10
+
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def watch_parent(on_exit: Optional[Callable[[], None]] = None, interval: float = 1.0) -> None:
+    """
+    Act once this process's parent is gone.
+
+    Args:
+        on_exit: Called when the parent has exited; by default this process
+            terminates itself (workers must not outlive the supervisor).
+        interval: Seconds between checks.
+    """
+    parent = os.getppid()
+
+    def watch() -> None:
+        while os.getppid() == parent:
+            time.sleep(interval)
+        if on_exit is not None:
+            on_exit()
+        else:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=watch, name="parent-watch", daemon=True).start()
+
+
+@dataclass
+class _Worker:
+    process: Optional[subprocess.Popen]
+    started_at: float = 0.0
+    failures: int = 0
+    restart_at: float = 0.0
+
+
+class Supervisor:
+    """
+    Start ``workers`` server processes and keep them running.
+
+    Every worker binds the configured port with ``SO_REUSEPORT`` and the
+    kernel spreads incoming connections between them. A worker that exits is
+    restarted, with exponential back-off when it keeps crashing right after
+    start. SIGTERM or SIGINT stops all workers.
+
+    SIGHUP reloads: a new set of workers is started next to the old ones and,
+    once all of them accept connections, the old workers are told (SIGHUP) to
+    stop accepting and exit after their active transfers. Sessions live in
+    ``data/runtime.db`` and survive. The supervisor itself keeps running.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self._count = workers
+        self._workers: List[_Worker] = []
+        # Replaced workers finishing their transfers.
+        self._retiring: List[subprocess.Popen] = []
+        self._stopping = threading.Event()
+        self._reload_requested = threading.Event()
+
+    def run(self) -> None:
+        if not reuse_port_supported():
+            raise RuntimeError("SO_REUSEPORT is not available on this platform; use --workers 1.")
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+        self._workers = [_Worker(process=None) for _ in range(self._count)]
+        for slot in range(self._count):
+            self._spawn(slot)
+        print(f"Supervisor {os.getpid()} started {self._count} workers", flush=True)
+        try:
+            while not self._stopping.wait(POLL_INTERVAL_SECONDS):
+                if self._reload_requested.is_set():
+                    self._reload_requested.clear()
+                    self._reload()
+                self._reap()
+        finally:
+            self._stop_all()
+
+    def _spawn(self, slot: int) -> None:
+        self._workers[slot].process = self._start_worker()
+        self._workers[slot].started_at = time.monotonic()
+
+    def _start_worker(self, ready_fd: Optional[int] = None) -> subprocess.Popen:
+        command = [sys.executable, "-m", "server.app", "--worker", "--workers", str(self._count)]
+        if ready_fd is None:
+            return subprocess.Popen(command, cwd=str(BASE_DIR))  # noqa: S603 - own module
+        command += ["--ready-fd", str(ready_fd)]
+        return subprocess.Popen(command, cwd=str(BASE_DIR), pass_fds=(ready_fd,))  # noqa: S603
+
+    def _reload(self) -> None:
+        """Replace every worker without refusing connections."""
+        started = []
+        for _ in range(self._count):
+            ready_read, ready_write = os.pipe()
+            try:
+                started.append((self._start_worker(ready_write), ready_read))
+            except OSError:
+                os.close(ready_read)
+                break
+            finally:
+                os.close(ready_write)
+        deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+        ready = True
+        for _, ready_read in started:
+            ready = ready and wait_ready(ready_read, max(0.0, deadline - time.monotonic()))
+            os.close(ready_read)
+        if not ready or len(started) < self._count:
+            print("Reload failed: new workers did not start; keeping the old ones", file=sys.stderr, flush=True)
+            for process, _ in started:
+                process.kill()
+                process.wait()
+            return
+        now = time.monotonic()
+        for worker, (process, _) in zip(self._workers, started):
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.send_signal(signal.SIGHUP)
+                self._retiring.append(worker.process)
+            worker.process = process
+            worker.started_at = now
+            worker.failures = 0
+            worker.restart_at = 0.0
+        print(f"Reloaded {self._count} workers", flush=True)
+
+    def _reap(self) -> None:
+        self._retiring = [process for process in self._retiring if process.poll() is None]
+        now = time.monotonic()
+        for slot, worker in enumerate(self._workers):
+            if worker.process is not None:
+                code = worker.process.poll()
+                if code is None:
+                    continue
+                if now - worker.started_at < MIN_UPTIME_SECONDS:
+                    worker.failures += 1
+                else:
+                    worker.failures = 0
+                delay = min(2 ** worker.failures - 1, MAX_RESTART_DELAY_SECONDS)
+                print(
+                    f"Worker {worker.process.pid} exited with code {code}; "
+                    f"restarting in {delay}s",
+                    file=sys.stderr,
+                    flush=True,
+                )
+                worker.process = None
+                worker.restart_at = now + delay
+            if now >= worker.restart_at:
+                self._spawn(slot)
+
+    def _request_stop(self, signum: int, frame: Any) -> None:  # noqa: ARG002
+        self._stopping.set()
+
+    def _request_reload(self, signum: int, frame: Any) -> None:  # noqa: ARG002
+        self._reload_requested.set()
+
+    def _stop_all(self) -> None:
+        running = [w.process for w in self._workers if w.process is not None] + self._retiring
+        for process in running:
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT_SECONDS
+        for process in running:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
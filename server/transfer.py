@@ -0,0 +1,300 @@
+"""Streaming helpers for sending file bodies to HTTP clients."""
+
+from __future__ import annotations
+
+import errno
+import os
+import re
+import selectors
+import socket
+from email.utils import formatdate, parsedate_to_datetime
+from typing import BinaryIO, List, Optional, Tuple
+
+BUFFERED_CHUNK_SIZE = 64 * 1024  # 64 KiB
+SENDFILE_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MiB per sendfile(2) call
+
+# errno values meaning "sendfile cannot be used for this socket/file pair".
+_SENDFILE_UNSUPPORTED = {
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSOCK,
+    errno.EOPNOTSUPP,
+    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+}
+
+# Requests asking for more ranges than this are answered with the full body.
+MAX_RANGES = 32
+
+_RANGE_SPEC = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+ByteRange = Tuple[int, int]
+
+
+class SendfileUnavailable(Exception):
+    """Raised when the kernel refuses sendfile before any byte was sent."""
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a syntactically valid Range header selects no bytes."""
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """Strong validator derived from inode, size and modification time."""
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_range_header(value: Optional[str], size: int) -> Optional[List[ByteRange]]:
+    """
+    Parse an RFC 7233 ``Range`` header into inclusive byte ranges.
+
+    Overlapping and adjacent ranges are coalesced.
+
+    Returns:
+        Sorted list of ``(start, end)`` tuples, or None when the header is
+        absent, malformed or asks for too many ranges (serve the full body).
+
+    Raises:
+        RangeNotSatisfiable: If no requested range overlaps the file
+    """
+    if not value:
+        return None
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges: List[ByteRange] = []
+    for part in spec.split(","):
+        match = _RANGE_SPEC.match(part)
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            # Suffix range: the final N bytes.
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+            end = min(int(last), size - 1) if last else size - 1
+        if size > 0:
+            ranges.append((start, end))
+    if not ranges:
+        raise RangeNotSatisfiable
+    ranges.sort()
+    merged: List[ByteRange] = [ranges[0]]
+    for start, end in ranges[1:]:
+        prev_start, prev_end = merged[-1]
+        if start <= prev_end + 1:
+            merged[-1] = (prev_start, max(prev_end, end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def continues_download(value: Optional[str], size: int) -> bool:
+    """
+    Whether a ``Range`` header continues a download rather than starting one.
+
+    Only a valid header whose ranges all lie past the first byte counts; a
+    range from byte 0, a suffix covering the whole file or an unsatisfiable
+    header does not.
+    """
+    try:
+        ranges = parse_range_header(value, size)
+    except RangeNotSatisfiable:
+        return False
+    return ranges is not None and ranges[0][0] > 0
+
+
+def if_range_matches(value: Optional[str], etag: str, last_modified: str) -> bool:
+    """Evaluate ``If-Range``: True when the range request may be honoured."""
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        # Weak validators never match for If-Range.
+        return value == etag
+    try:
+        return parsedate_to_datetime(value) == parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+def if_none_match_matches(value: Optional[str], *etags: Optional[str]) -> bool:
+    """Evaluate ``If-None-Match`` (weak comparison) against ``etags``."""
+    if not value:
+        return False
+    for candidate in value.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in etags:
+            return True
+    return False
+
+
+def multipart_layout(
+    ranges: List[ByteRange], size: int, content_type: str, boundary: str
+) -> Tuple[List[Tuple[bytes, int, int]], bytes, int]:
+    """
+    Lay out a ``multipart/byteranges`` body.
+
+    Returns:
+        ``(parts, trailer, content_length)`` where each part is
+        ``(part_header, start, end)``; the body is every header followed by its
+        byte range and a CRLF, then ``trailer``.
+    """
+    parts: List[Tuple[bytes, int, int]] = []
+    total = 0
+    for start, end in ranges:
+        header = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        parts.append((header, start, end))
+        total += len(header) + (end - start + 1) + 2
+    trailer = f"--{boundary}--\r\n".encode("latin-1")
+    return parts, trailer, total + len(trailer)
+
+
+def send_file(
+    sock: socket.socket,
+    wfile: BinaryIO,
+    fh: BinaryIO,
+    offset: int = 0,
+    count: Optional[int] = None,
+) -> int:
+    """
+    Send ``count`` bytes of ``fh`` starting at ``offset`` to the client.
+
+    Uses zero-copy ``os.sendfile`` when the platform supports it and falls back
+    to a buffered read/write loop otherwise.
+
+    Args:
+        sock: Connected client socket
+        wfile: Writable stream wrapping ``sock`` (used by the buffered fallback)
+        fh: File opened in binary mode
+        offset: First byte to send
+        count: Number of bytes to send, or None for "until end of file"
+
+    Returns:
+        Number of bytes actually delivered to the socket. A value lower than
+        ``count`` means the client went away or the file was truncated.
+    """
+    if count is None:
+        count = os.fstat(fh.fileno()).st_size - offset
+    if count <= 0:
+        return 0
+    if hasattr(os, "sendfile"):
+        try:
+            return _send_with_sendfile(sock, fh, offset, count)
+        except SendfileUnavailable:
+            pass
+    return _send_buffered(wfile, fh, offset, count)
+
+
+def _send_with_sendfile(sock: socket.socket, fh: BinaryIO, offset: int, count: int) -> int:
+    try:
+        out_fd = sock.fileno()
+        in_fd = fh.fileno()
+    except (AttributeError, OSError) as exc:
+        raise SendfileUnavailable from exc
+
+    timeout = sock.gettimeout()
+    sent_total = 0
+    with selectors.DefaultSelector() as selector:
+        selector.register(out_fd, selectors.EVENT_WRITE)
+        while sent_total < count:
+            blocksize = min(count - sent_total, SENDFILE_CHUNK_SIZE)
+            try:
+                sent = os.sendfile(out_fd, in_fd, offset + sent_total, blocksize)
+            except BlockingIOError:
+                # Sockets with a timeout are non-blocking under the hood.
+                if not selector.select(timeout):
+                    raise TimeoutError("timed out")
+                continue
+            except OSError as exc:
+                if sent_total == 0 and exc.errno in _SENDFILE_UNSUPPORTED:
+                    raise SendfileUnavailable from exc
+                if isinstance(exc, ConnectionError):
+                    break
+                raise
+            if sent == 0:
+                # File shrank underneath us; stop at end of file.
+                break
+            sent_total += sent
+    return sent_total
+
+
+def _send_buffered(wfile: BinaryIO, fh: BinaryIO, offset: int, count: int) -> int:
+    fh.seek(offset)
+    sent_total = 0
+    try:
+        while sent_total < count:
+            chunk = fh.read(min(BUFFERED_CHUNK_SIZE, count - sent_total))
+            if not chunk:
+                break
+            wfile.write(chunk)
+            sent_total += len(chunk)
+    except ConnectionError:
+        pass
+    return sent_total
+
+
+class StreamWriter:
+    """
+    File-like sink for response bodies of unknown length.
+
+    With ``chunked`` set, writes are framed with HTTP/1.1 chunked transfer
+    encoding; otherwise the body is delimited by closing the connection.
+    Small writes are coalesced into chunks of at least ``chunk_size`` bytes.
+    """
+
+    def __init__(self, wfile: BinaryIO, chunked: bool, chunk_size: int = BUFFERED_CHUNK_SIZE) -> None:
+        self._wfile = wfile
+        self._chunked = chunked
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self.bytes_written = 0
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            self._emit()
+        return len(data)
+
+    def flush(self) -> None:
+        # Flushing is deferred to close(); zipfile and tarfile flush per member.
+        return
+
+    def close(self) -> None:
+        """Send any buffered data and, when chunked, the terminating chunk."""
+        self._emit()
+        if self._chunked:
+            self._wfile.write(b"0\r\n\r\n")
+
+    def _emit(self) -> None:
+        if not self._buffer:
+            return
+        payload = bytes(self._buffer)
+        self._buffer.clear()
+        if self._chunked:
+            self._wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        else:
+            self._wfile.write(payload)
+        self.bytes_written += len(payload)
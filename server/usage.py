@@ -0,0 +1,220 @@
+"""Recursive directory sizes for the file browser."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .path_validator import PathValidationError, validate_path_access
+
+WALK_THREADS = 8
+# How long a request waits for a walk before answering with partial totals.
+DEFAULT_WAIT_SECONDS = 2.0
+MAX_WAIT_SECONDS = 10.0
+# Directories whose own entries are remembered between walks.
+DEFAULT_CACHE_DIRECTORIES = 200_000
+# A directory's mtime does not change when a file in it is rewritten in
+# place, so remembered sizes are rescanned after this long regardless.
+MAX_AGE_SECONDS = 300.0
+# Directories modified more recently than this are not remembered: a change
+# within the timestamp granularity would go unnoticed.
+MTIME_SETTLE_SECONDS = 2.0
+# A walk following remembered directories publishes its totals this often.
+PROGRESS_DIRECTORIES = 256
+
+
+@dataclass
+class UsageStatus:
+    path: str
+    files: int = 0
+    directories: int = 0
+    bytes: int = 0
+    # Subdirectories that could not be read and are not counted.
+    errors: int = 0
+    complete: bool = False
+    elapsed: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass
+class _DirectoryUsage:
+    mtime_ns: int
+    scanned_at: float
+    files: int
+    bytes: int
+    subdirs: List[str]
+
+
+@dataclass
+class _Walk:
+    status: UsageStatus
+    started: float = field(default_factory=time.monotonic)
+    pending: int = 1
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class UsageService:
+    """
+    Recursive file count and size of directory trees.
+
+    A walk visits directories on a thread pool, so independent subtrees are
+    read in parallel (``scandir`` releases the GIL while it waits on the
+    filesystem). Files are counted like :func:`~server.archive.scan_tree`
+    counts them for an archive: symlinks to files with their target's size,
+    symlinks to directories not followed. Subdirectories rejected by
+    :func:`validate_path_access` are skipped, as in listings and search.
+
+    Each directory's own totals are remembered and reused while its mtime is
+    unchanged (up to ``max_age``), so walking the tree again only costs one
+    ``stat`` per directory. Concurrent requests for the same path share one
+    walk, and a request that outlasts ``wait`` gets the totals so far with
+    ``complete`` False; the walk goes on and a later request picks it up.
+    """
+
+    def __init__(
+        self,
+        threads: int = WALK_THREADS,
+        max_directories: int = DEFAULT_CACHE_DIRECTORIES,
+        max_age: float = MAX_AGE_SECONDS,
+    ) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="usage-walk")
+        self._max_directories = max_directories
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._directories: "OrderedDict[str, _DirectoryUsage]" = OrderedDict()
+        self._walks: Dict[str, _Walk] = {}
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def usage(self, path: str, wait: Optional[float] = None) -> UsageStatus:
+        """
+        Totals for the tree below the directory ``path``.
+
+        Args:
+            path: Directory to measure.
+            wait: Seconds to wait for the walk to finish, capped at
+                :data:`MAX_WAIT_SECONDS`; None waits :data:`DEFAULT_WAIT_SECONDS`.
+
+        Raises:
+            NotADirectoryError: If ``path`` is not a directory
+        """
+        if not os.path.isdir(path):
+            raise NotADirectoryError("Requested path is not a directory")
+        with self._lock:
+            walk = self._walks.get(path)
+            if walk is None:
+                walk = _Walk(status=UsageStatus(path=path))
+                self._pool.submit(self._visit, walk, path)
+                self._walks[path] = walk
+        walk.done.wait(DEFAULT_WAIT_SECONDS if wait is None else min(max(wait, 0.0), MAX_WAIT_SECONDS))
+        with self._lock:
+            status = UsageStatus(**asdict(walk.status))
+        status.elapsed = round(time.monotonic() - walk.started, 3)
+        return status
+
+    def _visit(self, walk: _Walk, path: str) -> None:
+        """
+        Count the tree below ``path``.
+
+        Directories still remembered are followed on this thread, which only
+        costs a ``stat`` each; subdirectories of one that had to be read are
+        handed to the pool so that reading them proceeds in parallel.
+        """
+        stack = [path]
+        files = total_bytes = directories = errors = visited = 0
+        spawned: List[str] = []
+        try:
+            while stack:
+                current = stack.pop()
+                try:
+                    directory, scanned = self._directory(current)
+                except OSError:
+                    errors += 1
+                    continue
+                files += directory.files
+                total_bytes += directory.bytes
+                directories += len(directory.subdirs)
+                children = [os.path.join(current, name) for name in directory.subdirs]
+                (spawned if scanned else stack).extend(children)
+                visited += 1
+                if stack and (spawned or visited % PROGRESS_DIRECTORIES == 0):
+                    self._account(walk, files, total_bytes, directories, errors, spawned, done=False)
+                    files = total_bytes = directories = errors = 0
+                    spawned = []
+        finally:
+            # Always settle this task, or the walk would never complete.
+            self._account(walk, files, total_bytes, directories, errors + len(stack), spawned, done=True)
+
+    def _account(
+        self, walk: _Walk, files: int, total_bytes: int, directories: int, errors: int,
+        spawned: List[str], done: bool,
+    ) -> None:
+        with self._lock:
+            status = walk.status
+            status.files += files
+            status.bytes += total_bytes
+            status.directories += directories
+            status.errors += errors
+            for child in spawned:
+                try:
+                    self._pool.submit(self._visit, walk, child)
+                except RuntimeError:  # the service was closed
+                    status.errors += 1
+                    continue
+                walk.pending += 1
+            if done:
+                walk.pending -= 1
+                if walk.pending == 0:
+                    status.complete = True
+                    del self._walks[status.path]
+                    walk.done.set()
+
+    def _directory(self, path: str) -> Tuple[_DirectoryUsage, bool]:
+        """
+        Totals of the entries directly inside ``path``.
+
+        Returns:
+            The totals, and whether the directory had to be read (rather than
+            being remembered).
+        """
+        mtime_ns = os.stat(path).st_mtime_ns
+        now = time.time()
+        with self._lock:
+            cached = self._directories.get(path)
+            if cached is not None and cached.mtime_ns == mtime_ns and now - cached.scanned_at < self._max_age:
+                self._directories.move_to_end(path)
+                return cached, False
+        files = 0
+        total_bytes = 0
+        subdirs: List[str] = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            validate_path_access(entry.path, allow_custom=True)
+                            subdirs.append(entry.name)
+                        continue
+                    size = entry.stat().st_size
+                except (OSError, PathValidationError):
+                    continue
+                files += 1
+                total_bytes += size
+        directory = _DirectoryUsage(
+            mtime_ns=mtime_ns, scanned_at=now, files=files, bytes=total_bytes, subdirs=subdirs
+        )
+        if now - mtime_ns / 1e9 >= MTIME_SETTLE_SECONDS:
+            with self._lock:
+                self._directories[path] = directory
+                self._directories.move_to_end(path)
+                while len(self._directories) > self._max_directories:
+                    self._directories.popitem(last=False)
+        return directory, True
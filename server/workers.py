@@ -0,0 +1,208 @@
+"""Bounded request handling for the threaded server."""
+
+from __future__ import annotations
+
+import json
+import queue
+import socket
+import threading
+import time
+from http.server import HTTPServer
+from typing import List, Optional, Tuple, Type
+
+ROUTE_HEAVY = "heavy"
+ROUTE_LIGHT = "light"
+
+DEFAULT_WORKERS = 64
+DEFAULT_PENDING_CONNECTIONS = 256
+DEFAULT_HEAVY_REQUESTS = 16
+DEFAULT_LIGHT_REQUESTS = 48
+BUSY_RETRY_AFTER_SECONDS = 5
+BUSY_MESSAGE = "Server is busy, please retry later"
+DRAIN_POLL_SECONDS = 0.2
+
+
+def classify_route(method: str, route: str) -> str:
+    """Downloads, share creation and directory sizes are heavy; everything else is light."""
+    if method == "GET" and (route.startswith("/d/") or route == "/api/fs/usage"):
+        return ROUTE_HEAVY
+    if method == "POST" and route in ("/api/downloads", "/api/shares"):
+        return ROUTE_HEAVY
+    return ROUTE_LIGHT
+
+
+class AdmissionControl:
+    """
+    Separate concurrency budgets for heavy and light routes.
+
+    A request that finds its budget exhausted is rejected straight away
+    rather than queued, so a burst of large downloads cannot starve the UI.
+    """
+
+    def __init__(
+        self,
+        heavy_requests: int = DEFAULT_HEAVY_REQUESTS,
+        light_requests: int = DEFAULT_LIGHT_REQUESTS,
+    ) -> None:
+        self._budgets = {
+            ROUTE_HEAVY: threading.BoundedSemaphore(max(1, heavy_requests)),
+            ROUTE_LIGHT: threading.BoundedSemaphore(max(1, light_requests)),
+        }
+
+    def try_acquire(self, kind: str) -> bool:
+        return self._budgets[kind].acquire(blocking=False)
+
+    def release(self, kind: str) -> None:
+        self._budgets[kind].release()
+
+
+class WorkerPoolHTTPServer(HTTPServer):
+    """
+    ``HTTPServer`` that serves connections on a fixed set of worker threads.
+
+    Accepted connections wait in a queue of ``max_pending`` entries; when it
+    is full the connection is answered with ``503`` and closed instead of
+    spawning yet another thread. Handlers waiting on an idle persistent
+    connection check :meth:`connections_waiting` and close it to free their
+    worker for a queued connection. With ``reuse_port`` the socket is bound with
+    ``SO_REUSEPORT`` so several processes can share the port; with
+    ``listen_fd`` an already listening socket (inherited on reload) is used.
+    """
+
+    def __init__(
+        self,
+        server_address: Tuple[str, int],
+        handler_class: Type,
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_PENDING_CONNECTIONS,
+        reuse_port: bool = False,
+        listen_fd: Optional[int] = None,
+    ) -> None:
+        super().__init__(server_address, handler_class, bind_and_activate=False)
+        self.request_queue_size = max(1, max_pending)
+        # Lets pre-forked worker processes each bind the same port.
+        self.allow_reuse_port = reuse_port
+        if listen_fd is not None:
+            self.socket.close()
+            self.socket = socket.socket(fileno=listen_fd)
+            self.server_address = self.socket.getsockname()
+            self.server_name, self.server_port = self.server_address[:2]
+        else:
+            try:
+                self.server_bind()
+                self.server_activate()
+            except BaseException:
+                self.server_close()
+                raise
+        # Connections queued or being served.
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._pending: "queue.Queue[Optional[Tuple[socket.socket, Tuple[str, int]]]]" = queue.Queue(
+            maxsize=max(1, max_pending)
+        )
+        self._workers: List[threading.Thread] = []
+        for index in range(max(1, workers)):
+            worker = threading.Thread(target=self._work, name=f"http-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def process_request(self, request: socket.socket, client_address: Tuple[str, int]) -> None:
+        with self._active_lock:
+            self._active += 1
+        try:
+            self._pending.put_nowait((request, client_address))
+        except queue.Full:
+            with self._active_lock:
+                self._active -= 1
+            self._reject(request)
+            self.shutdown_request(request)
+
+    def connections_waiting(self) -> bool:
+        """Whether accepted connections are queued for a worker."""
+        return not self._pending.empty()
+
+    def accept_backlog(self) -> None:
+        """Queue the connections already accepted by the kernel without waiting for more."""
+        self.socket.setblocking(False)
+        try:
+            while True:
+                try:
+                    request, client_address = self.get_request()
+                except OSError:  # BlockingIOError once the backlog is empty
+                    return
+                request.setblocking(True)
+                self.process_request(request, client_address)
+        finally:
+            self.socket.setblocking(True)
+
+    def wait_idle(self, timeout: float) -> bool:
+        """
+        Wait for queued and in-progress connections to finish.
+
+        Args:
+            timeout: Maximum number of seconds to wait.
+
+        Returns:
+            True if the server went idle, False if ``timeout`` expired first.
+        """
+        deadline = time.monotonic() + timeout
+        while self._active:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(DRAIN_POLL_SECONDS)
+        return True
+
+    def server_close(self) -> None:
+        super().server_close()
+        if not hasattr(self, "_workers"):
+            return
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+        for _ in self._workers:
+            try:
+                self._pending.put_nowait(None)
+            except queue.Full:
+                break
+
+    def _work(self) -> None:
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:  # pylint: disable=broad-except
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._active_lock:
+                    self._active -= 1
+
+    @staticmethod
+    def _reject(request: socket.socket) -> None:
+        body = json.dumps({"error": BUSY_MESSAGE}).encode("utf-8")
+        head = (
+            "HTTP/1.0 503 Service Unavailable\r\n"
+            f"Retry-After: {BUSY_RETRY_AFTER_SECONDS}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("latin-1")
+        try:
+            # Consume whatever part of the request has arrived so closing
+            # does not reset the connection before the client reads the
+            # response. Never wait for it: this runs on the accept loop.
+            request.setblocking(False)
+            try:
+                request.recv(65536)
+            except BlockingIOError:
+                pass
+            request.sendall(head + body)
+        except OSError:
+            pass
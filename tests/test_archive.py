@@ -0,0 +1,91 @@
+"""Streamed archive membership."""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+import pytest
+
+from server import archive
+from server.archive import ARCHIVE_FORMAT_TAR, ARCHIVE_FORMAT_TAR_GZ, ARCHIVE_FORMAT_ZIP, stream_archive
+from server.config import BASE_DIR
+
+
+@pytest.fixture
+def tree():
+    # Subdirectories are checked with validate_path_access, which blocks /tmp.
+    root = tempfile.mkdtemp(prefix="test-", dir=os.path.join(BASE_DIR, "data"))
+    for directory in ("docs/deep", "empty", ".git/objects"):
+        os.makedirs(os.path.join(root, directory))
+    for name in ("a.txt", "docs/b.txt", "docs/deep/c.txt", ".git/objects/d"):
+        with open(os.path.join(root, name), "wb") as fh:
+            fh.write(name.encode())
+    os.symlink(os.path.join(root, "docs"), os.path.join(root, "docs-link"))
+    yield root
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def _members(root, archive_format):
+    buffer = io.BytesIO()
+    stream_archive(root, buffer, archive_format)
+    buffer.seek(0)
+    if archive_format == ARCHIVE_FORMAT_ZIP:
+        with zipfile.ZipFile(buffer) as zf:
+            return {info.filename.rstrip("/"): zf.read(info) for info in zf.infolist()}
+    with tarfile.open(fileobj=buffer, mode="r:*") as tar:
+        return {
+            info.name: tar.extractfile(info).read() if info.isfile() else b""
+            for info in tar.getmembers()
+        }
+
+
+def test_formats_have_the_same_members(tree):
+    base = archive.archive_base_name(tree)
+    expected = {
+        base: b"",
+        f"{base}/a.txt": b"a.txt",
+        f"{base}/docs/b.txt": b"docs/b.txt",
+        f"{base}/docs/deep/c.txt": b"docs/deep/c.txt",
+        f"{base}/empty": b"",
+    }
+    for archive_format in (ARCHIVE_FORMAT_ZIP, ARCHIVE_FORMAT_TAR, ARCHIVE_FORMAT_TAR_GZ):
+        assert _members(tree, archive_format) == expected, archive_format
+    assert archive.scan_tree(tree).files == 3
+
+
+def test_unreadable_file_is_skipped(tree, monkeypatch):
+    walk = archive.iter_members
+
+    def with_missing(source_path):
+        for member in walk(source_path):
+            yield member
+            if member[0].endswith("a.txt"):
+                yield member[0] + ".gone", member[1] + ".gone"
+
+    monkeypatch.setattr(archive, "iter_members", with_missing)
+    for archive_format in (ARCHIVE_FORMAT_ZIP, ARCHIVE_FORMAT_TAR):
+        members = _members(tree, archive_format)
+        assert not any(name.endswith(".gone") for name in members)
+        assert any(name.endswith("docs/deep/c.txt") for name in members)
+
+
+def test_cache_leaves_one_lock_per_share_until_discarded(tree, tmp_path):
+    cache = archive.ArchiveCache(str(tmp_path))
+    base = archive.archive_base_name(tree)
+    try:
+        for i in range(3):
+            with open(os.path.join(tree, f"new{i}.txt"), "wb") as fh:
+                fh.write(b"new")
+            name = cache.get_archive(tree, "tok")
+            # Superseded versions are gone; the share's lock stays while it exists.
+            assert sorted(os.listdir(tmp_path)) == [name, f"{base}-tok.lock"]
+        status = cache.status("tok")
+        assert status.state == archive.ARCHIVE_STATE_READY
+        assert (status.files_done, status.files_total) == (6, 6)
+        cache.discard(tree, "tok")
+        assert os.listdir(tmp_path) == []
+    finally:
+        cache.close()
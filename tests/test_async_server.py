@@ -0,0 +1,37 @@
+"""Request framing in the asyncio engine."""
+
+import socket
+import threading
+
+import pytest
+
+from server.async_server import AsyncServer
+
+
+@pytest.fixture(scope="module")
+def address():
+    server = AsyncServer("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server._socket.getsockname()  # pylint: disable=protected-access
+
+
+def _exchange(address, request):
+    with socket.create_connection(address, timeout=10) as conn:
+        conn.sendall(request)
+        response = b""
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                return response
+            response += chunk
+
+
+def test_chunked_body_is_rejected(address):
+    # The trailing GET must not be read as a second request on this connection.
+    response = _exchange(
+        address,
+        b"POST /api/login HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n"
+        b"4c\r\nGET /api/status HTTP/1.1\r\nHost: x\r\n\r\n\r\n0\r\n\r\n",
+    )
+    assert response.startswith(b"HTTP/1.0 411 ")
+    assert response.count(b"HTTP/1.") == 1
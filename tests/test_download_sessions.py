@@ -0,0 +1,74 @@
+"""Resuming downloads through download sessions."""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from server import download_session
+from server.config import BASE_DIR
+from server.download_session import DownloadSessionManager
+from server.share import ShareManager
+from server.shared_state import SharedDownloadSessionManager, SharedStateDB
+from server.stores import STORAGE_SCHEMA, JSONShareStore, SQLiteShareStore
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def manager(request):
+    # Share paths must pass validate_share_path, which blocks /tmp.
+    root = tempfile.mkdtemp(prefix="test-", dir=os.path.join(BASE_DIR, "data"))
+    if request.param == "sqlite":
+        db = SharedStateDB(os.path.join(root, "storage.db"), schema=STORAGE_SCHEMA)
+        store = SQLiteShareStore(db)
+        sessions = SharedDownloadSessionManager(SharedStateDB(os.path.join(root, "runtime.db")))
+    else:
+        store = JSONShareStore(os.path.join(root, "shares.json"))
+        sessions = DownloadSessionManager()
+    share_manager = ShareManager(store, os.path.join(root, "archives"), download_sessions=sessions)
+    path = os.path.join(root, "file.bin")
+    with open(path, "wb") as fh:
+        fh.write(b"x" * 1024)
+    share_manager.test_path = path
+    yield share_manager
+    share_manager.close()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def test_resume_cannot_exceed_max_downloads(manager):
+    token = manager.create_share(manager.test_path, max_downloads=3, expire_at=None).token
+    assert manager.validate_and_register_download(token, "10.0.0.1") is not None
+
+    # The admitted client may continue its download ...
+    for _ in range(10):
+        assert manager.validate_and_register_download(token, "10.0.0.1", range_header="bytes=512-")
+    assert manager.get_share(token)["download_count"] == 1
+    # ... but a range covering the start is a new download, and counts.
+    for range_header in ("bytes=0-", "bytes=-5000"):
+        assert manager.validate_and_register_download(token, "10.0.0.1", range_header=range_header)
+    for range_header in ("bytes=0-100,600-", "bytes=2000-"):
+        assert manager.validate_and_register_download(token, "10.0.0.1", range_header=range_header) is None
+    assert manager.get_share(token) is None
+    assert manager.validate_and_register_download(token, "10.0.0.1", range_header="bytes=512-") is None
+
+
+def test_last_download_drops_every_session(manager):
+    token = manager.create_share(manager.test_path, max_downloads=2, expire_at=None).token
+    assert manager.validate_and_register_download(token, "10.0.0.1") is not None
+    assert manager.validate_and_register_download(token, "10.0.0.2") is not None
+
+    for client_ip in ("10.0.0.1", "10.0.0.2"):
+        assert manager.validate_and_register_download(token, client_ip, range_header="bytes=10-") is None
+    assert manager.get_share(token) is None
+
+
+def test_session_expiry_does_not_slide(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(download_session.time, "time", lambda: now[0])
+    sessions = DownloadSessionManager(ttl_seconds=60)
+    sessions.open_session("tok", "10.0.0.1", {"path": "/x"})
+    for _ in range(5):
+        now[0] += 10
+        assert sessions.get_session("tok", "10.0.0.1") is not None
+    now[0] += 10
+    assert sessions.get_session("tok", "10.0.0.1") is None
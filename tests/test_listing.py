@@ -0,0 +1,285 @@
+"""Paged directory listings and the /api/fs route."""
+
+import base64
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import quote
+
+import pytest
+
+from server.app import FileShareRequestHandler
+from server.config import BASE_DIR
+from server.dirwatch import DirectoryWatcher
+from server.listing import MAX_PAGE_SIZE, SORT_KEYS, ListingCache, list_page
+from server.workers import AdmissionControl, WorkerPoolHTTPServer
+
+
+@pytest.fixture
+def directory():
+    # /api/fs checks the path with validate_path_access, which blocks /tmp.
+    root = tempfile.mkdtemp(prefix="test-", dir=os.path.join(BASE_DIR, "data"))
+    for i in range(25):
+        # Sizes and times repeat, so ties are broken by name.
+        _write(root, f"file{i:02d}.txt", i * 7 % 11, 1_700_000_000 + i % 4)
+    os.mkdir(os.path.join(root, "subdir"))
+    _write(root, ".hidden", 0)
+    yield root
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def _write(root, name, size, mtime=None):
+    path = os.path.join(root, name)
+    with open(path, "wb") as fh:
+        fh.write(b"x" * size)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _sort_key(target, sort, name):
+    if sort == "name":
+        return (name,)
+    st = os.stat(os.path.join(target, name))
+    return (st.st_size if sort == "size" else int(st.st_mtime), name)
+
+
+def _expected(target, sort, descending=False):
+    names = [name for name in os.listdir(target) if not name.startswith(".")]
+    return sorted(names, key=lambda name: _sort_key(target, sort, name), reverse=descending)
+
+
+def _all_pages(target, limit, cursor=None, **kwargs):
+    names, pages = [], 0
+    while True:
+        page = list_page(target, limit=limit, cursor=cursor, **kwargs)
+        names.extend(entry["name"] for entry in page.entries)
+        pages += 1
+        cursor = page.next_cursor
+        if cursor is None:
+            return names, page.total, pages
+
+
+@pytest.mark.parametrize("sort", SORT_KEYS)
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 7, 26, None])
+def test_pages_cover_the_listing_once(directory, sort, descending, limit):
+    names, total, pages = _all_pages(directory, limit, sort=sort, descending=descending)
+    assert names == _expected(directory, sort, descending)
+    assert total == 26
+    assert pages == (1 if limit is None else -(-26 // limit))
+
+
+def test_entries_and_filters(directory):
+    subdir = os.stat(os.path.join(directory, "subdir"))
+    assert list(list_page(directory, prefix="SUB").entries) == [{
+        "name": "subdir",
+        "path": os.path.join(directory, "subdir"),
+        "is_dir": True,
+        "size": subdir.st_size,
+        "modified": int(subdir.st_mtime),
+    }]
+    assert list_page(directory, show_hidden=True).total == 27
+
+    names, total, pages = _all_pages(directory, 3, prefix="FILE1", sort="size")
+    assert names == [name for name in _expected(directory, "size") if name.startswith("file1")]
+    assert (total, pages) == (10, 4)
+
+
+@pytest.mark.parametrize("sort", SORT_KEYS)
+def test_cursor_is_stable_across_changes(directory, sort):
+    first = list_page(directory, sort=sort, limit=10)
+    seen = [entry["name"] for entry in first.entries]
+    after = _sort_key(directory, sort, seen[-1])
+
+    # Remove the entry the cursor points at and one still to come; add one
+    # that sorts before the cursor, which is skipped, and one after it.
+    os.unlink(os.path.join(directory, seen[-1]))
+    os.unlink(os.path.join(directory, _expected(directory, sort)[12]))
+    _write(directory, "aaa.txt", 0, 1_600_000_000)
+    _write(directory, "zzz.txt", 100)
+
+    names, _, _ = _all_pages(directory, 10, cursor=first.next_cursor, sort=sort)
+    assert names == [name for name in _expected(directory, sort) if _sort_key(directory, sort, name) > after]
+    assert "zzz.txt" in names and "aaa.txt" not in names
+    assert not set(names) & set(seen)
+
+
+def test_cursor_is_checked(directory):
+    cursor = list_page(directory, sort="size", limit=5).next_cursor
+    assert list_page(directory, sort="size", limit=5, cursor=cursor).total == 26
+    for sort, descending in (("name", False), ("size", True), ("modified", False)):
+        with pytest.raises(ValueError, match="sort order"):
+            list_page(directory, sort=sort, descending=descending, cursor=cursor)
+
+    def encode(value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+    for sort, tampered in (
+        ("size", "!!!"),
+        ("size", cursor[:-3]),
+        ("size", encode(["size", False, "big", "a"])),
+        ("name", encode(["name", False, 1])),
+        ("name", encode({"sort": "name"})),
+    ):
+        with pytest.raises(ValueError):
+            list_page(directory, sort=sort, cursor=tampered)
+
+
+@pytest.mark.parametrize("limit", [0, -1, MAX_PAGE_SIZE + 1])
+def test_invalid_limit(directory, limit):
+    with pytest.raises(ValueError, match="limit"):
+        list_page(directory, limit=limit)
+
+
+def test_invalid_sort(directory):
+    with pytest.raises(ValueError, match="sort key"):
+        list_page(directory, sort="type")
+
+
+@pytest.fixture
+def watcher():
+    watcher = DirectoryWatcher.create()
+    if watcher is None:
+        pytest.skip("inotify is not available")
+    return watcher
+
+
+def _settle(directory):
+    # Without a watcher only directories unchanged for a while are cached.
+    past = time.time() - 60
+    os.utime(directory, (past, past))
+
+
+def _eventually(check, timeout=2.0):
+    # inotify events are read by a background thread, so allow it a moment.
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_cache_revalidates_by_mtime(directory):
+    cache = ListingCache()
+    rows = cache.rows(directory, False, "name")
+    assert cache.rows(directory, False, "name") is not rows  # not settled yet
+    _settle(directory)
+    rows = cache.rows(directory, False, "name")
+    assert cache.rows(directory, False, "name") is rows
+
+    _write(directory, "new.txt", 1)
+    assert "new.txt" in cache.rows(directory, False, "name")
+    _settle(directory)
+    os.rename(os.path.join(directory, "new.txt"), os.path.join(directory, "renamed.txt"))
+    rows = cache.rows(directory, False, "name")
+    assert "renamed.txt" in rows and "new.txt" not in rows
+    # Sizes can change without touching the directory, so they are never cached.
+    _write(directory, "file00.txt", 5000)
+    assert cache.rows(directory, False, "size")[-1][1] == "file00.txt"
+
+
+def test_cache_follows_directory_watcher(directory, watcher):
+    cache = ListingCache(watcher=watcher)
+    for sort in SORT_KEYS:
+        rows = cache.rows(directory, False, sort)
+        assert cache.rows(directory, False, sort) is rows
+
+    _write(directory, "new.txt", 1)
+    _eventually(lambda: "new.txt" in cache.rows(directory, False, "name"))
+    # A file growing is a change to its directory's listing as well.
+    _write(directory, "file00.txt", 5000)
+    _eventually(lambda: cache.rows(directory, False, "size")[-1][1] == "file00.txt")
+    os.unlink(os.path.join(directory, "file00.txt"))
+    _eventually(lambda: "file00.txt" not in [row[1] for row in cache.rows(directory, False, "modified")])
+
+
+@pytest.fixture
+def listing_cache(request):
+    if getattr(request, "param", None) == "inotify":
+        watcher = DirectoryWatcher.create()
+        if watcher is None:
+            pytest.skip("inotify is not available")
+        return ListingCache(watcher=watcher)
+    return ListingCache()
+
+
+@pytest.fixture
+def fs_server(listing_cache):
+    class Handler(FileShareRequestHandler):
+        context = SimpleNamespace(admission=AdmissionControl(), listing_cache=listing_cache)
+
+        def _require_auth(self):
+            return None
+
+    httpd = WorkerPoolHTTPServer(("127.0.0.1", 0), Handler, workers=2)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[:2]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(address, path, headers=None):
+    conn = http.client.HTTPConnection(*address, timeout=5)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_ndjson_pages(directory, fs_server):
+    names, cursor = [], ""
+    while cursor is not None:
+        status, headers, body = _get(
+            fs_server, f"/api/fs?path={quote(directory)}&format=ndjson&sort=modified&order=desc&limit=10&cursor={cursor}"
+        )
+        assert status == 200
+        assert headers["Content-Type"] == "application/x-ndjson"
+        assert headers["Transfer-Encoding"] == "chunked"
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        header, entries = lines[0], lines[1:]
+        assert header["path"] == directory and header["order"] == "desc" and header["total"] == 26
+        assert "entries" not in header
+        names.extend(entry["name"] for entry in entries)
+        cursor = header["next_cursor"]
+    assert names == _expected(directory, "modified", descending=True)
+
+
+def test_ndjson_bad_cursor_is_rejected(directory, fs_server):
+    status, headers, body = _get(fs_server, f"/api/fs?path={quote(directory)}&format=ndjson&cursor=abc")
+    assert status == 400
+    assert headers["Content-Type"].startswith("application/json")
+    assert "cursor" in json.loads(body)["error"].lower()
+
+
+@pytest.mark.parametrize("listing_cache", ["mtime", "inotify"], indirect=True)
+def test_etag_changes_with_directory(directory, fs_server):
+    _settle(directory)
+    path = f"/api/fs?path={quote(directory)}&limit=30"
+    status, headers, body = _get(fs_server, path)
+    assert status == 200
+    etag = headers["ETag"]
+    assert len(json.loads(body)["entries"]) == 26
+
+    status, headers, body = _get(fs_server, path, {"If-None-Match": etag})
+    assert (status, headers["ETag"], body) == (304, etag, b"")
+    # Other pages and sort orders have their own tags.
+    status, headers, _ = _get(fs_server, path + "&order=desc", {"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag
+
+    _write(directory, "new.txt", 1)
+
+    def changed():
+        status, headers, body = _get(fs_server, path, {"If-None-Match": etag})
+        if status == 304:
+            return False
+        assert status == 200 and headers["ETag"] != etag
+        assert "new.txt" in [entry["name"] for entry in json.loads(body)["entries"]]
+        return True
+
+    _eventually(changed)
@@ -0,0 +1,44 @@
+"""Importing the JSON share store into SQLite."""
+
+import json
+import os
+
+from server.share import migrate_json_shares
+from server.shared_state import SharedStateDB
+from server.storage import JournaledJSONStorage
+from server.stores import STORAGE_SCHEMA, SQLiteShareStore
+
+
+def _record(token, **changes):
+    return {
+        "token": token,
+        "path": "/srv/file",
+        "is_directory": False,
+        "archive_name": None,
+        "created_at": 1.0,
+        "max_downloads": None,
+        "download_count": 0,
+        "expire_at": None,
+        "allowed_ips": [],
+        **changes,
+    }
+
+
+def test_journal_changes_are_migrated(tmp_path):
+    json_path = str(tmp_path / "shares.json")
+    with open(json_path, "w", encoding="utf-8") as fh:
+        json.dump({"old": _record("old")}, fh)
+    # Changes the journaled backend had not compacted into shares.json yet.
+    journal = JournaledJSONStorage(json_path)
+    journal.put("new", _record("new"))
+    journal.update("old", {"download_count": 3})
+
+    store = SQLiteShareStore(SharedStateDB(str(tmp_path / "storage.db"), schema=STORAGE_SCHEMA))
+    assert migrate_json_shares(store, json_path) == 2
+
+    assert store.get("new") is not None
+    assert store.get("old")["download_count"] == 3
+    assert not os.path.exists(json_path)
+    assert not os.path.exists(f"{json_path}.journal")
+    assert os.path.exists(f"{json_path}.journal.migrated")
+    assert migrate_json_shares(store, json_path) is None
@@ -0,0 +1,120 @@
+"""Concurrent downloads through ShareManager.validate_and_register_download."""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from server import archive
+from server.archive import ArchivePreparing
+from server.config import BASE_DIR
+from server.share import ARCHIVE_MODE_CACHED, ShareManager
+from server.shared_state import SharedStateDB
+from server.stores import STORAGE_SCHEMA, JSONShareStore, SQLiteShareStore
+
+TIMEOUT = 10
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def manager(request):
+    # Share paths must pass validate_share_path, which blocks /tmp.
+    root = tempfile.mkdtemp(prefix="test-", dir=os.path.join(BASE_DIR, "data"))
+    if request.param == "sqlite":
+        store = SQLiteShareStore(SharedStateDB(os.path.join(root, "storage.db"), schema=STORAGE_SCHEMA))
+    else:
+        store = JSONShareStore(os.path.join(root, "shares.json"))
+    share_manager = ShareManager(store, os.path.join(root, "archives"))
+    share_manager.test_root = root
+    yield share_manager
+    share_manager.close()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def _wait_until_ready(manager, token):
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        status = manager.get_archive_status(token)
+        if status and status["state"] == "ready":
+            return
+        time.sleep(0.02)
+    raise AssertionError(f"archive of {token} was not built")
+
+
+def _make_file(root, name):
+    path = os.path.join(root, name)
+    with open(path, "wb") as fh:
+        fh.write(b"x" * 1024)
+    return path
+
+
+def test_max_downloads_is_exact_under_concurrency(manager):
+    path = _make_file(manager.test_root, "file.bin")
+    token = manager.create_share(path, max_downloads=5, expire_at=None).token
+
+    def download(i):
+        return manager.validate_and_register_download(token, f"10.0.{i // 256}.{i % 256}")
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(download, range(64)))
+
+    assert sum(result is not None for result in results) == 5
+    assert manager.get_share(token) is None  # used up and removed
+
+
+def test_different_tokens_do_not_wait_for_each_other(manager, monkeypatch):
+    slow_dir = os.path.join(manager.test_root, "slow")
+    os.mkdir(slow_dir)
+    _make_file(slow_dir, "inner.bin")
+    scanning = threading.Event()
+    release = threading.Event()
+    real_scan_tree = archive.scan_tree
+
+    def blocking_scan_tree(source_path):
+        if source_path == slow_dir:
+            scanning.set()
+            release.wait(TIMEOUT)
+        return real_scan_tree(source_path)
+
+    # Fast shares are folders too, so they go through the same archive cache.
+    fast_tokens = []
+    for i in range(8):
+        folder = os.path.join(manager.test_root, f"fast{i}")
+        os.mkdir(folder)
+        _make_file(folder, "inner.bin")
+        fast_tokens.append(manager.create_share(folder, max_downloads=1, expire_at=None).token)
+    for token in fast_tokens:
+        _wait_until_ready(manager, token)
+
+    monkeypatch.setattr(archive, "scan_tree", blocking_scan_tree)
+    try:
+        slow_token = manager.create_share(
+            slow_dir, max_downloads=None, expire_at=None, archive_mode=ARCHIVE_MODE_CACHED
+        ).token
+
+        def slow_download():
+            try:
+                manager.validate_and_register_download(slow_token, "10.1.0.1")
+            except ArchivePreparing:
+                pass
+
+        slow = threading.Thread(target=slow_download)
+        slow.start()
+        assert scanning.wait(TIMEOUT)
+
+        # The slow share is stuck scanning; every other share is served meanwhile.
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [
+                pool.submit(manager.validate_and_register_download, token, f"10.2.0.{i}")
+                for i, token in enumerate(fast_tokens)
+            ]
+            results = [future.result(timeout=TIMEOUT) for future in futures]
+        assert all(result is not None for result in results)
+        assert slow.is_alive()
+    finally:
+        release.set()
+    slow.join(TIMEOUT)
+    assert not slow.is_alive()
@@ -0,0 +1,54 @@
+"""JSONStorage flushing and JournaledJSONStorage recovery."""
+
+import json
+import threading
+import time
+
+from server.storage import JournaledJSONStorage, JSONStorage
+
+
+def test_entry_after_torn_write_survives_replay(tmp_path):
+    path = str(tmp_path / "shares.json")
+    storage = JournaledJSONStorage(path)
+    storage.put("a", {"n": 1})
+    # A writer crashed half-way through its entry.
+    with open(f"{path}.journal", "ab") as fh:
+        fh.write(b'{"op":"put","key":"torn","rec')
+
+    storage = JournaledJSONStorage(path)
+    assert storage.read() == {"a": {"n": 1}}
+    storage.put("b", {"n": 2})
+
+    reloaded = JournaledJSONStorage(path)
+    assert reloaded.read() == {"a": {"n": 1}, "b": {"n": 2}}
+    with open(f"{path}.journal", "rb") as fh:
+        assert all(line.endswith(b"}") for line in fh.read().splitlines())
+
+
+def _flushers():
+    return sum(1 for thread in threading.enumerate() if thread.name == "storage-flush")
+
+
+def test_flush_interval_changes_reuse_one_thread(tmp_path):
+    before = _flushers()
+    storage = JSONStorage(str(tmp_path / "data.json"), {}, flush_interval=60)
+    for _ in range(50):
+        storage.set_flush_interval(0)
+        storage.set_flush_interval(60)
+    assert _flushers() == before + 1
+
+    # The flusher does not sleep out the old interval before using a new one.
+    storage.write({"n": 1})
+    storage.set_flush_interval(0.05)
+    deadline = time.monotonic() + 2
+    while json.loads((tmp_path / "data.json").read_text()) != {"n": 1}:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    storage.write({"n": 2})
+    storage.close()
+    assert json.loads((tmp_path / "data.json").read_text()) == {"n": 2}
+    deadline = time.monotonic() + 2
+    while _flushers() != before:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
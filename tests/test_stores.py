@@ -0,0 +1,47 @@
+"""Share and bookmark stores."""
+
+import pytest
+
+from server.share import ShareRecord
+from server.shared_state import SharedStateDB
+from server.stores import STORAGE_SCHEMA, BookmarkStore, JSONShareStore, ShareStore, SQLiteShareStore
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def share_store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteShareStore(SharedStateDB(str(tmp_path / "storage.db"), schema=STORAGE_SCHEMA))
+    else:
+        store = JSONShareStore(str(tmp_path / "shares.json"))
+    yield store
+    store.close()
+
+
+def test_incomplete_store_cannot_be_created():
+    class PartialShareStore(ShareStore):
+        def get(self, token):
+            return None
+
+    class PartialBookmarkStore(BookmarkStore):
+        def list(self):
+            return []
+
+    with pytest.raises(TypeError):
+        PartialShareStore()
+    with pytest.raises(TypeError):
+        PartialBookmarkStore()
+
+
+def test_share_expires_at_its_deadline(share_store):
+    for token in ("a", "b"):
+        share_store.insert(ShareRecord(
+            token=token, path="/x", is_directory=False, archive_name=None, created_at=0.0,
+            max_downloads=None, download_count=0, expire_at=100.0, allowed_ips=[],
+        ).to_dict())
+
+    assert share_store.register_download("a", 99.5, {})["download_count"] == 0
+    assert share_store.register_download("a", 100.0, {}) is None
+    assert share_store.get("a")["download_count"] == 1
+    assert share_store.pop_expired(99.5) == []
+    assert sorted(record["token"] for record in share_store.pop_expired(100.0)) == ["a", "b"]
+    assert share_store.list() == []
@@ -0,0 +1,176 @@
+"""Range handling in server.transfer and file responses."""
+
+import http.client
+import threading
+
+import pytest
+
+from server.app import FileShareRequestHandler
+from server.transfer import (
+    MAX_RANGES,
+    RangeNotSatisfiable,
+    continues_download,
+    http_date,
+    if_range_matches,
+    multipart_layout,
+    parse_range_header,
+)
+from server.workers import WorkerPoolHTTPServer
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", [(0, 99)]),
+        ("bytes=100-", [(100, 999)]),
+        ("bytes=900-5000", [(900, 999)]),
+        ("bytes=-100", [(900, 999)]),
+        ("bytes=-5000", [(0, 999)]),
+        ("BYTES = 10 - 19", [(10, 19)]),
+        ("bytes=500-599,0-99", [(0, 99), (500, 599)]),
+        # Overlapping and adjacent ranges are merged.
+        ("bytes=0-99,50-149", [(0, 149)]),
+        ("bytes=0-99,100-199", [(0, 199)]),
+        ("bytes=0-99,-950", [(0, 999)]),
+        # Unsatisfiable parts are dropped when others remain.
+        ("bytes=0-9,2000-3000", [(0, 9)]),
+    ],
+)
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    [None, "", "items=0-10", "bytes=", "bytes=abc", "bytes=10-5", "bytes=-", "bytes=0-10;x"],
+)
+def test_malformed_range_serves_full_body(header):
+    assert parse_range_header(header, 1000) is None
+
+
+def test_too_many_ranges_serve_full_body():
+    spec = ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(MAX_RANGES + 1))
+    assert parse_range_header(f"bytes={spec}", 10_000) is None
+    spec = ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(MAX_RANGES))
+    assert len(parse_range_header(f"bytes={spec}", 10_000)) == MAX_RANGES
+
+
+@pytest.mark.parametrize("header, size", [("bytes=1000-", 1000), ("bytes=-0", 1000), ("bytes=0-", 0)])
+def test_unsatisfiable_range(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(header, size)
+
+
+def test_if_range():
+    etag = '"1-3e8-5"'
+    last_modified = http_date(1_700_000_000)
+    assert if_range_matches(None, etag, last_modified)
+    assert if_range_matches(etag, etag, last_modified)
+    assert not if_range_matches('"other"', etag, last_modified)
+    # Weak validators never match for If-Range.
+    assert not if_range_matches(f"W/{etag}", etag, last_modified)
+    assert if_range_matches(last_modified, etag, last_modified)
+    assert not if_range_matches(http_date(1_700_000_001), etag, last_modified)
+    assert not if_range_matches("yesterday", etag, last_modified)
+
+
+def test_multipart_layout_length_matches_body():
+    data = bytes(range(256)) * 4
+    ranges = [(0, 9), (100, 199), (1000, 1023)]
+    parts, trailer, length = multipart_layout(ranges, len(data), "application/octet-stream", "BOUNDARY")
+
+    body = b"".join(header + data[start:end + 1] + b"\r\n" for header, start, end in parts) + trailer
+    assert len(body) == length
+    assert parts[1][0] == (
+        b"--BOUNDARY\r\nContent-Type: application/octet-stream\r\n"
+        b"Content-Range: bytes 100-199/1024\r\n\r\n"
+    )
+    assert trailer == b"--BOUNDARY--\r\n"
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=500-", True),
+        ("bytes=500-599,700-", True),
+        ("bytes=-100", True),
+        ("bytes=0-", False),
+        ("bytes=0-99,500-", False),
+        ("bytes=-1000", False),
+        ("bytes=2000-", False),
+        ("bytes=x", False),
+        (None, False),
+    ],
+)
+def test_continues_download(header, expected):
+    assert continues_download(header, 1000) is expected
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(DATA)
+
+    class Handler(FileShareRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            with open(path, "rb") as fh:
+                self._send_file(fh, "application/octet-stream", "data.bin")
+
+    httpd = WorkerPoolHTTPServer(("127.0.0.1", 0), Handler, workers=2)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[:2]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(address, headers):
+    conn = http.client.HTTPConnection(*address, timeout=5)
+    try:
+        conn.request("GET", "/", headers=headers)
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_single_range_response(file_server):
+    address = file_server
+    status, headers, body = _get(address, {"Range": "bytes=-24"})
+    assert status == 206
+    assert headers["Content-Range"] == "bytes 1000-1023/1024"
+    assert body == DATA[1000:]
+
+
+def test_unsatisfiable_range_response(file_server):
+    address = file_server
+    status, headers, body = _get(address, {"Range": "bytes=5000-"})
+    assert status == 416
+    assert headers["Content-Range"] == "bytes */1024"
+    assert body == b""
+
+
+def test_multipart_byteranges_response(file_server):
+    address = file_server
+    status, headers, body = _get(address, {"Range": "bytes=0-9,20-29,25-39"})
+    assert status == 206
+    content_type = headers["Content-Type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.split("boundary=")[1].encode()
+    assert int(headers["Content-Length"]) == len(body)
+    parts = body.split(b"--" + boundary)
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    payloads = [part.split(b"\r\n\r\n", 1) for part in parts[1:-1]]
+    assert [head.split(b"Content-Range: ")[1] for head, _ in payloads] == [b"bytes 0-9/1024", b"bytes 20-39/1024"]
+    assert [payload for _, payload in payloads] == [DATA[0:10] + b"\r\n", DATA[20:40] + b"\r\n"]
+
+
+def test_if_range_mismatch_sends_whole_file(file_server):
+    address = file_server
+    status, headers, body = _get(address, {"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert status == 200
+    assert body == DATA
+    status, _, body = _get(address, {"Range": "bytes=0-9", "If-Range": headers["ETag"]})
+    assert status == 206
+    assert body == DATA[:10]
@@ -0,0 +1,48 @@
+"""UsageService walks."""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from server.config import BASE_DIR
+from server.usage import UsageService
+
+
+@pytest.fixture
+def tree():
+    # Subdirectories are checked with validate_path_access, which blocks /tmp.
+    root = tempfile.mkdtemp(prefix="test-", dir=os.path.join(BASE_DIR, "data"))
+    for directory, count in (("docs", 2), ("docs/deep", 3), (".git/objects", 50)):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        for i in range(count):
+            with open(os.path.join(root, directory, f"f{i}"), "wb") as fh:
+                fh.write(b"x" * 10)
+    yield root
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def test_blocked_subdirectories_are_skipped(tree):
+    service = UsageService()
+    try:
+        status = service.usage(tree, wait=5)
+    finally:
+        service.close()
+    assert status.complete
+    assert (status.files, status.bytes, status.directories) == (5, 50, 2)
+
+
+def test_failing_visit_still_completes_the_walk(tree, monkeypatch):
+    service = UsageService()
+
+    def broken(path):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(service, "_directory", broken)
+    try:
+        status = service.usage(tree, wait=5)
+    finally:
+        service.close()
+    assert status.complete
+    assert tree not in service._walks
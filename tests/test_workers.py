@@ -0,0 +1,64 @@
+"""Worker pool of the threaded server."""
+
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+from server.app import FileShareRequestHandler
+from server.workers import WorkerPoolHTTPServer
+
+
+class _Handler(FileShareRequestHandler):
+    keepalive_timeout = 15
+
+    def do_GET(self) -> None:  # noqa: N802
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = WorkerPoolHTTPServer(("127.0.0.1", 0), _Handler, workers=1, max_pending=4)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(conn):
+    conn.request("GET", "/")
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def test_idle_keepalive_connection_yields_its_worker(server):
+    idle = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+    assert _get(idle) == (200, b"ok")
+    assert _get(idle) == (200, b"ok")  # still kept alive
+
+    # The only worker sits on the idle connection; a new client must not
+    # wait for its keep-alive timeout.
+    start = time.monotonic()
+    fresh = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+    assert _get(fresh) == (200, b"ok")
+    assert time.monotonic() - start < 2
+    fresh.close()
+    idle.close()
+
+
+def test_pipelined_requests_are_served(server):
+    with socket.create_connection(server.server_address[:2], timeout=5) as sock:
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\nGET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        response = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    assert response.count(b"HTTP/1.1 200") == 2